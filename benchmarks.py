@@ -0,0 +1,342 @@
+"""
+Offline benchmarks for the dashboard's data pipeline.
+
+    python benchmarks.py other-data --rows 1000000
+    python benchmarks.py bucketing --rows 1000000
+    python benchmarks.py pipeline --events events.parquet
+    python benchmarks.py hll --events events.parquet --precision 11
+    python benchmarks.py assemble --rows 100000 --metrics 6 12 24
+    python benchmarks.py latency --events events.parquet
+    python benchmarks.py percentiles --events events.parquet
+    python benchmarks.py presence --events events.parquet
+"""
+import argparse
+import json
+import random
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from event_frame import IdTable, compact_events, encode_ids, memory_report, parse_other_data
+from event_query import EVENTS_TABLE, build_events_query
+from event_source import LocalEventSource, QueryLog, ShardedFetcher
+from event_store import BQ_DATETIME_FORMAT, EventStore
+from metric_planner import build_rollups, plan_metrics, run_planned_metrics
+from presence import PresenceStore
+from processor import ASTRO_APP, STATUS_EVENTS, UniqueUsersProcessor, bucket_ids, combine_metrics, pair_latencies, get_15_minute_interval, interval_labels
+from rollups import GRAIN_MINUTES, HistogramRollup, coarse_keys
+from sketches import LATENCY_ACCURACY, LATENCY_QUANTILES, hll_error
+from sql_backend import METRIC_EVENTS, SQL_METRICS, run_sql_metrics
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<32} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def sample_other_data(rows, malformed_every=1000, seed=7):
+    rng = random.Random(seed)
+    items = []
+    for i in range(rows):
+        if malformed_every and i % malformed_every == malformed_every - 1:
+            items.append('{"astrologerId": "broken"')
+            continue
+        items.append(json.dumps({
+            'astrologerId': f"{rng.randrange(50):024x}",
+            'clientId': f"{rng.randrange(100000):024x}",
+            'chatSessionId': f"{rng.randrange(10 ** 6):024x}",
+            'waitingListId': f"{rng.randrange(10 ** 6):024x}",
+            'paid': rng.choice([0, 1, True, False]),
+            'isSilent': rng.choice([0, 1]),
+            'status': rng.choice(['ON', 'OFF']),
+            'amount': rng.choice([None, 99, 199.5]),
+            'screen': {'name': 'home', 'referrer': 'push'},
+        }))
+    return pd.DataFrame({'event_name': 'accept_chat', 'other_data': items})
+
+
+def legacy_other_data_loop(df):
+    # The original inline loop from one-astro-main.py
+    json_data = []
+    for item in df['other_data']:
+        try:
+            data = json.loads(item)
+            json_data.append(data)
+        except (json.JSONDecodeError, TypeError):
+            continue
+    json_df = pd.json_normalize(json_data)
+    return pd.concat([df, json_df], axis=1)
+
+
+def bench_other_data(args):
+    df = sample_other_data(args.rows)
+    print(f"{len(df)} rows, one malformed row per 1000")
+    legacy = timed('json.loads + json_normalize', legacy_other_data_loop, df)
+    parsed, failures = timed('parse_other_data', parse_other_data, df['other_data'])
+    print(f"failures counted: {failures}")
+    print(f"legacy frame: {len(legacy)} rows, {legacy.shape[1]} columns; parsed: {len(parsed)} rows, {parsed.shape[1]} columns")
+
+    # The legacy concat shifts every row after a malformed one onto the wrong event
+    expected = df['other_data'].str.slice(18, 42)
+    legacy_ok = (legacy['astrologerId'].iloc[:len(df)] == expected).sum()
+    parsed_ok = (parsed['astrologerId'] == expected).sum()
+    print(f"rows with the right astrologerId: legacy {legacy_ok}, parsed {parsed_ok}")
+
+
+def bench_bucketing(args):
+    rng = np.random.default_rng(7)
+    seconds = rng.integers(0, 3 * 24 * 3600, args.rows)
+    local_time = pd.Series(pd.Timestamp('2024-11-10') + pd.to_timedelta(np.sort(seconds), unit='s'))
+    print(f"{args.rows} timestamps over 3 days")
+    legacy = timed('apply(get_15_minute_interval)', local_time.apply, lambda x: get_15_minute_interval(x.hour, x.minute))
+    buckets = timed('bucket_ids', bucket_ids, local_time, 15)
+    labels = timed('interval_labels (all rows)', interval_labels, buckets, 15)
+    print(f"{buckets.nunique()} distinct buckets; labels match: {bool((labels == legacy).all())}")
+
+
+def bench_pipeline(args):
+    # The processor assigns into filtered slices all over; that is not what we're measuring here
+    warnings.simplefilter('ignore')
+    log = QueryLog()
+    source = LocalEventSource(args.events, log=log)
+    bounds = source.query_frame(f"SELECT MIN(event_time) AS lower, MAX(event_time) AS upper FROM {EVENTS_TABLE}")
+    lower = bounds['lower'].iloc[0].floor('h')
+    upper = bounds['upper'].iloc[0].floor('h') + pd.Timedelta(hours=1)
+    names = args.metrics or list(METRIC_EVENTS)
+    print(f"{args.events}: {lower} .. {upper} UTC, {len(names)} metrics")
+
+    def query_events(lower_str, upper_str):
+        return source.query_frame(build_events_query(METRIC_EVENTS, names, lower_str, upper_str), 'events')
+
+    store = EventStore(lower, upper)
+    events = timed('fetch (sharded, local)', store.refresh, lambda lo, hi: ShardedFetcher().fetch(query_events, lo, hi))
+    compact = timed('compact_events', compact_events, events)
+    print(memory_report(events, compact).to_string())
+    ids = IdTable()
+    events = timed('encode_ids', encode_ids, compact, ids)
+    print(f"{len(ids)} distinct ids")
+
+    processor = timed('processor setup (enrich, index)', UniqueUsersProcessor, events, pd.DataFrame(), ids)
+    # The percentile metrics only exist as rollups (and in SQL); the planned metrics below time them
+    method_names = [name for name in names if hasattr(UniqueUsersProcessor, name)]
+    durations = {}
+    started = time.perf_counter()
+    for name in method_names:
+        metric_started = time.perf_counter()
+        getattr(processor, name)()
+        durations[name] = time.perf_counter() - metric_started
+    print(f"{f'UniqueUsersProcessor ({len(method_names)} methods)':<32} {time.perf_counter() - started:8.3f}s")
+    for name, seconds in sorted(durations.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<44} {seconds:8.3f}s")
+
+    passes, fallback = plan_metrics(names)
+    rollups = timed(f"rollups ({len(passes)} passes)", build_rollups, processor, names)
+    print(f"rollup state: {state_size(rollups.rollups):.1f} MB")
+    for grain in GRAIN_MINUTES:
+        timed(f"  every rollup at grain {grain}", lambda: [rollups.frame(name, grain) for name in rollups.rollups])
+    timed(f"planned metrics (+{len(fallback)} methods)", run_planned_metrics, processor, names, SQL_METRICS, rollups)
+
+    sql_names = [name for name in names if name in SQL_METRICS]
+    timed('SQL backend (DuckDB)', run_sql_metrics, lambda query: source.query_frame(query, 'aggregates'), sql_names,
+          lower.strftime(BQ_DATETIME_FORMAT), upper.strftime(BQ_DATETIME_FORMAT))
+
+
+def state_size(rollups):
+    # MB of every distinct state; rollups shared by several names (or percentiles of one histogram state) are counted once
+    return sum(rollup.nbytes for rollup in {id(rollup.state): rollup for rollup in rollups.values()}.values()) / 1024 ** 2
+
+
+def bench_hll(args):
+    warnings.simplefilter('ignore')
+    names = [name for name in (args.metrics or list(METRIC_EVENTS)) if getattr(SQL_METRICS.get(name), 'agg', None) == 'nunique']
+    source = LocalEventSource(args.events)
+    events = compact_events(source.query_frame(build_events_query(METRIC_EVENTS, names, '1970-01-01', '9999-12-31'), 'events'))
+    processor = UniqueUsersProcessor(events, pd.DataFrame())
+    print(f"{args.events}: {len(events)} events, {len(names)} distinct-count metrics, "
+          f"precision {args.precision} (standard error {hll_error(args.precision):.2%})")
+    exact = timed('exact rollups', build_rollups, processor, names)
+    sketched = timed('HLL rollups', build_rollups, processor, names, SQL_METRICS, args.precision)
+
+    for label, store in [('exact', exact), ('HLL', sketched)]:
+        print(f"{label} state: {state_size(store.rollups):.1f} MB")
+
+    rows = []
+    for grain in GRAIN_MINUTES:
+        for name in names:
+            expected = exact.rollups[name].at(grain)
+            estimated = sketched.rollups[name].at(grain)
+            keys = [column for column in expected if column != 'value']
+            both = expected.merge(estimated, on=keys, how='outer', suffixes=('_exact', '_hll')).fillna(0)
+            counted = both[both['value_exact'] > 0]
+            error = (counted['value_hll'] - counted['value_exact']).abs() / counted['value_exact']
+            rows.append({'grain': grain, 'metric': name, 'groups': len(both), 'mean_exact': counted['value_exact'].mean(),
+                         'mean_rel_error': error.mean(), 'p99_rel_error': error.quantile(0.99), 'max_rel_error': error.max()})
+    report = pd.DataFrame(rows)
+    print(report.groupby('grain', sort=False)[['groups', 'mean_rel_error', 'p99_rel_error', 'max_rel_error']]
+          .agg({'groups': 'sum', 'mean_rel_error': 'mean', 'p99_rel_error': 'max', 'max_rel_error': 'max'}).to_string())
+    print(report.sort_values('mean_rel_error', ascending=False).head(args.top).to_string(index=False))
+
+
+def sample_metric_frames(count, rows, seed=7):
+    # Per-astrologer hourly frames like the page's, each missing some of the others' (_id, date, hour) rows
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        frame = pd.DataFrame({
+            '_id': pd.Series(rng.integers(0, 300, rows)).map('{:024x}'.format),
+            'date': pd.to_datetime(rng.integers(20000, 20030, rows), unit='D').date,
+            'hour': rng.integers(0, 24, rows),
+        }).drop_duplicates(ignore_index=True)
+        frame[f"metric_{i}"] = rng.integers(0, 100, len(frame))
+        frames.append(frame)
+    return frames
+
+
+def legacy_merge_chain(frames, keys):
+    # How the page used to build final_results / final_overall / fifteen_overall
+    combined = frames[0]
+    for frame in frames[1:]:
+        combined = pd.merge(combined, frame, on=keys, how='outer')
+    return combined
+
+
+def bench_assemble(args):
+    keys = ['_id', 'date', 'hour']
+    for count in args.metrics:
+        frames = sample_metric_frames(count, args.rows)
+        print(f"{count} metric frames of up to {args.rows} rows")
+        chained = timed('  chained outer merges', legacy_merge_chain, frames, keys)
+        combined = timed('  combine_metrics', combine_metrics, frames, keys)
+        pd.testing.assert_frame_equal(chained, combined)
+    print("results identical")
+
+
+def bench_latency(args):
+    warnings.simplefilter('ignore')
+    names = ['cancellation_time', 'overall_accept_time']
+    source = LocalEventSource(args.events)
+    events = compact_events(source.query_frame(build_events_query(METRIC_EVENTS, names, '1970-01-01', '9999-12-31'), 'events'))
+    processor = UniqueUsersProcessor(events, pd.DataFrame())
+    for start_event, end_event, on in [
+        ('chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId']),
+        ('chat_intake_submit', 'accept_chat', ['waitingListId']),
+    ]:
+        starts, ends = processor._events(start_event), processor._events(end_event)
+        print(f"{start_event} -> {end_event} on {on}: {len(starts)} starts, {len(ends)} ends")
+        # What cancellation_time / overall_accept_time used to do: every start joined with every end
+        crossed = timed('  cross merge', lambda: pd.merge(starts, ends, on=on, suffixes=('_start', '_end')))
+        pairs = timed('  pair_latencies (as-of)', pair_latencies, starts, ends, on)
+        print(f"  rows: cross {len(crossed)} ({crossed.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB), "
+              f"as-of {len(pairs)} ({pairs.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB)")
+
+
+def bench_percentiles(args):
+    warnings.simplefilter('ignore')
+    names = ['cancellation_time', 'overall_accept_time']
+    source = LocalEventSource(args.events)
+    events = compact_events(source.query_frame(build_events_query(METRIC_EVENTS, names, '1970-01-01', '9999-12-31'), 'events'))
+    processor = UniqueUsersProcessor(events, pd.DataFrame())
+    print(f"{args.events}: {len(events)} events, bins within {LATENCY_ACCURACY:.0%}")
+    for start_event, end_event, on, by in [
+        ('chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId'], 'astrologerId'),
+        ('chat_intake_submit', 'accept_chat', ['waitingListId'], None),
+    ]:
+        pairs = processor.latency_pairs(start_event, end_event, on)
+        histograms = timed(f"{start_event} -> {end_event}: histograms", HistogramRollup.from_events, by, pairs, pairs['latency'], 0.5)
+        print(f"  state: pairs {pairs.memory_usage(deep=True).sum() / 1024 ** 2:.2f} MB, "
+              f"histograms {histograms.nbytes / 1024 ** 2:.2f} MB ({len(histograms.state)} bins)")
+        for grain in GRAIN_MINUTES:
+            coarse, keys = coarse_keys(pairs, by, grain)
+            coarse['latency'] = pairs['latency']
+            errors = []
+            for quantile in LATENCY_QUANTILES:
+                # Nearest rank, as the histograms and SQL's discrete percentiles
+                exact = coarse.groupby(keys)['latency'].agg(lambda x: np.quantile(x.to_numpy(), quantile, method='inverted_cdf'))
+                estimated = histograms.with_quantile(quantile).at(grain)['value'].to_numpy()
+                errors.append(f"p{round(quantile * 100)} {np.max(np.abs(estimated - exact.to_numpy()) / exact.to_numpy()):.2%}")
+            print(f"  {grain:>4}: {len(exact)} groups, max relative error " + ', '.join(errors))
+
+
+def legacy_live_counts(events):
+    # What astros_live_1, multichat_enabled and chat_call_enabled each did: sort every status event, keep each user's latest
+    counts = []
+    for status_events in [STATUS_EVENTS, ['change_multichat_status'], ['change_chat_status', 'change_call_status']]:
+        latest = events[events['event_name'].isin(status_events) & (events['app_id'] == ASTRO_APP)]
+        latest = latest.sort_values(by=['user_id', 'event_time'], ascending=[True, False]).drop_duplicates(subset=['user_id'])
+        counts.append(int(((latest['status'] == 'ON') & (latest['isSilent'].fillna(0) == 0)).sum()))
+    return counts
+
+
+def presence_counts(presence):
+    return [presence.live_count(status_events) for status_events in [None, ['change_multichat_status'], ['change_chat_status', 'change_call_status']]]
+
+
+def bench_presence(args):
+    warnings.simplefilter('ignore')
+    names = ['astros_live_1', 'multichat_enabled', 'chat_call_enabled']
+    source = LocalEventSource(args.events)
+    events = compact_events(source.query_frame(build_events_query(METRIC_EVENTS, names, '1970-01-01', '9999-12-31'), 'events'))
+    # The tail a refresh refetches: the last few minutes, overlap included
+    tail = events[events['event_time'] >= events['event_time'].max() - pd.Timedelta(minutes=args.tail_minutes)]
+    print(f"{args.events}: {len(events)} status events, {len(tail)} in the last {args.tail_minutes} minutes")
+    expected = timed('three sorts (legacy)', legacy_live_counts, events)
+    presence = PresenceStore(STATUS_EVENTS, ASTRO_APP)
+    timed('PresenceStore first load', presence.update, events)
+    timed('PresenceStore tail update', presence.update, tail)
+    counts = timed('PresenceStore reads', presence_counts, presence)
+    print(f"  {len(presence.state)} state rows; counts {counts} (legacy {expected})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    other_data = subparsers.add_parser('other-data', help='other_data JSON parsing: legacy loop vs parse_other_data')
+    other_data.add_argument('--rows', type=int, default=1_000_000)
+    other_data.set_defaults(func=bench_other_data)
+
+    bucketing = subparsers.add_parser('bucketing', help='15-minute intervals: row-wise apply vs bucket_ids')
+    bucketing.add_argument('--rows', type=int, default=1_000_000)
+    bucketing.set_defaults(func=bench_bucketing)
+
+    pipeline = subparsers.add_parser('pipeline', help='fetch + UniqueUsersProcessor + SQL backend over a local events file')
+    pipeline.add_argument('--events', required=True, help='Parquet or JSONL file (or glob) shaped like the events table')
+    pipeline.add_argument('--metrics', nargs='*', help='metric names (default: every METRIC_EVENTS entry)')
+    pipeline.add_argument('--top', type=int, default=10, help='how many of the slowest metrics to list')
+    pipeline.set_defaults(func=bench_pipeline)
+
+    hll = subparsers.add_parser('hll', help='distinct-count rollups: exact sets vs HyperLogLog sketches')
+    hll.add_argument('--events', required=True, help='Parquet or JSONL file (or glob) shaped like the events table')
+    hll.add_argument('--precision', type=int, default=11, help='register index bits (2 ** precision registers)')
+    hll.add_argument('--metrics', nargs='*', help='metric names (default: every distinct-count SQL_METRICS entry)')
+    hll.add_argument('--top', type=int, default=10, help='how many of the least accurate metrics to list')
+    hll.set_defaults(func=bench_hll)
+
+    assemble = subparsers.add_parser('assemble', help='wide metric tables: chained outer merges vs combine_metrics')
+    assemble.add_argument('--rows', type=int, default=100_000, help='rows per metric frame')
+    assemble.add_argument('--metrics', type=int, nargs='*', default=[6, 12, 24], help='numbers of metric frames to combine')
+    assemble.set_defaults(func=bench_assemble)
+
+    latency = subparsers.add_parser('latency', help='start/end latency pairing: cross merge vs pair_latencies')
+    latency.add_argument('--events', required=True, help='Parquet or JSONL file (or glob) shaped like the events table')
+    latency.set_defaults(func=bench_latency)
+
+    percentiles = subparsers.add_parser('percentiles', help='latency percentiles: histogram rollups vs exact per group')
+    percentiles.add_argument('--events', required=True, help='Parquet or JSONL file (or glob) shaped like the events table')
+    percentiles.set_defaults(func=bench_percentiles)
+
+    presence = subparsers.add_parser('presence', help='live status cards: three sorts vs an incremental PresenceStore')
+    presence.add_argument('--events', required=True, help='Parquet or JSONL file (or glob) shaped like the events table')
+    presence.add_argument('--tail-minutes', type=int, default=5, help='minutes of events in one refresh')
+    presence.set_defaults(func=bench_presence)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
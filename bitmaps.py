@@ -0,0 +1,154 @@
+import numpy as np
+
+
+# Roaring layout: an id splits into a 16-bit container number and its 16 low bits. A container holding
+# up to ARRAY_MAX ids is a sorted array of their low bits (2 bytes an id); a fuller one is a 65536-bit bitset (8 KB).
+ARRAY_MAX = 4096
+WORDS = 1024
+
+
+def _bits(low):
+    # (word, bit mask) of each low value in a bitset container
+    return low.astype(np.int64) >> 6, np.left_shift(np.uint64(1), (low & 63).astype(np.uint64))
+
+
+# Set bits of every byte value, for numpy before 2.0 (which has no np.bitwise_count)
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _popcount(words):
+    # Set bits in each row of a uint64 word array
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return _BYTE_POPCOUNT[np.ascontiguousarray(words).view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+def _sorted_unique(keys):
+    # np.unique without its hashing pass: for int64 keys a sort and a neighbour compare is faster
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+
+
+def _runs(sorted_keys):
+    # (distinct keys, run lengths) of a sorted array
+    if len(sorted_keys) == 0:
+        return sorted_keys, np.empty(0, np.int64)
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return sorted_keys[starts], np.diff(np.r_[starts, len(sorted_keys)])
+
+
+class Bitmaps:
+    """
+    A column of roaring-style compressed bitmaps of non-negative int32 ids (see
+    event_frame.IdTable), one per group 0..num_groups-1, held as flat arrays so
+    every operation is vectorized over all groups at once. Containers are keyed
+    by (group << 16 | container number) and kept sorted by key.
+
+    Cardinality is the array containers' sizes plus a popcount of the bitset
+    words; union is a sorted merge of array entries and an OR of bitsets.
+    """
+
+    def __init__(self, num_groups, array_keys, array_sizes, low, bitset_keys, words):
+        self.num_groups = num_groups
+        self.array_keys = array_keys
+        self.array_sizes = array_sizes
+        # Low bits of every array container's ids, container after container
+        self.low = low
+        self.bitset_keys = bitset_keys
+        self.words = words
+
+    @classmethod
+    def from_ids(cls, groups, ids, num_groups):
+        """
+        Bitmaps where group g holds every ids[i] with groups[i] == g.
+        """
+        entries = _sorted_unique((np.asarray(groups, dtype=np.int64) << 32) | np.asarray(ids, dtype=np.int64))
+        return cls._build(num_groups, entries, np.empty(0, np.int64), np.empty((0, WORDS), np.uint64))
+
+    @classmethod
+    def _build(cls, num_groups, entries, bitset_keys, words):
+        # entries: sorted, distinct (container key << 16 | low) of the array containers. Entries
+        # of a container that has a bitset are folded into it, and array containers grown past
+        # ARRAY_MAX become bitsets.
+        container_keys = entries >> 16
+        if len(bitset_keys) and len(entries):
+            position = np.minimum(np.searchsorted(bitset_keys, container_keys), len(bitset_keys) - 1)
+            folded = bitset_keys[position] == container_keys
+            if folded.any():
+                word, mask = _bits(entries[folded] & 0xFFFF)
+                np.bitwise_or.at(words, (position[folded], word), mask)
+                entries, container_keys = entries[~folded], container_keys[~folded]
+
+        array_keys, array_sizes = _runs(container_keys)
+        full = array_sizes > ARRAY_MAX
+        if full.any():
+            in_full = np.repeat(full, array_sizes)
+            slot = np.repeat(np.arange(full.sum()), array_sizes[full])
+            new_words = np.zeros((full.sum(), WORDS), np.uint64)
+            word, mask = _bits(entries[in_full] & 0xFFFF)
+            np.bitwise_or.at(new_words, (slot, word), mask)
+            bitset_keys = np.concatenate([bitset_keys, array_keys[full]])
+            order = np.argsort(bitset_keys, kind='stable')
+            bitset_keys, words = bitset_keys[order], np.concatenate([words, new_words])[order]
+            entries, array_keys, array_sizes = entries[~in_full], array_keys[~full], array_sizes[~full]
+        return cls(num_groups, array_keys, array_sizes.astype(np.int32), (entries & 0xFFFF).astype(np.uint16),
+                   bitset_keys, words)
+
+    def _entries(self):
+        return (np.repeat(self.array_keys, self.array_sizes) << 16) | self.low.astype(np.int64)
+
+    def cardinality(self):
+        """
+        Number of ids in every group's bitmap, as an int64 array of num_groups.
+        """
+        counts = np.bincount(self.array_keys >> 16, weights=self.array_sizes, minlength=self.num_groups)
+        if len(self.bitset_keys):
+            popcount = _popcount(self.words)
+            counts = counts + np.bincount(self.bitset_keys >> 16, weights=popcount, minlength=self.num_groups)
+        return counts.astype(np.int64)
+
+    def union(self, groups, num_groups):
+        """
+        Bitmaps of num_groups groups, where group g is the union (OR) of every
+        bitmap i with groups[i] == g.
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        entries = self._entries()
+        entries = _sorted_unique((groups[entries >> 32] << 32) | (entries & 0xFFFFFFFF))
+        bitset_keys, slot = np.unique((groups[self.bitset_keys >> 16] << 16) | (self.bitset_keys & 0xFFFF),
+                                      return_inverse=True)
+        words = np.zeros((len(bitset_keys), WORDS), np.uint64)
+        np.bitwise_or.at(words, slot, self.words)
+        return self._build(num_groups, entries, bitset_keys, words)
+
+    def take(self, positions):
+        """
+        Bitmaps of the groups at `positions` (distinct, increasing), renumbered 0..len(positions)-1.
+        """
+        mapping = np.full(self.num_groups, -1, np.int64)
+        mapping[np.asarray(positions, dtype=np.int64)] = np.arange(len(positions))
+        array_groups = mapping[self.array_keys >> 16]
+        keep = array_groups >= 0
+        low = self.low[np.repeat(keep, self.array_sizes)]
+        bitset_groups = mapping[self.bitset_keys >> 16]
+        kept = bitset_groups >= 0
+        return Bitmaps(len(positions), (array_groups[keep] << 16) | (self.array_keys[keep] & 0xFFFF),
+                       self.array_sizes[keep], low, (bitset_groups[kept] << 16) | (self.bitset_keys[kept] & 0xFFFF),
+                       self.words[kept])
+
+    @classmethod
+    def concat(cls, parts):
+        """
+        One Bitmaps of every group of `parts`, numbered in order.
+        """
+        offset = 0
+        columns = []
+        for part in parts:
+            columns.append((part.array_keys + (offset << 16), part.array_sizes, part.low,
+                            part.bitset_keys + (offset << 16), part.words))
+            offset += part.num_groups
+        return cls(offset, *(np.concatenate(column) for column in zip(*columns)))
+
+    @property
+    def nbytes(self):
+        return self.array_keys.nbytes + self.array_sizes.nbytes + self.low.nbytes + self.bitset_keys.nbytes + self.words.nbytes
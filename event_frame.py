@@ -0,0 +1,163 @@
+import json
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from event_query import OTHER_DATA_FIELDS
+
+# other_data is still decoded one row at a time; orjson (in requirements.txt) makes each decode several times
+# faster than the stdlib's
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # the stdlib decoder gives the same result, just slower
+    _loads = json.loads
+
+
+def _typed_column(values, kind, index):
+    if kind == 'STRING':
+        return pd.Series([None if value is None else str(value) for value in values], index=index, dtype=object)
+    if kind == 'flag':
+        values = [int(value) if isinstance(value, bool) else value for value in values]
+    return pd.to_numeric(pd.Series(values, index=index, dtype=object), errors='coerce')
+
+
+def parse_other_data(other_data, fields=OTHER_DATA_FIELDS):
+    """
+    Decode a Series of other_data JSON strings into one typed column per key in
+    `fields` (see OTHER_DATA_FIELDS); every other key is ignored. The result keeps
+    other_data's index, so a row that fails to parse becomes a row of NaNs instead
+    of shifting every later row. Returns (frame, number of rows that failed to parse).
+    """
+    decoded = []
+    failures = 0
+    for item in other_data.to_numpy():
+        if item is None or item != item:
+            decoded.append({})
+            continue
+        try:
+            data = _loads(item)
+        except (ValueError, TypeError):
+            data = None
+        if not isinstance(data, dict):
+            failures += 1
+            data = {}
+        decoded.append(data)
+
+    columns = {}
+    for key, kind in fields.items():
+        columns[key] = _typed_column([data.get(key) for data in decoded], kind, other_data.index)
+    return pd.DataFrame(columns, index=other_data.index), failures
+
+
+# Columns with a handful of distinct values, compared against literals all over the processor
+CATEGORY_COLUMNS = ('event_name', 'app_id', 'status')
+ID_COLUMNS = ('user_id', 'device_id') + tuple(
+    key for key, kind in OTHER_DATA_FIELDS.items() if kind == 'STRING' and key not in CATEGORY_COLUMNS
+)
+FLAG_COLUMNS = tuple(key for key, kind in OTHER_DATA_FIELDS.items() if kind == 'flag')
+
+
+def _compact_flag(values):
+    values = pd.to_numeric(values, errors='coerce')
+    fits = values.isna() | ((values % 1 == 0) & values.between(-128, 127))
+    # Anything that isn't a small integer is kept as it is rather than silently changed
+    return values.astype('Int8') if fits.all() else values
+
+
+def compact_events(df):
+    """
+    Store the event frame in compact dtypes: CATEGORY_COLUMNS as categoricals (so
+    event_name == 'accept_chat' compares integer codes), ids as Arrow-backed
+    strings, flags as nullable Int8 and amount as float64.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORY_COLUMNS:
+            values = values.astype('category')
+        elif column in ID_COLUMNS:
+            values = values.astype('string[pyarrow]')
+        elif column in FLAG_COLUMNS:
+            values = _compact_flag(values)
+        elif column == 'amount':
+            values = pd.to_numeric(values, errors='coerce')
+        columns[column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+class IdTable:
+    """
+    Interning table for ids: every distinct id string gets a dense int32 code, in
+    order of first sight, and keeps it for the table's lifetime. One table is
+    shared by every ID_COLUMNS column, so user_id and clientId codes compare
+    directly. Missing ids are -1.
+    """
+
+    def __init__(self):
+        self.index = pd.Index([], dtype=object)
+
+    def __len__(self):
+        return len(self.index)
+
+    def encode(self, values):
+        # Hash every row once; only the distinct values are looked up in (and added to) the table
+        row_codes, uniques = pd.factorize(values)
+        uniques = pd.Index(np.asarray(uniques, dtype=object))
+        codes = self.index.get_indexer(uniques)
+        new = codes < 0
+        if new.any():
+            codes[new] = np.arange(len(self.index), len(self.index) + new.sum())
+            self.index = self.index.append(uniques[new])
+        # Indexed only where present: if every value is missing there are no codes to index at all
+        result = np.full(len(row_codes), -1, dtype=np.int32)
+        present = row_codes >= 0
+        result[present] = codes[row_codes[present]]
+        return result
+
+
+def code_column(column):
+    return f"{column}_code"
+
+
+def encode_ids(df, ids):
+    """
+    df with an int32 code_column (IdTable code) next to every ID_COLUMNS column
+    that doesn't have one yet.
+    """
+    codes = {
+        code_column(column): ids.encode(df[column])
+        for column in ID_COLUMNS if column in df and code_column(column) not in df
+    }
+    return df.assign(**codes) if codes else df
+
+
+def concat_events(frames):
+    """
+    pd.concat for compacted frames. pandas turns a categorical column back into
+    object when the frames' categories differ, so the categories are unioned first.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    for column in CATEGORY_COLUMNS:
+        parts = [frame[column] for frame in frames if column in frame]
+        if not any(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            continue
+        dtype = pd.CategoricalDtype(union_categoricals([part.astype('category') for part in parts]).categories)
+        frames = [frame.assign(**{column: frame[column].astype(dtype)}) if column in frame else frame for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_report(before, after):
+    """
+    memory_usage(deep=True) per column of the same frame before and after compact_events, in MB.
+    """
+    report = pd.DataFrame({
+        'before_mb': before.memory_usage(deep=True, index=False),
+        'after_mb': after.memory_usage(deep=True, index=False),
+    }) / 1024 ** 2
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['before_mb'] / report['after_mb']
+    return report.round(2)
@@ -0,0 +1,145 @@
+from collections import namedtuple
+
+
+EVENTS_TABLE = '`oneastro-prod.custom_event_tracking.events`'
+APP_IDS = ('com.oneastro', 'com.oneastrologer')
+
+# Columns of the events table, in the order we select them. Any other field a
+# metric reads lives inside the other_data JSON.
+EVENT_COLUMNS = ('user_id', 'device_id', 'other_data', 'event_time', 'event_name', 'app_id')
+ALWAYS_SELECTED = ('event_time', 'event_name')
+
+# One slice of the events table a metric reads.
+# events / app_ids of None mean "any"; fields are the columns or other_data keys it touches.
+EventNeed = namedtuple('EventNeed', ['events', 'app_ids', 'fields'])
+
+# SQL type of each other_data key the metrics read. Flags show up as 0/1 or true/false.
+OTHER_DATA_FIELDS = {
+    'astrologerId': 'STRING',
+    'clientId': 'STRING',
+    'chatSessionId': 'STRING',
+    'waitingListId': 'STRING',
+    'orderId': 'STRING',
+    'status': 'STRING',
+    'paid': 'flag',
+    'isSilent': 'flag',
+    'amount': 'FLOAT64',
+}
+
+
+def required_needs(catalog, metrics):
+    """
+    Collect the EventNeeds of every metric in `metrics`. An unknown metric raises
+    KeyError so a new metric can't silently be computed on data we never fetched.
+    """
+    needs = []
+    for metric in metrics:
+        needs.extend(catalog[metric])
+    return needs
+
+
+def required_fields(needs):
+    fields = set(ALWAYS_SELECTED)
+    for need in needs:
+        fields.update(need.fields)
+    return fields
+
+
+def select_list(needs, extract_json=True):
+    """
+    SELECT expressions for the fields `needs` read. With extract_json the other_data
+    keys are pulled out and cast in SQL, so the JSON blob itself never leaves
+    BigQuery; otherwise other_data is shipped whole for the client to parse.
+    """
+    fields = required_fields(needs)
+    json_keys = sorted(fields - set(EVENT_COLUMNS))
+    if json_keys and not extract_json:
+        fields.add('other_data')
+    columns = [column for column in EVENT_COLUMNS if column in fields]
+    if extract_json:
+        columns += [f"{other_data_sql(key)} AS {key}" for key in json_keys]
+    return columns
+
+
+def other_data_sql(key):
+    """
+    SQL expression pulling `key` out of the other_data JSON, cast to its OTHER_DATA_FIELDS type.
+    """
+    value = f"JSON_VALUE(other_data, '$.{key}')"
+    kind = OTHER_DATA_FIELDS.get(key, 'STRING')
+    if kind == 'STRING':
+        return value
+    if kind == 'flag':
+        return (
+            f"CASE LOWER({value}) WHEN 'true' THEN 1 WHEN 'false' THEN 0 "
+            f"ELSE SAFE_CAST(SAFE_CAST({value} AS FLOAT64) AS INT64) END"
+        )
+    return f"SAFE_CAST({value} AS {kind})"
+
+
+def _sql_list(values):
+    return ', '.join(f"'{value}'" for value in sorted(values))
+
+
+def _event_predicate(needs, app_ids):
+    """
+    OR together the (event_name, app_id) slices the metrics need, restricted to app_ids.
+    Returns None when some metric needs every event of every app in scope.
+    """
+    scope = set(app_ids)
+    events_by_apps = {}
+    for need in needs:
+        apps = scope if need.app_ids is None else scope & set(need.app_ids)
+        if not apps:
+            continue
+        key = frozenset(apps)
+        if need.events is None:
+            events_by_apps[key] = None
+        elif key not in events_by_apps:
+            events_by_apps[key] = set(need.events)
+        elif events_by_apps[key] is not None:
+            events_by_apps[key].update(need.events)
+
+    if events_by_apps.get(frozenset(scope), 0) is None:
+        return None
+
+    clauses = []
+    for apps, events in sorted(events_by_apps.items(), key=lambda item: sorted(item[0])):
+        parts = []
+        if apps != scope:
+            parts.append(f"app_id IN ({_sql_list(apps)})")
+        if events is not None:
+            parts.append(f"event_name IN ({_sql_list(events)})")
+        clauses.append(' AND '.join(parts))
+    if not clauses:
+        return 'FALSE'
+    return ' OR '.join(f"({clause})" for clause in clauses)
+
+
+def events_conditions(needs, lower_str, upper_str, app_ids=APP_IDS):
+    """
+    WHERE conditions (to be ANDed) selecting the events `needs` read, for lower <= event_time < upper.
+    """
+    conditions = [
+        f"app_id IN ({_sql_list(app_ids)})",
+        f"event_time >= DATETIME('{lower_str}')",
+        f"event_time < DATETIME('{upper_str}')",
+    ]
+    predicate = _event_predicate(needs, app_ids)
+    if predicate is not None:
+        conditions.append(f"({predicate})")
+    return conditions
+
+
+def build_events_query(catalog, metrics, lower_str, upper_str, app_ids=APP_IDS, extract_json=True):
+    """
+    SELECT only the columns and events that `metrics` read, for lower <= event_time < upper.
+    """
+    needs = required_needs(catalog, metrics)
+    columns = ',\n  '.join(select_list(needs, extract_json))
+    conditions = '\nAND '.join(events_conditions(needs, lower_str, upper_str, app_ids))
+    return f"""
+SELECT {columns}
+FROM {EVENTS_TABLE}
+WHERE {conditions}
+"""
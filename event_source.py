@@ -0,0 +1,352 @@
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow as pa
+from google.cloud import bigquery
+
+from event_store import BQ_DATETIME_FORMAT
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # Storage Read API is optional; without it to_arrow pages over the REST API
+    bigquery_storage = None
+
+try:
+    import duckdb
+except ImportError:  # only needed by LocalEventSource
+    duckdb = None
+
+
+# Job statistics of one query we ran. wall_seconds covers the query and the result download.
+QueryStats = namedtuple('QueryStats', ['label', 'bytes_processed', 'bytes_billed', 'slot_ms', 'cache_hit', 'wall_seconds', 'rows'])
+
+
+class QueryLog:
+    """
+    The last `keep` queries the app ran with their job statistics. Safe to record
+    into from the sharded fetch's worker threads.
+    """
+
+    def __init__(self, keep=500):
+        self.records = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def append(self, stats):
+        with self._lock:
+            self.records.append(stats)
+        return stats
+
+    def record(self, label, job, wall_seconds, rows):
+        return self.append(QueryStats(
+            label, job.total_bytes_processed or 0, job.total_bytes_billed or 0, job.slot_millis or 0,
+            bool(job.cache_hit), wall_seconds, rows,
+        ))
+
+    def to_frame(self):
+        with self._lock:
+            return pd.DataFrame(list(self.records), columns=QueryStats._fields)
+
+
+def format_bytes(num_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.2f} TB"
+
+
+def dry_run_bytes(client, query):
+    """
+    Bytes BigQuery would process for `query`, from a free dry run.
+    """
+    config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return client.query(query, job_config=config).total_bytes_processed or 0
+
+
+def make_bqstorage_client(credentials):
+    if bigquery_storage is None:
+        return None
+    return bigquery_storage.BigQueryReadClient(credentials=credentials)
+
+
+def query_to_ipc(client, query, bqstorage_client=None, job_config=None, log=None, label='query'):
+    """
+    Run `query` and stream its result, one Arrow record batch at a time, into an
+    Arrow IPC stream. The bytes are what we cache: st.cache_data pickles them as
+    a single blob instead of hashing millions of row dicts.
+    """
+    started = time.perf_counter()
+    job = client.query(query, job_config=job_config)
+    rows = job.result()
+    sink = pa.BufferOutputStream()
+    writer = None
+    num_rows = 0
+    for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        num_rows += batch.num_rows
+    if log is not None:
+        log.record(label, job, time.perf_counter() - started, num_rows)
+    if writer is None:
+        return b''
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def ipc_to_frame(payload):
+    """
+    Turn an IPC payload from query_to_ipc back into a DataFrame, column by column.
+    """
+    if not payload:
+        return pd.DataFrame()
+    table = pa.ipc.open_stream(payload).read_all()
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+class ShardedFetcher:
+    """
+    Splits a [lower, upper) range into time shards, fetches them concurrently on a
+    bounded thread pool and concatenates the results in time order.
+
+    The shard width adapts to the traffic: after each multi-shard fetch it is
+    resized so a shard holds about target_rows events, within [min_shard, max_shard].
+    """
+
+    def __init__(self, max_workers=8, target_rows=250_000, shard=timedelta(hours=6),
+                 min_shard=timedelta(hours=1), max_shard=timedelta(days=1)):
+        self.max_workers = max_workers
+        self.target_rows = target_rows
+        self.shard = shard
+        self.min_shard = min_shard
+        self.max_shard = max_shard
+
+    def shards(self, lower, upper, now):
+        """
+        Shard bounds covering [lower, upper). Nothing has happened after `now` yet, so
+        the last shard simply stretches from the one covering `now` to `upper`.
+        """
+        bounds = []
+        while lower < min(upper, now):
+            bounds.append((lower, min(lower + self.shard, upper)))
+            lower += self.shard
+        if not bounds:
+            return [(lower, upper)]
+        bounds[-1] = (bounds[-1][0], upper)
+        return bounds
+
+    def _adapt(self, rows, span):
+        if span < self.min_shard:
+            return
+        hours = span / timedelta(hours=1)
+        if rows == 0:
+            self.shard = self.max_shard
+            return
+        shard_hours = round(self.target_rows / (rows / hours))
+        self.shard = min(max(timedelta(hours=shard_hours), self.min_shard), self.max_shard)
+
+    def fetch(self, fetch, lower_str, upper_str):
+        """
+        fetch(lower_str, upper_str) -> DataFrame runs on worker threads, so it must
+        not touch Streamlit.
+        """
+        lower, upper = pd.Timestamp(lower_str), pd.Timestamp(upper_str)
+        now = pd.Timestamp.now(tz='UTC').tz_localize(None)
+        bounds = self.shards(lower, upper, now)
+        if len(bounds) <= 1:
+            frames = [fetch(lower_str, upper_str)]
+        else:
+            def fetch_shard(shard):
+                return fetch(shard[0].strftime(BQ_DATETIME_FORMAT), shard[1].strftime(BQ_DATETIME_FORMAT))
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(bounds))) as pool:
+                frames = list(pool.map(fetch_shard, bounds))
+        self._adapt(sum(len(frame) for frame in frames), min(upper, now) - lower)
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+class EventSource(ABC):
+    """
+    Where the dashboard's queries run. Queries are always written in BigQuery SQL
+    and come back as Arrow IPC bytes (cacheable) or DataFrames.
+    """
+
+    @abstractmethod
+    def query_ipc(self, query, label='query'):
+        """
+        The result of `query` as Arrow IPC stream bytes.
+        """
+
+    def query_frame(self, query, label='query'):
+        return ipc_to_frame(self.query_ipc(query, label))
+
+    @abstractmethod
+    def dry_run_bytes(self, query):
+        """
+        Bytes `query` would scan, without running it.
+        """
+
+
+class BigQueryEventSource(EventSource):
+    """
+    The production source. fetch_mode "rows" keeps the old dict-per-row download
+    for query_frame; "arrow" streams record batches.
+    """
+
+    def __init__(self, client, bqstorage_client=None, job_config=None, log=None, fetch_mode='arrow'):
+        self.client = client
+        self.bqstorage_client = bqstorage_client
+        self.job_config = job_config
+        self.log = log
+        self.fetch_mode = fetch_mode
+
+    def query_ipc(self, query, label='query'):
+        return query_to_ipc(self.client, query, self.bqstorage_client, self.job_config, self.log, label)
+
+    def query_frame(self, query, label='query'):
+        if self.fetch_mode == 'arrow':
+            return super().query_frame(query, label)
+        started = time.perf_counter()
+        query_job = self.client.query(query, job_config=self.job_config)
+        rows = [dict(row) for row in query_job.result()]
+        if self.log is not None:
+            self.log.record(label, query_job, time.perf_counter() - started, len(rows))
+        return pd.DataFrame(rows)
+
+    def dry_run_bytes(self, query):
+        return dry_run_bytes(self.client, query)
+
+
+# A quoted string literal, backslash escapes included
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+
+
+def _search_code(pattern, sql, pos):
+    """
+    The first match of `pattern` in `sql` at or after `pos` (itself outside any
+    string literal) that does not lie inside a string literal.
+    """
+    while True:
+        match = pattern.search(sql, pos)
+        literal = _STRING_LITERAL.search(sql, pos)
+        if match is None or literal is None or match.start() < literal.start():
+            return match
+        pos = literal.end()
+
+
+def _sub_code(pattern, repl, sql):
+    """
+    re.sub over the parts of `sql` outside string literals.
+    """
+    parts = re.split(f"({_STRING_LITERAL.pattern})", sql)
+    return ''.join(part if index % 2 else re.sub(pattern, repl, part) for index, part in enumerate(parts))
+
+
+def _rewrite_calls(sql, name, rewrite):
+    """
+    Replace every NAME(arg, ...) call in `sql` with rewrite(arg, ...), respecting
+    nested parentheses and quoted strings.
+    """
+    pattern = re.compile(rf"\b{name}\(")
+    out = []
+    pos = 0
+    match = _search_code(pattern, sql, pos)
+    while match:
+        args = []
+        depth = 1
+        in_string = False
+        arg_start = i = match.end()
+        while depth:
+            char = sql[i]
+            if in_string:
+                if char == '\\':
+                    i += 1
+                else:
+                    in_string = char != "'"
+            elif char == "'":
+                in_string = True
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char == ',' and depth == 1:
+                args.append(sql[arg_start:i])
+                arg_start = i + 1
+            i += 1
+        args.append(sql[arg_start:i - 1])
+        out.append(sql[pos:match.start()])
+        out.append(rewrite(*[_rewrite_calls(arg.strip(), name, rewrite) for arg in args]))
+        pos = i
+        match = _search_code(pattern, sql, pos)
+    out.append(sql[pos:])
+    return ''.join(out)
+
+
+def bigquery_to_duckdb(sql, table='bq_events'):
+    """
+    Translate the BigQuery SQL this app generates (event_query, sql_backend) to
+    DuckDB. Not a general translator: it covers exactly the functions we emit,
+    and leaves string literals alone.
+    """
+    sql = _sub_code(r"`[^`]+`", table, sql)
+    sql = _rewrite_calls(sql, 'DATETIME_ADD', lambda value, interval: f"({value} + {interval})")
+    sql = _rewrite_calls(sql, 'DATETIME_DIFF', lambda end, start, part: f"date_diff('{part.lower()}', {start}, {end})")
+    sql = _rewrite_calls(sql, 'DATETIME', lambda value: f"CAST({value} AS TIMESTAMP)")
+    sql = _rewrite_calls(sql, 'DATE', lambda value: f"CAST({value} AS DATE)")
+    sql = _rewrite_calls(sql, 'DIV', lambda left, right: f"({left} // {right})")
+    sql = _rewrite_calls(
+        sql, 'JSON_VALUE', lambda value, path: f"json_extract_string(TRY_CAST({value} AS JSON), {path})"
+    )
+    sql = _sub_code(r"\bSAFE_CAST\(", "TRY_CAST(", sql)
+    sql = _sub_code(
+        r"\bAPPROX_QUANTILES\((\w+), (\d+)\)\[OFFSET\((\d+)\)\]",
+        lambda match: f"quantile_disc({match.group(1)}, {int(match.group(3)) / int(match.group(2))})", sql,
+    )
+    for bigquery_type, duckdb_type in [('FLOAT64', 'DOUBLE'), ('INT64', 'BIGINT'), ('STRING', 'VARCHAR')]:
+        sql = _sub_code(rf"\bAS {bigquery_type}\b", f"AS {duckdb_type}", sql)
+    return sql
+
+
+class LocalEventSource(EventSource):
+    """
+    Runs the same BigQuery-dialect queries with DuckDB over local Parquet or JSONL
+    files shaped like the events table (user_id, device_id, other_data, event_time,
+    event_name, app_id), so the whole pipeline can be profiled offline.
+    `path` may be a glob, e.g. "data/events-*.parquet".
+    """
+
+    def __init__(self, path, log=None):
+        if duckdb is None:
+            raise ImportError("LocalEventSource needs the duckdb package")
+        self.log = log
+        reader = 'read_parquet' if path.endswith('.parquet') else 'read_json_auto'
+        self._connection = duckdb.connect()
+        self._connection.execute(
+            f"CREATE VIEW bq_events AS SELECT * REPLACE (CAST(event_time AS TIMESTAMP) AS event_time) "
+            f"FROM {reader}('{path}')"
+        )
+
+    def query_ipc(self, query, label='query'):
+        started = time.perf_counter()
+        # A cursor is a separate connection to the same database, so worker threads don't share one
+        table = self._connection.cursor().execute(bigquery_to_duckdb(query)).fetch_arrow_table()
+        if self.log is not None:
+            self.log.append(QueryStats(label, 0, 0, 0, False, time.perf_counter() - started, table.num_rows))
+        if table.num_rows == 0:
+            return b''
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def dry_run_bytes(self, query):
+        return 0
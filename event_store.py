@@ -0,0 +1,195 @@
+import os
+import threading
+from datetime import timedelta
+
+import pandas as pd
+
+from event_frame import concat_events, encode_ids
+
+
+BQ_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+IST_OFFSET = timedelta(hours=5, minutes=30)
+
+
+def ist_days(start, end):
+    """
+    (day, lower, upper) for every IST day that lies entirely inside [start, end).
+    start/end and the bounds are naive UTC timestamps, like event_time.
+    """
+    day = (pd.Timestamp(start) + IST_OFFSET).ceil('D')
+    while day - IST_OFFSET + timedelta(days=1) <= pd.Timestamp(end):
+        lower = day - IST_OFFSET
+        yield day.date(), lower, lower + timedelta(days=1)
+        day += timedelta(days=1)
+
+
+class DayPartitionCache:
+    """
+    Parquet files of already fetched events, one per IST day, under directory/key/.
+    `key` identifies the projection (columns and events fetched), so changing the
+    query never serves files written for a different one. Only days that ended at
+    least `grace` ago are cached; they will not change any more.
+    """
+
+    def __init__(self, directory, key, grace=timedelta(hours=1)):
+        self.directory = os.path.join(directory, key)
+        self.grace = grace
+
+    def is_closed(self, upper):
+        return upper <= pd.Timestamp.now(tz='UTC').tz_localize(None) - self.grace
+
+    def path(self, day):
+        return os.path.join(self.directory, f"{day.isoformat()}.parquet")
+
+    def has(self, day):
+        return os.path.exists(self.path(day))
+
+    def load(self, day):
+        path = self.path(day)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def save(self, day, df):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(day)
+        # Write next to the target and rename, so a crash never leaves half a day behind
+        df.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+class EventStore:
+    """
+    In-memory event frame for one [start, end) query range.
+
+    The first refresh loads the whole range. Every later refresh only asks for
+    events at or after (watermark - overlap), where the watermark is the max
+    event_time already loaded, and replaces that tail of the frame with the
+    fresh rows. The overlap picks up events that landed in BigQuery late, but
+    only up to `overlap` late: an event that lands with an event_time before
+    (watermark - overlap) of the refresh after it is never picked up by this
+    store (nor, once its day is cached, by any later one).
+
+    With a DayPartitionCache, closed IST days are read from (or written to) disk on
+    the first refresh and never queried again.
+
+    With an IdTable, every fetched frame gets its id code columns (see
+    encode_ids) as it arrives. The table lives as long as the store, so codes
+    are stable across refreshes and rows already loaded are never re-encoded.
+
+    With a PresenceStore, every fetched frame is folded into it as it arrives,
+    so the latest astrologer statuses never need a pass over the whole frame.
+    """
+
+    def __init__(self, start, end, overlap=timedelta(minutes=2), day_cache=None, ids=None, presence=None):
+        self.start = pd.Timestamp(start)
+        self.end = pd.Timestamp(end)
+        self.overlap = overlap
+        self.day_cache = day_cache
+        self.ids = ids
+        self.presence = presence
+        self.df = pd.DataFrame()
+        # Everything before floor is final (closed days), so it is never refetched
+        self.floor = self.start
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self):
+        if self.df.empty:
+            return None
+        return self.df['event_time'].max()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _lower_bound(self):
+        watermark = self.watermark
+        if watermark is None:
+            return self.floor
+        return max(self.floor, (watermark - self.overlap).floor('s'))
+
+    def _fetch(self, fetch, lower, upper):
+        new_events = fetch(lower.strftime(BQ_DATETIME_FORMAT), upper.strftime(BQ_DATETIME_FORMAT))
+        if not new_events.empty:
+            new_events['event_time'] = pd.to_datetime(new_events['event_time'])
+        return new_events
+
+    def _arrived(self, events):
+        # Every fetched frame, cached day or tail, passes through here once
+        if self.presence is not None:
+            self.presence.update(events)
+        if self.ids is None or events.empty:
+            return events
+        return encode_ids(events, self.ids)
+
+    def _closed_days(self):
+        # The run of closed IST days starting exactly at floor
+        floor = self.floor
+        for day, lower, upper in ist_days(floor, self.end):
+            if lower != floor or not self.day_cache.is_closed(upper):
+                break
+            yield day, lower, upper
+            floor = upper
+
+    def pending_ranges(self):
+        """
+        (lower, upper) ranges the next refresh would query: closed days missing from
+        the day cache, then the open tail. Lets the caller estimate a refresh's cost first.
+        """
+        ranges = []
+        floor = self.floor
+        if not self._loaded and self.day_cache is not None:
+            for day, lower, upper in self._closed_days():
+                if not self.day_cache.has(day):
+                    ranges.append((lower, upper))
+                floor = upper
+            if floor >= self.end:
+                return ranges
+            ranges.append((floor, self.end))
+            return ranges
+        lower = self._lower_bound()
+        if lower < self.end:
+            ranges.append((lower, self.end))
+        return ranges
+
+    def _load_closed_days(self, fetch):
+        frames = []
+        for day, lower, upper in list(self._closed_days()):
+            day_events = self.day_cache.load(day)
+            if day_events is None:
+                day_events = self._fetch(fetch, lower, upper)
+                # Cached files keep the ids only: codes are only meaningful with this store's table
+                self.day_cache.save(day, day_events)
+            frames.append(self._arrived(day_events))
+            self.floor = upper
+        self.df = concat_events(frames)
+
+    def refresh(self, fetch):
+        """
+        fetch(lower_str, upper_str) must return a DataFrame of every event with
+        lower <= event_time < upper. Returns the full, updated frame.
+        """
+        with self._lock:
+            if not self._loaded:
+                if self.day_cache is not None:
+                    self._load_closed_days(fetch)
+                self._loaded = True
+
+            lower = self._lower_bound()
+            if lower >= self.end:
+                return self.df
+
+            new_events = self._arrived(self._fetch(fetch, lower, self.end))
+
+            # Everything from the lower bound on was just refetched, so drop the old copy of that tail
+            if not self.df.empty:
+                self.df = self.df[self.df['event_time'] < lower]
+            if new_events.empty:
+                self.df = self.df.reset_index(drop=True)
+            elif self.df.empty:
+                self.df = new_events.reset_index(drop=True)
+            else:
+                self.df = concat_events([self.df, new_events])
+            return self.df
@@ -0,0 +1,287 @@
+"""
+Synthetic events in the exact shape of `custom_event_tracking.events`
+(user_id, device_id, other_data, event_time, event_name, app_id), for
+benchmarking the dashboard offline with LocalEventSource.
+
+    python generate_events.py --events 1000000 --days 1 --seed 7 --out events.parquet
+    python benchmarks.py pipeline --events events.parquet
+
+About a third of the events are coherent chat lifecycles: chat_intake_submit ->
+accept_chat -> chat_call_accept -> chat_msg_send from both sides, or a
+confirm_cancel_waiting_list. The rest is open_page traffic, astrologer status
+toggles, wallet recharges (with retried orderIds), installs, profile creations
+and a few event types no metric reads. Astrologer ids come from astro_type.csv.
+The same seed always produces the same events.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from event_store import IST_OFFSET
+
+USER_APP = 'com.oneastro'
+ASTRO_APP = 'com.oneastrologer'
+
+# Relative traffic per IST hour, quiet at night and peaking in the evening
+IST_HOUR_WEIGHTS = np.array([
+    3, 2, 1, 1, 1, 1, 2, 3, 4, 5, 6, 6,
+    6, 6, 6, 6, 7, 8, 9, 10, 10, 9, 7, 5,
+], dtype=float)
+
+LIFECYCLE_SHARE = 0.35
+P_ACCEPT, P_CANCEL, P_CALL, P_PAID = 0.65, 0.25, 0.85, 0.3
+MESSAGES_PER_SIDE = 4
+# Expected events per chat_intake_submit, used to size the lifecycle part
+EVENTS_PER_INTAKE = 1 + P_CANCEL + P_ACCEPT * (1 + P_CALL * (1 + 2 * MESSAGES_PER_SIDE))
+
+BACKGROUND_MIX = {
+    'open_page': 0.78,
+    'status': 0.05,
+    'razorpay_continue_success': 0.05,
+    'app_install': 0.04,
+    'profile_creation': 0.03,
+    'home_banner_click': 0.03,
+    'search_astrologer': 0.02,
+}
+STATUS_EVENTS = ['change_chat_status', 'change_call_status', 'change_multichat_status']
+
+
+def object_ids(prefix, numbers):
+    # Mongo-ObjectId-looking 24 hex char ids
+    return np.array([f"{prefix}{number:016x}" for number in numbers], dtype=object)
+
+
+class Population:
+    def __init__(self, rng, num_users, astro_csv):
+        self.users = object_ids('67200000', range(num_users))
+        self.devices = object_ids('d0d0d0d0', range(num_users))
+        self.astrologers = pd.read_csv(astro_csv)['_id'].to_numpy(dtype=object)
+        self.astro_devices = object_ids('a0a0a0a0', range(len(self.astrologers)))
+        # A few astrologers and heavy users get most of the traffic
+        self.astro_weights = rng.pareto(1.5, len(self.astrologers)) + 1
+        self.astro_weights /= self.astro_weights.sum()
+        self.user_weights = rng.pareto(1.2, num_users) + 1
+        self.user_weights /= self.user_weights.sum()
+
+    def pick_users(self, rng, size):
+        return rng.choice(len(self.users), size=size, p=self.user_weights)
+
+    def pick_astrologers(self, rng, size):
+        return rng.choice(len(self.astrologers), size=size, p=self.astro_weights)
+
+
+class Chunk:
+    """
+    Events of one slice of the range, sampled per hour with IST_HOUR_WEIGHTS.
+    `ids` seeds unique waitingListId / chatSessionId / orderId values.
+    """
+
+    def __init__(self, rng, population, hours, counts, ids):
+        self.rng = rng
+        self.population = population
+        self.hours = hours
+        self.hour_p = counts / counts.sum()
+        self.ids = ids
+        self.frames = []
+
+    def times(self, size):
+        hour = self.rng.choice(len(self.hours), size=size, p=self.hour_p)
+        offset = (self.rng.random(size) * 3600 * 1e6).astype('int64')
+        return self.hours[hour] + offset.astype('timedelta64[us]')
+
+    def new_ids(self, prefix, size):
+        start = self.ids[prefix]
+        self.ids[prefix] += size
+        return object_ids(prefix, range(start, start + size))
+
+    def add(self, event_name, app_id, event_time, user_id, device_id, other_data):
+        self.frames.append(pd.DataFrame({
+            'user_id': user_id,
+            'device_id': device_id,
+            'other_data': other_data,
+            'event_time': event_time,
+            'event_name': event_name,
+            'app_id': app_id,
+        }))
+
+    def seconds(self, mean, size):
+        return (self.rng.exponential(mean, size) * 1e6).astype('int64').astype('timedelta64[us]')
+
+    def chat_lifecycles(self, num_intakes):
+        rng, population = self.rng, self.population
+        users = population.pick_users(rng, num_intakes)
+        astros = population.pick_astrologers(rng, num_intakes)
+        user_ids, astro_ids = population.users[users], population.astrologers[astros]
+        intake_time = self.times(num_intakes)
+        waiting_list = self.new_ids('57a17000', num_intakes)
+        self.add('chat_intake_submit', USER_APP, intake_time, user_ids, population.devices[users], [
+            f'{{"astrologerId":"{a}","waitingListId":"{w}"}}' for a, w in zip(astro_ids, waiting_list)
+        ])
+
+        outcome = rng.random(num_intakes)
+        cancel = (outcome >= P_ACCEPT) & (outcome < P_ACCEPT + P_CANCEL)
+        cancel_time = intake_time[cancel] + self.seconds(90, cancel.sum())
+        self.add('confirm_cancel_waiting_list', USER_APP, cancel_time, user_ids[cancel], population.devices[users[cancel]], [
+            f'{{"astrologerId":"{a}","waitingListId":"{w}"}}' for a, w in zip(astro_ids[cancel], waiting_list[cancel])
+        ])
+
+        accept = outcome < P_ACCEPT
+        num_accepted = accept.sum()
+        accept_time = intake_time[accept] + self.seconds(45, num_accepted)
+        sessions = self.new_ids('c4a75e55', num_accepted)
+        paid = (rng.random(num_accepted) < P_PAID).astype(int)
+        acc_users, acc_astros = users[accept], astros[accept]
+        self.add('accept_chat', ASTRO_APP, accept_time, population.astrologers[acc_astros], population.astro_devices[acc_astros], [
+            f'{{"clientId":"{c}","chatSessionId":"{s}","waitingListId":"{w}","paid":{p}}}'
+            for c, s, w, p in zip(population.users[acc_users], sessions, waiting_list[accept], paid)
+        ])
+
+        call = rng.random(num_accepted) < P_CALL
+        call_time = accept_time[call] + self.seconds(15, call.sum())
+        self.add('chat_call_accept', USER_APP, call_time, population.users[acc_users[call]], population.devices[acc_users[call]], [
+            f'{{"astrologerId":"{a}","chatSessionId":"{s}","paid":{p}}}'
+            for a, s, p in zip(population.astrologers[acc_astros[call]], sessions[call], paid[call])
+        ])
+
+        # Messages from both sides, spread over each chat's duration
+        duration = self.seconds(480, call.sum())
+        for app_id in [USER_APP, ASTRO_APP]:
+            per_chat = rng.poisson(MESSAGES_PER_SIDE, call.sum())
+            chat = np.repeat(np.arange(call.sum()), per_chat)
+            sent = call_time[chat] + (rng.random(len(chat)) * duration[chat].astype('int64')).astype('int64').astype('timedelta64[us]')
+            chat_users, chat_astros = acc_users[call][chat], acc_astros[call][chat]
+            session = sessions[call][chat]
+            if app_id == USER_APP:
+                self.add('chat_msg_send', app_id, sent, population.users[chat_users], population.devices[chat_users], [
+                    f'{{"astrologerId":"{a}","chatSessionId":"{s}"}}' for a, s in zip(population.astrologers[chat_astros], session)
+                ])
+            else:
+                self.add('chat_msg_send', app_id, sent, population.astrologers[chat_astros], population.astro_devices[chat_astros], [
+                    f'{{"clientId":"{c}","chatSessionId":"{s}"}}' for c, s in zip(population.users[chat_users], session)
+                ])
+
+    def background(self, num_events):
+        rng, population = self.rng, self.population
+        counts = rng.multinomial(num_events, list(BACKGROUND_MIX.values()))
+        for kind, size in zip(BACKGROUND_MIX, counts):
+            if size == 0:
+                continue
+            event_time = self.times(size)
+            if kind == 'status':
+                astros = population.pick_astrologers(rng, size)
+                statuses = rng.choice(['ON', 'OFF'], size=size, p=[0.6, 0.4])
+                silent = (rng.random(size) < 0.05).astype(int)
+                self.add(rng.choice(STATUS_EVENTS, size=size), ASTRO_APP, event_time, population.astrologers[astros],
+                         population.astro_devices[astros],
+                         [f'{{"status":"{s}","isSilent":{i}}}' for s, i in zip(statuses, silent)])
+                continue
+            if kind == 'open_page':
+                from_astro = rng.random(size) < 0.15
+                astros = population.pick_astrologers(rng, size)
+                users = population.pick_users(rng, size)
+                self.add(kind, np.where(from_astro, ASTRO_APP, USER_APP), event_time,
+                         np.where(from_astro, population.astrologers[astros], population.users[users]),
+                         np.where(from_astro, population.astro_devices[astros], population.devices[users]),
+                         '{"screen":"home"}')
+                continue
+            users = population.pick_users(rng, size)
+            if kind == 'razorpay_continue_success':
+                orders = self.new_ids('0bde7000', size)
+                # Some payments are reported twice; the metrics count each orderId once
+                retried = rng.random(size) < 0.05
+                orders[1:][retried[1:]] = orders[:-1][retried[1:]]
+                amounts = rng.choice([50, 100, 200, 500, 1000], size=size)
+                other_data = [f'{{"orderId":"{o}","amount":{a}}}' for o, a in zip(orders, amounts)]
+            else:
+                other_data = '{}'
+            self.add(kind, USER_APP, event_time, population.users[users], population.devices[users], other_data)
+
+    def frame(self):
+        df = pd.concat(self.frames, ignore_index=True)
+        return df.sort_values('event_time', kind='stable', ignore_index=True)
+
+
+def hour_slots(start_day, days, num_events):
+    """
+    UTC start of every hour in the range and how many events it gets.
+    """
+    ist_start = pd.Timestamp(start_day)
+    hours = pd.date_range(ist_start, periods=24 * days, freq='h') - IST_OFFSET
+    weights = np.tile(IST_HOUR_WEIGHTS, days)
+    counts = np.floor(weights / weights.sum() * num_events).astype(int)
+    counts[:num_events - counts.sum()] += 1
+    return hours.to_numpy().astype('datetime64[us]'), counts
+
+
+def generate(num_events, start_day, days, seed, astro_csv, chunk_events=1_000_000, num_users=None):
+    """
+    Yield DataFrames of about chunk_events events each, num_events in total, in
+    time order across chunks too: a chunk's events past its last hour (chat
+    lifecycles still running) are held back and yielded with the next chunk.
+    """
+    root = np.random.default_rng(seed)
+    population = Population(root, num_users or max(1000, num_events // 40), astro_csv)
+    hours, counts = hour_slots(start_day, days, num_events)
+    ids = {'57a17000': 0, 'c4a75e55': 0, '0bde7000': 0}
+
+    # Consecutive hours, each group holding about chunk_events events
+    boundaries = np.searchsorted(np.cumsum(counts), np.arange(chunk_events, num_events, chunk_events))
+    groups = np.split(np.arange(len(hours)), np.unique(boundaries + 1))
+    held = None
+    for group, child_seed in zip(groups, np.random.SeedSequence(seed).spawn(len(groups))):
+        group = group[counts[group] > 0]
+        target = counts[group].sum()
+        if target == 0:
+            continue
+        chunk = Chunk(np.random.default_rng(child_seed), population, hours[group], counts[group].astype(float), ids)
+        chunk.chat_lifecycles(max(1, int(target * LIFECYCLE_SHARE / EVENTS_PER_INTAKE)))
+        lifecycle_events = sum(len(frame) for frame in chunk.frames)
+        chunk.background(max(0, target - lifecycle_events))
+        df = chunk.frame()
+        if held is not None:
+            df = pd.concat([held, df], ignore_index=True).sort_values('event_time', kind='stable', ignore_index=True)
+        # Every later chunk starts at or after this chunk's last hour ends
+        late = (df['event_time'] >= hours[group[-1]] + np.timedelta64(1, 'h')).to_numpy()
+        held = df[late]
+        yield df[~late].reset_index(drop=True)
+    if held is not None and len(held):
+        yield held.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100_000, help='total events, 10k to 50M')
+    parser.add_argument('--start', default=None, help='first IST day, YYYY-MM-DD (default: yesterday)')
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--users', type=int, default=None, help='distinct users (default: events / 40)')
+    parser.add_argument('--astro-csv', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astro_type.csv'))
+    parser.add_argument('--chunk-events', type=int, default=1_000_000)
+    parser.add_argument('--out', default='events.parquet', help='.parquet or .jsonl')
+    args = parser.parse_args()
+
+    start_day = args.start or (pd.Timestamp.now(tz='Asia/Kolkata').normalize() - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    written = 0
+    writer = None
+    with open(args.out, 'w') if args.out.endswith('.jsonl') else open(os.devnull, 'w') as jsonl:
+        for df in generate(args.events, start_day, args.days, args.seed, args.astro_csv, args.chunk_events, args.users):
+            if args.out.endswith('.jsonl'):
+                df.to_json(jsonl, orient='records', lines=True, date_format='iso')
+            else:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(args.out, table.schema)
+                writer.write_table(table)
+            written += len(df)
+            print(f"\r{written} / {args.events} events", end='', flush=True)
+    if writer is not None:
+        writer.close()
+    print(f"\nwrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
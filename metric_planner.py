@@ -0,0 +1,222 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from event_frame import code_column
+from processor import UniqueUsersProcessor
+from rollups import BASE_MINUTES, HistogramRollup, Rollup, RollupStore, SketchRollup
+from sql_backend import FREE, PAID, SQL_METRICS, AggMetric, LatencyMetric, SemiJoin
+
+
+# One pass over one event slice: every planned metric sharing its filter, condition and `by` column, at any grain
+MetricPass = namedtuple('MetricPass', ['events', 'app_ids', 'condition', 'by', 'metrics'])
+# One as-of pairing of start and end events (see pair_latencies), averaged or percentiled per `by` at any grain
+LatencyPass = namedtuple('LatencyPass', ['start_event', 'end_event', 'on', 'by', 'metrics'])
+
+
+def plannable(spec):
+    # The live cards, which have no spec, stay UniqueUsersProcessor methods
+    return isinstance(spec, (AggMetric, LatencyMetric))
+
+
+def mergeable(spec):
+    """
+    Whether rollups of the spec over disjoint event sets merge into its rollup
+    over all of them. Not when a bucket's value depends on events outside the
+    bucket: a distinct_on dedup keeps each value's first row overall, a SemiJoin
+    filters on a value set built from every event, and latencies pair start
+    events with end events that may fall in another part.
+    """
+    if not isinstance(spec, AggMetric):
+        return False
+    return spec.distinct_on is None and not any(isinstance(part, SemiJoin) for part in spec.condition or ())
+
+
+def plan_metrics(names, registry=SQL_METRICS):
+    """
+    Group the plannable specs among `names` into MetricPasses and LatencyPasses.
+    Returns (passes, names left to their UniqueUsersProcessor method).
+    """
+    passes = OrderedDict()
+    fallback = []
+    for name in names:
+        spec = registry.get(name)
+        if spec is None or not plannable(spec):
+            fallback.append(name)
+            continue
+        if isinstance(spec, LatencyMetric):
+            key = (spec.start_event, spec.end_event, tuple(spec.on), spec.by)
+            if key not in passes:
+                passes[key] = LatencyPass(*key, metrics=[])
+            passes[key].metrics.append((name, spec))
+            continue
+        app_ids = tuple(spec.app_ids) if spec.app_ids is not None else None
+        key = (tuple(spec.events), app_ids, spec.condition, spec.by)
+        if key not in passes:
+            passes[key] = MetricPass(*key, metrics=[])
+        passes[key].metrics.append((name, spec))
+    return list(passes.values()), fallback
+
+
+def semi_join_values(processor, semi_join):
+    # As id codes: the processor's IdTable codes every id column alike, so user_id and clientId codes compare
+    source = processor._events(semi_join.event)
+    if semi_join.paid_only:
+        source = source[source['paid'] == 1]
+    return np.unique(source[code_column(semi_join.source)].to_numpy())
+
+
+def condition_mask(processor, events, condition, semi_joins=None):
+    """
+    Boolean mask of `events` rows passing every filter in an AggMetric condition,
+    the pandas counterpart of the SQL sql_backend compiles. semi_joins caches the
+    value sets of SemiJoins already looked up.
+    """
+    mask = pd.Series(True, index=events.index)
+    for part in condition:
+        if part == FREE:
+            mask &= (events['paid'] == 0).fillna(False)
+        elif part == PAID:
+            mask &= (events['paid'] != 0).fillna(True)
+        else:
+            if semi_joins is None:
+                semi_joins = {}
+            if part not in semi_joins:
+                semi_joins[part] = semi_join_values(processor, part)
+            mask &= events[code_column(part.column)].isin(semi_joins[part])
+    return mask
+
+
+def run_pass(processor, metric_pass, store, events=None, semi_joins=None, precision=None):
+    """
+    Add the rollups of every metric in `metric_pass` to `store`. Metrics that only
+    differ in grain share one Rollup. A sum over rows deduplicated on distinct_on
+    keeps only the first row per value, as drop_duplicates would. Distinct counts
+    and distinct_on read the id code columns; with a `precision`, distinct counts
+    are HyperLogLog SketchRollups instead of bitmaps.
+    """
+    if events is None:
+        events = processor._events(list(metric_pass.events), metric_pass.app_ids)
+    if metric_pass.condition is not None:
+        events = events[condition_mask(processor, events, metric_pass.condition, semi_joins)]
+    rollups = {}
+    for name, spec in metric_pass.metrics:
+        state_key = (spec.agg, spec.value, spec.distinct_on)
+        if state_key not in rollups:
+            rows = None
+            if spec.agg == 'sum':
+                values = pd.to_numeric(events[spec.value], errors='coerce')
+            else:
+                values = events[code_column(spec.value)]
+            if spec.distinct_on is not None:
+                rows = ~events[code_column(spec.distinct_on)].duplicated()
+                values = values.where(rows)
+            if spec.agg == 'nunique' and precision is not None:
+                rollups[state_key] = SketchRollup.from_events(metric_pass.by, events, values, precision, mergeable(spec))
+            else:
+                rollups[state_key] = Rollup.from_events(spec.agg, metric_pass.by, events, values, rows, mergeable(spec))
+        store.add(name, rollups[state_key], spec.column)
+
+
+def run_latency_pass(processor, latency_pass, store):
+    # The pairs are cached on the processor, so e.g. the hourly and 15-minute accept time pair once.
+    # Means share one Rollup and percentiles one set of histograms.
+    pairs = processor.latency_pairs(latency_pass.start_event, latency_pass.end_event, latency_pass.on)
+    mean = histograms = None
+    for name, spec in latency_pass.metrics:
+        if spec.quantile is None:
+            if mean is None:
+                mean = Rollup.from_events('mean', latency_pass.by, pairs, pairs['latency'], mergeable=False)
+            store.add(name, mean, spec.column)
+        else:
+            if histograms is None:
+                histograms = HistogramRollup.from_events(latency_pass.by, pairs, pairs['latency'], spec.quantile, mergeable=False)
+            store.add(name, histograms.with_quantile(spec.quantile), spec.column)
+
+
+def build_rollups(processor, names, registry=SQL_METRICS, precision=None):
+    """
+    RollupStore of every plannable metric in `names`. Each event slice and SemiJoin
+    value set is computed once, and each (slice, condition, by) combination is
+    one pass over its events. `precision` switches distinct counts to approximate
+    sketches (see run_pass).
+    """
+    passes, _ = plan_metrics(names, registry)
+    store = RollupStore()
+    slices = {}
+    semi_joins = {}
+    for metric_pass in passes:
+        if isinstance(metric_pass, LatencyPass):
+            run_latency_pass(processor, metric_pass, store)
+            continue
+        slice_key = (metric_pass.events, metric_pass.app_ids)
+        if slice_key not in slices:
+            slices[slice_key] = processor._events(list(metric_pass.events), metric_pass.app_ids)
+        run_pass(processor, metric_pass, store, slices[slice_key], semi_joins, precision)
+    return store
+
+
+class IncrementalRollups:
+    """
+    RollupStore of the mergeable planned metrics among `names` (see mergeable),
+    kept current across the refreshes of one EventStore. A refresh only replaces
+    events at or after (watermark - overlap), so update() rebuilds the 5-minute
+    buckets from that point on, from those events alone, and merges them into
+    the buckets before it: the cost tracks the refreshed tail and the number of
+    buckets, not the range. The other planned metrics are left to build_rollups
+    over the whole frame.
+    """
+
+    def __init__(self, names, registry=SQL_METRICS, precision=None):
+        self.names = [name for name in names if plannable(registry.get(name)) and mergeable(registry[name])]
+        self.registry = registry
+        self.precision = precision
+        self.store = None
+        self.version = None
+        self.ids = None
+        self._lock = threading.Lock()
+
+    def _build(self, events, ids):
+        return build_rollups(UniqueUsersProcessor(events, pd.DataFrame(), ids=ids), self.names, self.registry, self.precision)
+
+    def update(self, events, ids, overlap):
+        """
+        The store for `events`, an EventStore's frame (encoded with its IdTable
+        `ids`, refreshed with `overlap`). Reruns on an unchanged frame reuse the store.
+        """
+        with self._lock:
+            version = (events['event_time'].max(), len(events)) if not events.empty else None
+            if version == self.version:
+                return self.store
+            # Codes from another IdTable (e.g. a recreated EventStore) or a frame behind the store mean starting over
+            if self.version is None or version is None or ids is not self.ids or version[0] < self.version[0]:
+                self.store = self._build(events, ids)
+            else:
+                # 5-minute boundaries are the same in UTC and IST (UTC+5:30), so the cut is a bucket boundary either way
+                cut = (self.version[0] - overlap).floor(f'{BASE_MINUTES}min')
+                ist_minutes = (cut + pd.Timedelta(minutes=330) - pd.Timestamp(0)) // pd.Timedelta(minutes=1)
+                tail = self._build(events[events['event_time'] >= cut], ids)
+                self.store = self.store.before(ist_minutes // BASE_MINUTES).merge(tail)
+            self.version = version
+            self.ids = ids
+            return self.store
+
+
+def run_planned_metrics(processor, names, registry=SQL_METRICS, rollups=None):
+    """
+    {name: frame} for every metric in `names`, the same frames the
+    UniqueUsersProcessor methods return: planned metrics from their rollups at
+    the spec's grain (pass `rollups` to reuse a RollupStore already built), the
+    rest from their methods.
+    """
+    if rollups is None:
+        rollups = build_rollups(processor, names, registry)
+    frames = {}
+    for name in names:
+        if name in rollups.rollups:
+            frames[name] = rollups.frame(name, registry[name].grain)
+        else:
+            frames[name] = getattr(processor, name)()
+    return frames
@@ -3,29 +3,99 @@ import pandas as pd
 from google.oauth2 import service_account
 from google.cloud import bigquery
 import datetime
-import json
+import hashlib
+import os
 import time
 from datetime import timedelta
 
+from event_frame import IdTable, compact_events, memory_report, parse_other_data
+from event_query import build_events_query
+from event_source import (
+    BigQueryEventSource, LocalEventSource, QueryLog, ShardedFetcher, format_bytes, ipc_to_frame, make_bqstorage_client,
+)
+from event_store import BQ_DATETIME_FORMAT, DayPartitionCache, EventStore
+from metric_planner import IncrementalRollups, build_rollups, run_planned_metrics
+from presence import PresenceStore
+from processor import ASTRO_APP, STATUS_EVENTS, UniqueUsersProcessor, combine_metrics
+from rollups import RollupStore
+from sketches import DEFAULT_PRECISION, hll_error
+from sql_backend import METRIC_EVENTS, SQL_METRICS, AggMetric, LatencyMetric, compile_metrics_query, run_sql_metrics
+
 
 # Streamlit App Setup
 st.title("Astrology Chat Data Processor")
 
 
-# Create API client.
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
-client = bigquery.Client(credentials=credentials)
+def setting(name, default=None):
+    # st.secrets first, then an upper-case environment variable, so the page also runs without a secrets file
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except FileNotFoundError:
+        pass
+    return os.environ.get(name.upper(), default)
+
+
+# "bigquery" is production; "local" runs the same queries with DuckDB over local_events_path (Parquet or JSONL).
+EVENT_SOURCE = setting("event_source", "bigquery")
+# "arrow" streams results as Arrow record batches (Storage Read API when available); "rows" is the old dict-per-row path.
+FETCH_MODE = setting("fetch_mode", "arrow")
+# "bigquery" extracts the other_data keys with JSON_VALUE in the query; "client" ships other_data and parses it here.
+JSON_EXTRACTION = setting("json_extraction", "bigquery")
+
+# Cost guard: every job is capped at max_bytes_billed (BigQuery refuses bigger ones), and a new range whose
+# dry-run estimate exceeds it is refused ("refuse") or cut down to its most recent days ("downgrade").
+MAX_BYTES_BILLED = int(setting("max_bytes_billed", 0)) or None
+BYTES_GUARD = setting("bytes_guard", "refuse")
+PRICE_PER_TIB = float(setting("price_per_tib", 6.25))
+job_config = bigquery.QueryJobConfig(maximum_bytes_billed=MAX_BYTES_BILLED) if MAX_BYTES_BILLED else None
 
-# Perform query. Uses st.cache_data to only rerun when the query changes or after 10 min.
+
+# Bytes, slot time, cache hits and wall time of every query this app runs.
+@st.cache_resource(show_spinner=False)
+def get_query_log():
+    return QueryLog()
+
+
+query_log = get_query_log()
+
+
+@st.cache_resource(show_spinner=False)
+def get_event_source(event_source, fetch_mode):
+    if event_source == "local":
+        return LocalEventSource(setting("local_events_path"), log=query_log)
+    # Create API client.
+    credentials = service_account.Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"]
+    )
+    client = bigquery.Client(credentials=credentials)
+    return BigQueryEventSource(client, make_bqstorage_client(credentials), job_config, query_log, fetch_mode)
+
+
+source = get_event_source(EVENT_SOURCE, FETCH_MODE)
+
+# Perform query. Not cached and free of Streamlit calls, so the sharded fetch can run it on worker threads.
+def run_query(query, label="events"):
+    return source.query_frame(query, label)
+
+# Cached variant for aggregate queries. The result is cached as one Arrow IPC blob instead of a list of dicts.
 @st.cache_data(ttl=60, show_spinner=True)
-def run_query(query):
-    query_job = client.query(query)
-    rows_raw = query_job.result()
-    # Convert to list of dicts. Required for st.cache_data to hash the return value.
-    rows = [dict(row) for row in rows_raw]
-    return rows
+def run_query_arrow(query):
+    return source.query_ipc(query, "aggregates")
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def estimate_query_bytes(query):
+    return source.dry_run_bytes(query)
+
+
+# Splits each events fetch into time shards queried in parallel; the shard width adapts to the traffic.
+@st.cache_resource(show_spinner=False)
+def get_sharded_fetcher():
+    return ShardedFetcher(max_workers=int(setting("fetch_workers", 8)))
+
+
+sharded_fetcher = get_sharded_fetcher()
 
 # User inputs for date range
 today = datetime.date.today()
@@ -39,755 +109,233 @@ end_date = st.sidebar.date_input("End date", today)
 start_date_str = start_date.strftime('%Y-%m-%d') + ' 18:30:00'
 end_date_str = end_date.strftime('%Y-%m-%d') + ' 18:30:00'
 
-query = f"""
-SELECT user_id, device_id, other_data, event_time, event_name, app_id FROM `oneastro-prod.custom_event_tracking.events`
-WHERE (app_id = 'com.oneastro' OR app_id = 'com.oneastrologer')
-AND event_time >= DATETIME('{start_date_str}')
-AND event_time < DATETIME('{end_date_str}')
-"""
-# AND event_name IN ('change_chat_status', 'change_call_status', 'change_multichat_status','chat_call_accept','app_install', 'profile_creation','chat_intake_submit', 'accept_chat', 'open_page', 'chat_msg_send', 'confirm_cancel_waiting_list', 'razorpay_continue_success')
-# """
-
-rows = run_query(query)
-
-# Convert data to DataFrame
-df = pd.DataFrame(rows)
-json_data = []
-for item in df['other_data']:
-    try:
-        data = json.loads(item)
-        json_data.append(data)
-    except (json.JSONDecodeError, TypeError):
-        continue
-json_df = pd.json_normalize(json_data)
-combined_df = pd.concat([df, json_df], axis=1)
-# combined_df
 
-astro_file = pd.read_csv("https://github.com/Jay5973/North-Star-Metrix/blob/main/astro_type.csv?raw=true")
+# Every metric this page shows. The events query is derived from these, so only their events and fields are fetched.
+PAGE_METRICS = [
+    'astros_busy_1',
+    'users_live_1',
+    'astros_live_1',
+    'users_busy_1',
+    'multichat_enabled',
+    'chat_call_enabled',
+    'process_chat_intake_requests',
+    'process_chat_accepted_events',
+    'process_chat_completed_events',
+    'process_paid_chat_completed_events',
+    'process_chat_cancels',
+    'cancellation_time',
+    'cancellation_time_p50',
+    'cancellation_time_p90',
+    'cancellation_time_p99',
+    'process_overall_chat_completed_events',
+    'process_overall_chat_intake_requests',
+    'process_overall_chat_accepted_events',
+    'astros_live',
+    'users_live',
+    'process_overall_profile_creation',
+    'process_overall_app_install',
+    'process_overall_wallet_recharge_users',
+    'process_overall_wallet_recharge_count',
+    'process_overall_wallet_recharge_amount',
+    'overall_accept_time',
+    'overall_accept_time_p50',
+    'overall_accept_time_p90',
+    'overall_accept_time_p99',
+    'process_overall_chat_completed_events_15',
+    'process_overall_chat_intake_requests_15',
+    'process_overall_chat_accepted_events_15',
+    'astros_live_15',
+    'users_live_15',
+    'process_overall_profile_creation_15',
+    'process_overall_app_install_15',
+    'process_overall_wallet_recharge_users_15',
+    'process_overall_wallet_recharge_count_15',
+    'process_overall_wallet_recharge_amount_15',
+    'astros_busy_15',
+    'overall_accept_time_15',
+    'astros_busy',
+]
+
+# Processor views the page calls itself, at the trend grain or per astrologer: their events are fetched with the
+# rest, but they are not run as metrics (nor in SQL).
+PAGE_EVENT_METRICS = [
+    'chat_funnel',
+    'availability',
+]
+
+# "bigquery" computes every metric in SQL_METRICS server-side and only fetches raw events for the rest (the live cards).
+AGGREGATION_BACKEND = setting("aggregation_backend", "pandas")
+if AGGREGATION_BACKEND == "bigquery":
+    SQL_PAGE_METRICS = [name for name in PAGE_METRICS if name in SQL_METRICS]
+else:
+    SQL_PAGE_METRICS = []
+FETCHED_METRICS = [name for name in PAGE_METRICS if name not in SQL_PAGE_METRICS]
+
+# "exact" counts distinct users from the full id sets; "hll" uses HyperLogLog sketches of hll_precision bits
+# (constant memory per 5-minute bucket, relative standard error 1.04 / sqrt(2 ** hll_precision)).
+DISTINCT_MODE = setting("distinct_mode", "exact")
+HLL_PRECISION = int(setting("hll_precision", DEFAULT_PRECISION)) if DISTINCT_MODE == "hll" else None
+
+
+def expand_other_data(df):
+    if 'other_data' not in df:
+        return df
+    parsed, failures = parse_other_data(df['other_data'])
+    if failures:
+        st.sidebar.warning(f"{failures} of {len(df)} other_data rows could not be parsed")
+    return pd.concat([df.drop(columns='other_data'), parsed], axis=1)
+
+
+def events_query(lower_str, upper_str):
+    return build_events_query(
+        METRIC_EVENTS, FETCHED_METRICS + PAGE_EVENT_METRICS, lower_str, upper_str,
+        extract_json=JSON_EXTRACTION == "bigquery",
+    )
 
-def get_15_minute_interval(hour, minute):
-    """
-    Given an hour and minute, return the corresponding 15-minute interval.
-    """
-    if 0 <= minute < 15:
-        return f"{hour}:00-15"
-    elif 15 <= minute < 30:
-        return f"{hour}:15-30"
-    elif 30 <= minute < 45:
-        return f"{hour}:30-45"
-    else:
-        return f"{hour}:45-60"
-
-def get_5_minute_interval(hour, minute):
+
+def query_events(lower_str, upper_str):
+    return run_query(events_query(lower_str, upper_str))
+
+
+def fetch_events(lower_str, upper_str):
+    with st.spinner("Fetching events..."):
+        df = sharded_fetcher.fetch(query_events, lower_str, upper_str)
+    if df.empty:
+        return df
+    df = expand_other_data(df)
+    compact = compact_events(df)
+    st.session_state['memory_report'] = memory_report(df, compact)
+    return compact
+
+
+# Closed IST days are kept on disk as Parquet, one file per day, and never queried again.
+DAY_CACHE_DIR = setting("day_cache_dir", ".cache/events")
+
+
+def fetch_key():
+    # Identifies the source and projection the cached days were fetched with
+    query_shape = f"{EVENT_SOURCE}:{setting('local_events_path')}:{events_query('', '')}"
+    return hashlib.sha1(query_shape.encode()).hexdigest()[:12]
+
+
+# One store per date range (and projection), shared across reruns. Each rerun only pulls events past the store's
+# watermark, and folds them into the astrologer statuses the live cards read. Each store holds its whole range in
+# memory, so only the two most recent ranges (e.g. one and its cost-guard downgrade) are kept.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_event_store(start_date_str, end_date_str, fetch_key):
+    return EventStore(
+        start_date_str, end_date_str, day_cache=DayPartitionCache(DAY_CACHE_DIR, fetch_key), ids=IdTable(),
+        presence=PresenceStore(STATUS_EVENTS, ASTRO_APP),
+    )
+
+
+def estimate_refresh(store):
     """
-    Given an hour and minute, return the corresponding 5-minute interval.
+    Dry-run bytes of every events query the store's next refresh would run, as (lower, upper, bytes).
     """
-    if 0 <= minute < 5:
-        return f"{hour}:00-05"
-    elif 5 <= minute < 10:
-        return f"{hour}:05-10"
-    elif 10 <= minute < 15:
-        return f"{hour}:10-15"
-    elif 15 <= minute < 20:
-        return f"{hour}:15-20"
-    elif 20 <= minute < 25:
-        return f"{hour}:20-25"
-    elif 25 <= minute < 30:
-        return f"{hour}:25-30"
-    elif 30 <= minute < 35:
-        return f"{hour}:30-35"
-    elif 35 <= minute < 40:
-        return f"{hour}:35-40"
-    elif 40 <= minute < 45:
-        return f"{hour}:40-45"
-    elif 45 <= minute < 50:
-        return f"{hour}:45-50"
-    elif 50 <= minute < 55:
-        return f"{hour}:50-55"
-    else:
-        return f"{hour}:55-60"
-
-
-
-    # Step 3: Process Events to Calculate Unique Users
-class UniqueUsersProcessor:
-    def __init__(self, raw_df,astro_df):
-        self.raw_df = raw_df
-        self.astro_df = astro_df
-
-    def filter_last_5_minutes(self, df):
-        current_time = pd.to_datetime('now', utc=True) + timedelta(hours=5, minutes=30)
-        last_5_min_start = current_time - pd.DateOffset(minutes=5)
-        return df[df['event_time'] >= last_5_min_start]
-
-    def process_chat_intake_requests(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_intake_submit')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['astrologerId', 'date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'chat_intake_requests', 'astrologerId': '_id'}, inplace=True)
-        return user_counts
-
-    def process_chat_cancels(self):
-        cancel_events = self.raw_df[(self.raw_df['event_name'] == 'confirm_cancel_waiting_list')]
-        cancel_events['event_time'] = pd.to_datetime(cancel_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        cancel_events['date'] = cancel_events['event_time'].dt.date
-        cancel_events['hour'] = cancel_events['event_time'].dt.hour
-        user_counts = cancel_events.groupby(['astrologerId', 'date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'cancelled_requests', 'astrologerId': '_id'}, inplace=True)
-        return user_counts
-
-    def cancellation_time(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_intake_submit')].copy()
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        cancel_events = self.raw_df[(self.raw_df['event_name'] == 'confirm_cancel_waiting_list')].copy()
-        cancel_events['event_time'] = pd.to_datetime(cancel_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        cancel_events['date'] = cancel_events['event_time'].dt.date
-        cancel_events['hour'] = cancel_events['event_time'].dt.hour
-        merged_events = pd.merge(intake_events, cancel_events, on=['user_id', 'astrologerId'], suffixes=('_intake', '_cancel'))
-        merged_events['time_diff'] = (merged_events['event_time_cancel'] - merged_events['event_time_intake']).dt.total_seconds() / 60.0
-        avg_time_diff = merged_events.groupby(['astrologerId', 'date_intake', 'hour_intake'])['time_diff'].mean().reset_index()
-        avg_time_diff.rename(columns={'astrologerId': '_id', 'date_intake': 'date', 'hour_intake': 'hour', 'time_diff': 'cancellation_time'}, inplace=True)
-        return avg_time_diff
-
-    def overall_accept_time(self):
-        # Filter chat_intake_submit events
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_intake_submit')].copy()
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-    
-        # Filter accept_chat events
-        cancel_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat')].copy()
-        cancel_events['event_time'] = pd.to_datetime(cancel_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        cancel_events['date'] = cancel_events['event_time'].dt.date
-        cancel_events['hour'] = cancel_events['event_time'].dt.hour
-    
-        # Merge the intake and cancel events based only on waitingListId
-        merged_events = pd.merge(
-            intake_events, 
-            cancel_events, 
-            on='waitingListId',  # Merge only on waitingListId
-            suffixes=('_intake', '_cancel')
-        )
-    
-        # Calculate time difference between intake and cancellation
-        merged_events['time_diff'] = (merged_events['event_time_cancel'] - merged_events['event_time_intake']).dt.total_seconds() / 60.0
-    
-        # Group by date and hour of the intake event, and calculate average time difference
-        avg_time_diff = merged_events.groupby(['date_intake', 'hour_intake'])['time_diff'].mean().reset_index()
-    
-        # Rename columns for clarity
-        avg_time_diff.rename(columns={'date_intake': 'date', 'hour_intake': 'hour', 'time_diff': 'accept_time'}, inplace=True)
-    
-        return avg_time_diff
-
-    
-
-    def process_chat_accepted_events(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_intake_submit']
-        valid_user_ids = intake_events['user_id'].unique()
-        accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['paid'] == 0) & (self.raw_df['clientId'].isin(valid_user_ids))]
-        accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        accept_events['date'] = accept_events['event_time'].dt.date
-        accept_events['hour'] = accept_events['event_time'].dt.hour
-        accept_counts = accept_events.groupby(['user_id', 'date', 'hour'])['clientId'].nunique().reset_index()
-        accept_counts.rename(columns={'clientId': 'chat_accepted', 'user_id': '_id'}, inplace=True)
-        return accept_counts
-    
-    def process_chat_completed_events(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_call_accept') ]
-        valid_user_ids = intake_events['chatSessionId'].unique()
-        accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['paid'] == 0) & (self.raw_df['chatSessionId'].isin(valid_user_ids))]
-        accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        accept_events['date'] = accept_events['event_time'].dt.date
-        accept_events['hour'] = accept_events['event_time'].dt.hour
-        accept_counts = accept_events.groupby(['user_id', 'date', 'hour'])['clientId'].nunique().reset_index()
-        accept_counts.rename(columns={'clientId': 'chat_completed', 'user_id': '_id'}, inplace=True)
-        return accept_counts
-    
-    def process_paid_chat_completed_events(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_call_accept')& (self.raw_df['paid'] == 1)]
-        valid_user_ids = intake_events['chatSessionId'].unique()
-        accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['paid'] != 0) & (self.raw_df['chatSessionId'].isin(valid_user_ids))]
-        accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        accept_events['date'] = accept_events['event_time'].dt.date
-        accept_events['hour'] = accept_events['event_time'].dt.hour
-        accept_counts = accept_events.groupby(['user_id', 'date', 'hour'])['clientId'].nunique().reset_index()
-        accept_counts.rename(columns={'clientId': 'paid_chats_completed', 'user_id': '_id'}, inplace=True)
-        return accept_counts
-
-    # def process_chat_completed_events1(self):
-    #     completed_events = self.completed_df[(self.completed_df['status'] == 'COMPLETED') & (self.completed_df['type'].isin(['FREE', 'PAID']))]
-    #     completed_events['createdAt'] = pd.to_datetime(completed_events['createdAt'], utc=True)
-    #     completed_events['date'] = completed_events['createdAt'].dt.date
-    #     completed_events['hour'] = completed_events['createdAt'].dt.hour
-    #     completed_counts = completed_events.groupby(['astrologerId', 'date', 'hour'])['userId'].nunique().reset_index()
-    #     completed_counts.rename(columns={'userId': 'chat_completed', 'astrologerId': '_id'}, inplace=True)
-    #     return completed_counts
-
-    # def process_paid_chat_completed_events1(self):
-    #     paid_events = self.completed_df[(self.completed_df['status'] == 'COMPLETED') & (self.completed_df['type'] == 'PAID')]
-    #     paid_events['createdAt'] = pd.to_datetime(paid_events['createdAt'], utc=True)
-    #     paid_events['date'] = paid_events['createdAt'].dt.date
-    #     paid_events['hour'] = paid_events['createdAt'].dt.hour
-    #     paid_counts = paid_events.groupby(['astrologerId', 'date', 'hour'])['userId'].nunique().reset_index()
-    #     paid_counts.rename(columns={'userId': 'paid_chats_completed', 'astrologerId': '_id'}, inplace=True)
-    #     return paid_counts
-
-    def merge_with_astro_data(self, final_data):
-        merged_data = pd.merge(final_data, self.astro_df, on='_id', how='left')
-        columns = ['_id', 'name', 'type', 'date', 'hour', 'chat_intake_requests', 'chat_accepted', 'chat_completed','cancelled_requests','cancellation_time', 'paid_chats_completed']
-        return merged_data[columns]
-
-    def merge_with_hour_only(self, final_data):
-        columns = ['date', 'hour', 'chat_intake_overall', 'chat_accepted_overall', 'chat_completed_overall','astros_live']
-        return merged_data[columns]
-    
-    # def process_overall_chat_completed_events1(self):
-    #     completed_events = self.completed_df[(self.completed_df['status'] == 'COMPLETED') & (self.completed_df['type'].isin(['FREE', 'PAID']))]
-    #     completed_events['createdAt'] = pd.to_datetime(completed_events['createdAt'], utc=True)
-    #     completed_events['date'] = completed_events['createdAt'].dt.date
-    #     completed_events['hour'] = completed_events['createdAt'].dt.hour
-    #     completed_counts = completed_events.groupby(['date', 'hour'])['userId'].nunique().reset_index()
-    #     completed_counts.rename(columns={'userId': 'chat_completed_overall'}, inplace=True)
-    #     return completed_counts
-    
-    def process_overall_chat_completed_events(self):
-        # intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_msg_send']
-        # valid_user_ids = intake_events['chatSessionId'].unique()
-        # accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['chatSessionId'].isin(valid_user_ids))]
-        # accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        # accept_events['date'] = accept_events['event_time'].dt.date
-        # accept_events['hour'] = accept_events['event_time'].dt.hour
-        # accept_counts = accept_events.groupby(['date', 'hour'])['clientId'].nunique().reset_index()
-        # accept_counts.rename(columns={'clientId': 'chat_completed_overall'}, inplace=True)
-        # return accept_counts
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_call_accept') ]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'chat_completed_overall'}, inplace=True)
-        return user_counts
-    
-    def process_overall_chat_accepted_events(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_intake_submit']
-        valid_user_ids = intake_events['user_id'].unique()
-        accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat')  & (self.raw_df['clientId'].isin(valid_user_ids))]
-        accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        accept_events['date'] = accept_events['event_time'].dt.date
-        accept_events['hour'] = accept_events['event_time'].dt.hour
-        accept_counts = accept_events.groupby(['date', 'hour'])['clientId'].nunique().reset_index()
-        accept_counts.rename(columns={'clientId': 'chat_accepted_overall'}, inplace=True)
-        return accept_counts
-    
-    def process_overall_chat_intake_requests(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_intake_submit')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'chat_intake_overall'}, inplace=True)
-        return user_counts
-
-    def process_overall_profile_creation(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'profile_creation')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'profile_creation'}, inplace=True)
-        return user_counts
-
-    def process_overall_app_install(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'app_install')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['device_id'].nunique().reset_index()
-        user_counts.rename(columns={'device_id': 'app_installs'}, inplace=True)
-        return user_counts
-
-    def process_overall_wallet_recharge_users(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'razorpay_continue_success')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'wallet_recharge_users'}, inplace=True)
-        return user_counts
-
-    def process_overall_wallet_recharge_count(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'razorpay_continue_success')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['orderId'].nunique().reset_index()
-        user_counts.rename(columns={'orderId': 'wallet_recharge_count'}, inplace=True)
-        return user_counts
-
-    def process_overall_wallet_recharge_amount(self):
-        # Filter for the relevant events
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'razorpay_continue_success']
-        
-        # Remove duplicate records based on the same orderId
-        intake_events = intake_events.drop_duplicates(subset='orderId')
-        
-        # Ensure the amount column is numeric
-        intake_events['amount'] = pd.to_numeric(intake_events['amount'], errors='coerce')
-        
-        # Convert event_time to datetime and adjust the timezone
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        
-        # Extract date and hour
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        
-        # Group by date and hour and calculate the sum of amount
-        user_counts = intake_events.groupby(['date', 'hour'])['amount'].sum().reset_index()
-        
-        # Rename the column to wallet_recharge_amount
-        user_counts.rename(columns={'amount': 'wallet_recharge_amount'}, inplace=True)
-        
-        return user_counts
-
-
-
-
-
-    
-    def astros_live(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'open_page') & (self.raw_df['app_id'] == 'com.oneastrologer')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'astros_live'}, inplace=True)
-        return user_counts
-
-    def astros_busy(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') & (self.raw_df['app_id'] == 'com.oneastrologer')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'astros_busy'}, inplace=True)
-        return user_counts
-
-    def users_live(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'open_page') & (self.raw_df['app_id'] == 'com.oneastro')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        user_counts = intake_events.groupby(['date', 'hour'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
-        return user_counts
-    
-    # Update the methods to group by 15-minute intervals
-    
-    def process_overall_chat_completed_events_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_call_accept']
-        valid_user_ids = intake_events['chatSessionId'].unique()
-        accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['chatSessionId'].isin(valid_user_ids))]
-        accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        accept_events['date'] = accept_events['event_time'].dt.date
-        accept_events['hour'] = accept_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        accept_events['interval'] = accept_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        accept_counts = accept_events.groupby(['date','hour', 'interval'])['clientId'].nunique().reset_index()
-        accept_counts.rename(columns={'clientId': 'chat_completed_overall'}, inplace=True)
-        return accept_counts
-    
-    def process_overall_chat_accepted_events_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_call_accept']
-        valid_user_ids = intake_events['user_id'].unique()
-        accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['clientId'].isin(valid_user_ids))]
-        accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        accept_events['date'] = accept_events['event_time'].dt.date
-        accept_events['hour'] = accept_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        accept_events['interval'] = accept_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        accept_counts = accept_events.groupby(['date','hour', 'interval'])['clientId'].nunique().reset_index()
-        accept_counts.rename(columns={'clientId': 'chat_accepted_overall'}, inplace=True)
-        return accept_counts
-    
-    def process_overall_chat_intake_requests_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_intake_submit']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'chat_intake_overall'}, inplace=True)
-        return user_counts
-    
-    def process_overall_profile_creation_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'profile_creation']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'profile_creation'}, inplace=True)
-        return user_counts
-    
-    def process_overall_app_install_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'app_install']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['device_id'].nunique().reset_index()
-        user_counts.rename(columns={'device_id': 'app_installs'}, inplace=True)
-        return user_counts
-    
-    def process_overall_wallet_recharge_users_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'razorpay_continue_success']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'wallet_recharge_users'}, inplace=True)
-        return user_counts
-    
-    def process_overall_wallet_recharge_count_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'razorpay_continue_success']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['orderId'].nunique().reset_index()
-        user_counts.rename(columns={'orderId': 'wallet_recharge_count'}, inplace=True)
-        return user_counts
-    
-    def process_overall_wallet_recharge_amount_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'razorpay_continue_success']
-        intake_events = intake_events.drop_duplicates(subset='orderId')
-        intake_events['amount'] = pd.to_numeric(intake_events['amount'], errors='coerce')
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['amount'].sum().reset_index()
-        user_counts.rename(columns={'amount': 'wallet_recharge_amount'}, inplace=True)
-        return user_counts
-    
-    def astros_live_15(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'open_page') & (self.raw_df['app_id'] == "com.oneastrologer")]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'astros_live'}, inplace=True)
-        return user_counts
-
-    def astros_busy_15(self):
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') & (self.raw_df['app_id'] == "com.oneastrologer")]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'astros_busy'}, inplace=True)
-        return user_counts
-
-    def users_live_15(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
-        intake_events = intake_events[(self.raw_df['app_id'] == 'com.oneastro')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        # Create a new column for 15-minute intervals
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
-        return user_counts
-
-    def overall_accept_time_15(self):
-        # Filter chat_intake_submit events
-        intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_intake_submit')].copy()
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        # Filter accept_chat events
-        cancel_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat')].copy()
-        cancel_events['event_time'] = pd.to_datetime(cancel_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        cancel_events['date'] = cancel_events['event_time'].dt.date
-        cancel_events['hour'] = cancel_events['event_time'].dt.hour
-        cancel_events['interval'] = cancel_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        # Merge the intake and cancel events based only on waitingListId
-        merged_events = pd.merge(
-            intake_events, 
-            cancel_events, 
-            on='waitingListId',  # Merge only on waitingListId
-            suffixes=('_intake', '_cancel')
-        )
-        
-        # Calculate time difference between intake and cancellation
-        merged_events['time_diff'] = (merged_events['event_time_cancel'] - merged_events['event_time_intake']).dt.total_seconds() / 60.0
-        
-        # Group by date, hour, and interval of the intake event, and calculate average time difference
-        avg_time_diff = merged_events.groupby(['date_intake', 'hour_intake', 'interval_intake'])['time_diff'].mean().reset_index()
-        
-        # Rename columns for clarity
-        avg_time_diff.rename(columns={'date_intake': 'date', 'hour_intake': 'hour', 'interval_intake': 'interval', 'time_diff': 'accept_time'}, inplace=True)
-        
-        return avg_time_diff
-
-    # def astros_busy_1(self):
-    #     intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') & (self.raw_df['app_id'] == "com.oneastrologer")]
-    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-    #     intake_events['date'] = intake_events['event_time'].dt.date
-    #     intake_events['hour'] = intake_events['event_time'].dt.hour
-    #     # intake_events['minute'] = intake_events['event_time'].dt.minute
-    #     # Create a new column for 15-minute intervals
-    #     # intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-    #     intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_5_minute_interval(x.hour, x.minute))
-        
-    #     user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-    #     user_counts.rename(columns={'user_id': 'astros_busy_live'}, inplace=True)
-    #     return user_counts
-
-    # def users_busy_1(self):
-    #     intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') ]
-    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-    #     intake_events['date'] = intake_events['event_time'].dt.date
-    #     intake_events['hour'] = intake_events['event_time'].dt.hour
-    #     intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_5_minute_interval(x.hour, x.minute))
-        
-    #     user_counts = intake_events.groupby(['date','hour', 'interval'])['chatSessionId'].nunique().reset_index()
-    #     user_counts.rename(columns={'chatSessionId': 'users_busy_live'}, inplace=True)
-    #     return user_counts
-    
-
-
-    # def users_live_1(self):
-    #     # intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
-    #     intake_events = self.raw_df[(self.raw_df['app_id'] == 'com.oneastro') | (self.raw_df['app_id'] == 'com.oneastrotelugu')]
-    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-    #     intake_events['date'] = intake_events['event_time'].dt.date
-    #     intake_events['hour'] = intake_events['event_time'].dt.hour
-    #     intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_5_minute_interval(x.hour, x.minute))
-    #     user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
-    #     user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
-    #     return user_counts
-
-    # def astros_busy_1(self):
-    #     intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') & (self.raw_df['app_id'] == "com.oneastrologer")]
-    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-    #     intake_events = self.filter_last_5_minutes(intake_events)
-    #     astros_busy_count = intake_events['user_id'].nunique()
-    #     return astros_busy_count
-    def astros_busy_1(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_msg_send']
-        
-        # Convert event_time to datetime and adjust to IST
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        
-        # Filter events for the last 5 minutes
-        intake_events = self.filter_last_5_minutes(intake_events)
-        
-        # Separate events based on app_id and count unique ids accordingly
-        astros_busy_count = 0
-        
-        if not intake_events.empty:
-            astro_events = intake_events[intake_events['app_id'].isin(['com.oneastro', 'com.oneastrotelugu'])]
-            astros_busy_count += astro_events['astrologerId'].nunique()
-            
-            user_events = intake_events[intake_events['app_id'] == 'com.oneastrologer']
-            astros_busy_count += user_events['user_id'].nunique()
-        
-        return astros_busy_count
-
-
-    def users_busy_1(self):
-        intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_msg_send']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events = self.filter_last_5_minutes(intake_events)
-        users_busy_count = intake_events['chatSessionId'].nunique()
-        return users_busy_count
-
-    def users_live_1(self):
-        intake_events = self.raw_df[(self.raw_df['app_id'] == 'com.oneastro') | (self.raw_df['app_id'] == 'com.oneastrotelugu')]
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events = self.filter_last_5_minutes(intake_events)
-        users_live_count = intake_events['user_id'].nunique()
-        return users_live_count
-
-
-    def free_users_live_1(self):
-        # Filter intake events for the app
-        intake_events = self.raw_df[self.raw_df['app_id'] == 'com.oneastro']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        
-        # Get current time and the last minute window
-        current_time = pd.to_datetime('now', utc=True) + pd.DateOffset(hours=5, minutes=30)
-        last_minute_start = current_time - pd.DateOffset(minutes=1)
-        
-        # Filter intake events for those within the last minute
-        recent_events = intake_events[intake_events['event_time'] >= last_minute_start]
-        
-        # Get unique users active in the last minute
-        active_users = recent_events['user_id'].unique()
-        
-        # Assuming you have a dataframe `chats_df` for chat data
-        # Find the last chat for each active user
-        last_chats = self.chats_df[self.chats_df['user_id'].isin(active_users)]
-        
-        # Get the last chat for each user (assuming chat data has a 'timestamp' or 'event_time' field)
-        last_chats = last_chats.sort_values('event_time', ascending=False).drop_duplicates('user_id', keep='first')
-        
-        # Create a new column to categorize users as free, paid, or new
-        last_chats['user_type'] = last_chats['paid'].apply(lambda x: 'paid' if x else 'free')
-        
-        # For users with no chat, mark them as new users
-        active_users_df = pd.DataFrame(active_users, columns=['user_id'])
-        active_users_df = active_users_df.merge(last_chats[['user_id', 'user_type']], on='user_id', how='left')
-        active_users_df['user_type'].fillna('new', inplace=True)
-        
-        # Map the user type to the users in the last minute
-        user_counts = recent_events.groupby(['date', 'hour', 'minute'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
-        
-        # Adding user type information
-        user_counts['user_type'] = user_counts['user_id'].map(active_users_df.set_index('user_id')['user_type'])
-        
-        return user_counts
-
-
-    def paid_users_live_1(self):
-        # intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
-        intake_events = self.raw_df[self.raw_df['app_id'] == 'com.oneastro']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        intake_events['minute'] = intake_events['event_time'].dt.minute
-        # Create a new column for 15-minute intervals
-        # intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'minute'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
-        return user_counts
-
-    def new_users_live_1(self):
-        # intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
-        intake_events = self.raw_df[self.raw_df['app_id'] == 'com.oneastro']
-        intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        intake_events['date'] = intake_events['event_time'].dt.date
-        intake_events['hour'] = intake_events['event_time'].dt.hour
-        intake_events['minute'] = intake_events['event_time'].dt.minute
-        # Create a new column for 15-minute intervals
-        # intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
-        
-        user_counts = intake_events.groupby(['date','hour', 'minute'])['user_id'].nunique().reset_index()
-        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
-        return user_counts
-
-    
-    def astros_live_1(self):
-        # Step 1: Sort the events by user_id and event_time (latest first)
-        status_events = self.raw_df[
-            self.raw_df['event_name'].isin(['change_chat_status', 'change_call_status', 'change_multichat_status']) & 
-            (self.raw_df['app_id'] == "com.oneastrologer")
-        ]
-        
-        status_events['event_time'] = pd.to_datetime(status_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        
-        # Sort by user_id and event_time (latest first)
-        status_events = status_events.sort_values(by=['user_id', 'event_time'], ascending=[True, False])
-        
-        # Step 2: Drop duplicates and keep the most recent event for each user
-        latest_status_events = status_events.drop_duplicates(subset=['user_id'], keep='first')
-        
-        # Step 3: Check if the latest event for each user has the required conditions for being live
-        latest_status_events['isSilent'] = latest_status_events['isSilent'].fillna(0)
-        latest_status_events['is_live'] = (latest_status_events['status'] == 'ON') & (latest_status_events['isSilent'] == 0)
-        active_astros_count = latest_status_events['is_live'].sum()
-        
-        return active_astros_count
-
-    def multichat_enabled(self):
-        status_events = self.raw_df[
-            self.raw_df['event_name'].isin(['change_multichat_status']) & 
-            (self.raw_df['app_id'] == "com.oneastrologer")
-        ]
-        
-        status_events['event_time'] = pd.to_datetime(status_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        status_events = status_events.sort_values(by=['user_id', 'event_time'], ascending=[True, False])
-        latest_status_events = status_events.drop_duplicates(subset=['user_id'], keep='first')
-        latest_status_events['isSilent'] = latest_status_events['isSilent'].fillna(0)
-        latest_status_events['is_live'] = (latest_status_events['status'] == 'ON') & (latest_status_events['isSilent'] == 0)
-        active_astros_count = latest_status_events['is_live'].sum()
-        return active_astros_count
-
-    def chat_call_enabled(self):
-        status_events = self.raw_df[
-            self.raw_df['event_name'].isin(['change_chat_status', 'change_call_status']) & 
-            (self.raw_df['app_id'] == "com.oneastrologer")
-        ]
-        
-        status_events['event_time'] = pd.to_datetime(status_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
-        status_events = status_events.sort_values(by=['user_id', 'event_time'], ascending=[True, False])
-        latest_status_events = status_events.drop_duplicates(subset=['user_id'], keep='first')
-        latest_status_events['isSilent'] = latest_status_events['isSilent'].fillna(0)
-        latest_status_events['is_live'] = (latest_status_events['status'] == 'ON') & (latest_status_events['isSilent'] == 0)
-        active_astros_count = latest_status_events['is_live'].sum()  # This will give the total count of live astrologers
-        return active_astros_count
-
-astro_df = pd.read_csv('https://github.com/Jay5973/North-Star-Metrix/blob/main/astro_type.csv?raw=true')
+    return [
+        (lower, upper, estimate_query_bytes(events_query(lower.strftime(BQ_DATETIME_FORMAT), upper.strftime(BQ_DATETIME_FORMAT))))
+        for lower, upper in store.pending_ranges()
+    ]
+
+
+event_store = get_event_store(start_date_str, end_date_str, fetch_key())
+if not event_store.loaded:
+    estimates = estimate_refresh(event_store)
+    aggregate_bytes = 0
+    if SQL_PAGE_METRICS:
+        aggregate_bytes = estimate_query_bytes(compile_metrics_query(SQL_PAGE_METRICS, start_date_str, end_date_str))
+    estimated_bytes = sum(num_bytes for _, _, num_bytes in estimates) + aggregate_bytes
+    st.sidebar.info(
+        f"Estimated scan for this range: {format_bytes(estimated_bytes)} "
+        f"(~${estimated_bytes / 1024 ** 4 * PRICE_PER_TIB:.2f})"
+    )
+
+    if MAX_BYTES_BILLED and estimated_bytes > MAX_BYTES_BILLED:
+        # Oldest uncached ranges go first; the open tail is always the last estimate
+        dropped = []
+        while BYTES_GUARD == "downgrade" and len(estimates) > 1 and estimated_bytes > MAX_BYTES_BILLED:
+            dropped.append(estimates.pop(0))
+            estimated_bytes -= dropped[-1][2]
+        if estimated_bytes > MAX_BYTES_BILLED:
+            st.error(
+                f"This range would scan about {format_bytes(estimated_bytes)}, more than the "
+                f"{format_bytes(MAX_BYTES_BILLED)} limit. Pick a shorter range."
+            )
+            st.stop()
+        start_date_str = dropped[-1][1].strftime(BQ_DATETIME_FORMAT)
+        st.sidebar.warning(f"Range shortened to start at {start_date_str} UTC to stay under the bytes limit.")
+        event_store = get_event_store(start_date_str, end_date_str, fetch_key())
+
+combined_df = event_store.refresh(fetch_events)
+# combined_df
+
+astro_df = pd.read_csv(setting("astro_csv", 'https://github.com/Jay5973/North-Star-Metrix/blob/main/astro_type.csv?raw=true'))
 
 # Step 4: Process Data
-processor = UniqueUsersProcessor(combined_df, astro_df)
+# The rollups of mergeable metrics live as long as the range: each refresh rebuilds only the buckets of its
+# refetched tail and merges them in, and reruns on the same data (e.g. a different trend grain) only merge buckets.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_incremental_rollups(start_date_str, end_date_str, fetch_key, hll_precision):
+    return IncrementalRollups(FETCHED_METRICS, precision=hll_precision)
+
+
+# The processor, and the rollups of the metrics that can't be merged across refreshes, per version of the
+# event frame. The live cards below still recompute every run.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_processor(data_version, hll_precision, _events, _astro_df, _ids, _presence, _merged_names):
+    processor = UniqueUsersProcessor(_events, _astro_df, ids=_ids, presence=_presence)
+    names = [name for name in FETCHED_METRICS if name not in _merged_names]
+    return processor, build_rollups(processor, names, precision=hll_precision)
+
+
+incremental_rollups = get_incremental_rollups(start_date_str, end_date_str, fetch_key(), HLL_PRECISION)
+merged_rollups = incremental_rollups.update(combined_df, event_store.ids, event_store.overlap)
+data_version = (fetch_key(), start_date_str, end_date_str, str(event_store.watermark), len(combined_df))
+processor, rebuilt_rollups = get_processor(
+    data_version, HLL_PRECISION, combined_df, astro_df, event_store.ids, event_store.presence, incremental_rollups.names,
+)
+rollups = RollupStore.combined([merged_rollups, rebuilt_rollups])
+metrics = run_planned_metrics(processor, FETCHED_METRICS, rollups=rollups)
+metrics.update(run_sql_metrics(lambda query: ipc_to_frame(run_query_arrow(query)), SQL_PAGE_METRICS, start_date_str, end_date_str))
+
+with st.sidebar.expander("Query cost"):
+    query_stats = query_log.to_frame()
+    st.write(
+        f"{len(query_stats)} queries, {format_bytes(query_stats['bytes_billed'].sum())} billed, "
+        f"{query_stats['slot_ms'].sum() / 1000:.1f} slot-seconds"
+    )
+    st.dataframe(query_stats.tail(20).iloc[::-1])
+
+with st.sidebar.expander("Memory"):
+    st.write(f"{len(combined_df)} events in memory, {combined_df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB")
+    if 'memory_report' in st.session_state:
+        st.caption("Last fetch, before and after compacting dtypes")
+        st.dataframe(st.session_state['memory_report'])
+
+if HLL_PRECISION is not None:
+    st.sidebar.caption(f"Distinct counts are HyperLogLog estimates (±{hll_error(HLL_PRECISION):.1%} standard error)")
 
 
 import streamlit as st
 from streamlit_card import card
 
 # # Get data for the cards
-live_astros_busy = processor.astros_busy_1()
+live_astros_busy = metrics['astros_busy_1']
 # live_astros_busy_str = str(live_astros_busy['astros_busy_live'].tail(1).values[0])
 
-live_users_live = processor.users_live_1()
+live_users_live = metrics['users_live_1']
 # live_users_live_str = str(live_users_live['users_live'].tail(1).values[0])
 
-astros_live_1 = processor.astros_live_1()
+astros_live_1 = metrics['astros_live_1']
 astros_live_1_str = str(astros_live_1)
 
-live_users_busy = processor.users_busy_1()
+live_users_busy = metrics['users_busy_1']
 # live_users_busy_int = int(live_users_busy['users_busy_live'].tail(1).values[0])
 busy_slots = live_users_busy
 busy_slots_str = str(busy_slots)
 
-total_slots = processor.multichat_enabled() * 2 + processor.chat_call_enabled() - busy_slots
+total_slots = metrics['multichat_enabled'] * 2 + metrics['chat_call_enabled'] - busy_slots
 total_slots_str = str(total_slots)
 
 
@@ -875,74 +423,48 @@ with col5:
     )
 
 
-# Process each event type
-intake_data = processor.process_chat_intake_requests()
-accepted_data = processor.process_chat_accepted_events()
-completed_data = processor.process_chat_completed_events()
-paid_completed_data = processor.process_paid_chat_completed_events()
-cancelled = processor.process_chat_cancels()
-cancel_time = processor.cancellation_time()
-overall_chat_completed = processor.process_overall_chat_completed_events()
-overall_chat_intakes = processor.process_overall_chat_intake_requests()
-overall_chat_accepts = processor.process_overall_chat_accepted_events()
-astro_live = processor.astros_live()
-users_live = processor.users_live()
-profile_creation = processor.process_overall_profile_creation()
-app_installs = processor.process_overall_app_install()
-wallet_recharge_users = processor.process_overall_wallet_recharge_users()
-wallet_recharge_count = processor.process_overall_wallet_recharge_count()
-wallet_recharge_amount = processor.process_overall_wallet_recharge_amount()
-accept_time = processor.overall_accept_time()
-overall_chat_completed_15 = processor.process_overall_chat_completed_events_15()
-overall_chat_intakes_15 = processor.process_overall_chat_intake_requests_15()
-overall_chat_accepts_15 = processor.process_overall_chat_accepted_events_15()
-astro_live_15 = processor.astros_live_15()
-users_live_15 = processor.users_live_15()
-profile_creation_15 = processor.process_overall_profile_creation_15()
-app_installs_15 = processor.process_overall_app_install_15()
-wallet_recharge_users_15 = processor.process_overall_wallet_recharge_users_15()
-wallet_recharge_count_15 = processor.process_overall_wallet_recharge_count_15()
-wallet_recharge_amount_15 = processor.process_overall_wallet_recharge_amount_15()
-astros_busy_15 = processor.astros_busy_15()
-accept_time_15 = processor.overall_accept_time_15()
-astros_busy = processor.astros_busy()
-
-# accept_time_15 = processor.overall_accept_time()
+# Metric frames of each table, in column order. combine_metrics aligns them on their keys in one step.
+ASTRO_HOURLY_METRICS = [
+    'process_chat_intake_requests',
+    'process_chat_accepted_events',
+    'process_chat_completed_events',
+    'process_paid_chat_completed_events',
+    'process_chat_cancels',
+    'cancellation_time',
+]
+OVERALL_HOURLY_METRICS = [
+    'users_live',
+    'astros_live',
+    'astros_busy',
+    'process_overall_app_install',
+    'process_overall_profile_creation',
+    'process_overall_chat_intake_requests',
+    'process_overall_chat_accepted_events',
+    'process_overall_chat_completed_events',
+    'process_overall_wallet_recharge_users',
+    'process_overall_wallet_recharge_count',
+    'process_overall_wallet_recharge_amount',
+    'overall_accept_time',
+]
+OVERALL_15_METRICS = [
+    'users_live_15',
+    'astros_live_15',
+    'astros_busy_15',
+    'process_overall_app_install_15',
+    'process_overall_profile_creation_15',
+    'process_overall_chat_intake_requests_15',
+    'process_overall_chat_accepted_events_15',
+    'process_overall_chat_completed_events_15',
+    'process_overall_wallet_recharge_count_15',
+    'process_overall_wallet_recharge_users_15',
+    'process_overall_wallet_recharge_amount_15',
+    'overall_accept_time_15',
+]
 
 # Combine results
-final_results = intake_data
-final_results = pd.merge(final_results, accepted_data, on=['_id', 'date', 'hour'], how='outer')
-final_results = pd.merge(final_results, completed_data, on=['_id', 'date', 'hour'], how='outer')
-final_results = pd.merge(final_results, paid_completed_data, on=['_id', 'date', 'hour'], how='outer')
-final_results = pd.merge(final_results, cancelled, on=['_id', 'date', 'hour'], how='outer')
-final_results = pd.merge(final_results, cancel_time, on=['_id', 'date', 'hour'], how='outer')
-
-final_overall = users_live
-final_overall = pd.merge(final_overall, astro_live, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, astros_busy, on = ['date','hour'],how = 'outer')
-final_overall = pd.merge(final_overall, app_installs, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, profile_creation, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, overall_chat_intakes, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, overall_chat_accepts, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, overall_chat_completed, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, wallet_recharge_users, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, wallet_recharge_count, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, wallet_recharge_amount, on=['date', 'hour'], how='outer')
-final_overall = pd.merge(final_overall, accept_time, on = ['date','hour'],how = 'outer')
-
-
-fifteen_overall = users_live_15
-fifteen_overall = pd.merge(fifteen_overall, astro_live_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, astros_busy_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, app_installs_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, profile_creation_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, overall_chat_intakes_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, overall_chat_accepts_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, overall_chat_completed_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, wallet_recharge_count_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, wallet_recharge_users_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, wallet_recharge_amount_15, on=['date', 'hour', 'interval'], how='outer')
-fifteen_overall = pd.merge(fifteen_overall, accept_time_15, on = ['date', 'hour','interval'],how = 'outer')
+final_results = combine_metrics([metrics[name] for name in ASTRO_HOURLY_METRICS], ['_id', 'date', 'hour'])
+final_overall = combine_metrics([metrics[name] for name in OVERALL_HOURLY_METRICS], ['date', 'hour'])
+fifteen_overall = combine_metrics([metrics[name] for name in OVERALL_15_METRICS], ['date', 'hour', 'interval'])
 
 # Merge with astro data and display final data
 merged_data = processor.merge_with_astro_data(final_results)
@@ -1074,6 +596,62 @@ fig4.update_layout(xaxis_title="Hour", yaxis_title="Count")
 fig4.update_traces(connectgaps=False)
 st.plotly_chart(fig4)
 
+# Overall counts at any grain, merged from the 5-minute rollups
+TREND_GRAINS = {'5 minutes': '5', '15 minutes': '15', 'Hour': 'hour', 'Day': 'day'}
+trend_grain = st.sidebar.selectbox("Trend grain", list(TREND_GRAINS), index=1)
+trend_names = [
+    name for name in FETCHED_METRICS
+    if name in rollups.rollups and isinstance(SQL_METRICS[name], AggMetric)
+    and SQL_METRICS[name].grain == 'hour' and SQL_METRICS[name].by is None
+]
+if trend_names:
+    trend = rollups.table(trend_names, TREND_GRAINS[trend_grain])
+    trend['period'] = trend['date'].astype(str)
+    if 'hour' in trend:
+        trend['period'] += ' ' + (trend['interval'] if 'interval' in trend else trend['hour'].astype(str) + ':00')
+    fig5 = px.line(trend, x='period', y=[SQL_METRICS[name].column for name in trend_names], title=f"Overall Metrics by {trend_grain}")
+    fig5.update_layout(xaxis_title=trend_grain, yaxis_title="Count")
+    fig5.update_traces(connectgaps=False)
+    st.plotly_chart(fig5)
+
+# Astrologers online and the chat slots they offered, from their status changes rather than open_page counts
+availability = processor.availability(TREND_GRAINS[trend_grain])
+if not availability.empty:
+    availability['period'] = availability['date'].astype(str)
+    if 'hour' in availability:
+        availability['period'] += ' ' + (availability['interval'] if 'interval' in availability else availability['hour'].astype(str) + ':00')
+    fig6 = px.line(availability, x='period', y=['astros_online', 'multichat_slots', 'chat_capacity'], title=f"Astrologer Availability by {trend_grain}")
+    fig6.update_layout(xaxis_title=trend_grain, yaxis_title="Mean over the period")
+    st.plotly_chart(fig6)
+
+# Minutes from each intake to its nearest following accept / cancel by hour: the mean and its percentiles side
+# by side, one table per latency, from whichever backend computed them
+latency_names = {}
+for name in PAGE_METRICS:
+    spec = SQL_METRICS.get(name)
+    if name in metrics and isinstance(spec, LatencyMetric) and spec.grain == 'hour':
+        latency_names.setdefault((spec.start_event, spec.end_event, tuple(spec.on), spec.by), []).append(name)
+for names in latency_names.values():
+    by = SQL_METRICS[names[0]].by
+    frames = [metrics[name] for name in names]
+    latency = combine_metrics(frames, [column for column in ['_id', 'date', 'hour'] if column in frames[0]])
+    if by is not None:
+        latency = pd.merge(latency, astro_df[['_id', 'name']], on='_id', how='left')
+    st.write(f"{SQL_METRICS[names[0]].column.replace('_', ' ').title()} (minutes) by Hour")
+    st.dataframe(latency.sort_index(ascending=False))
+
+# Waiting-list entries through intake -> accept -> call accept -> messages, linked once per processor
+st.write(f"Chat Funnel by {trend_grain}")
+st.dataframe(processor.chat_funnel(TREND_GRAINS[trend_grain]).sort_index(ascending=False))
+astro_funnel = pd.merge(processor.chat_funnel('day', by='astrologerId'), astro_df[['_id', 'name', 'type']], on='_id', how='left')
+st.write("Chat Funnel by Astrologer and Day")
+st.dataframe(astro_funnel)
+
+# Every astrologer's last chat / call / multichat status, kept up to date by the event store
+astro_status = pd.merge(processor.presence().snapshot(), astro_df[['_id', 'name', 'type']], on='_id', how='left')
+st.write("Astrologer Status")
+st.dataframe(astro_status.sort_values('last_change', ascending=False))
+
 # st.write('### Live Data')
 # st.dataframe(fifteen_overall)
 
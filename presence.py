@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+
+STATE_COLUMNS = ['user_id', 'event_name', 'status', 'isSilent', 'event_time']
+
+
+class PresenceStore:
+    """
+    Every astrologer's latest status of each kind (one of `status_events`, e.g.
+    change_chat_status), with its isSilent flag and time: one state row per
+    (user_id, event_name), kept in event_time order.
+
+    update() folds in new events and keeps, per key, the latest event seen so
+    far. That makes it order-independent and idempotent, so an EventStore can
+    feed it every refresh's tail, overlap and late events included. The live
+    status counts then read O(#astrologers) state rows instead of sorting every
+    status event.
+    """
+
+    def __init__(self, status_events, app_id):
+        self.status_events = list(status_events)
+        self.app_id = app_id
+        self.state = pd.DataFrame({column: pd.Series(dtype=object) for column in STATE_COLUMNS})
+
+    def update(self, events):
+        """
+        Fold the status events among `events` (any event frame) into the state.
+        """
+        if events.empty or not {'event_name', 'app_id', 'user_id', 'status', 'event_time'} <= set(events):
+            return
+        rows = events[events['event_name'].isin(self.status_events) & (events['app_id'] == self.app_id) & events['user_id'].notna()]
+        if rows.empty:
+            return
+        rows = pd.DataFrame({
+            'user_id': rows['user_id'].astype(object),
+            'event_name': rows['event_name'].astype(object),
+            'status': rows['status'].astype(object),
+            'isSilent': (rows['isSilent'].fillna(0) if 'isSilent' in rows else 0),
+            'event_time': rows['event_time'],
+        })
+        state = pd.concat([self.state, rows], ignore_index=True) if len(self.state) else rows
+        # Stable, so among events at the same time the one seen last wins
+        state = state.sort_values('event_time', kind='stable')
+        self.state = state.drop_duplicates(['user_id', 'event_name'], keep='last').reset_index(drop=True)
+
+    def latest(self, status_events=None):
+        """
+        One row per astrologer: its most recent status among `status_events` (all
+        kinds by default).
+        """
+        state = self.state
+        if status_events is not None:
+            state = state[state['event_name'].isin(status_events)]
+        return state.drop_duplicates('user_id', keep='last')
+
+    def live_count(self, status_events=None):
+        """
+        Astrologers whose latest status among `status_events` is ON and not silent.
+        """
+        latest = self.latest(status_events)
+        return int(((latest['status'] == 'ON') & (latest['isSilent'] == 0)).sum())
+
+    def snapshot(self):
+        """
+        One row per astrologer (_id): its last status of each kind, whether its
+        latest status change was silent, and when that change happened.
+        """
+        statuses = self.state.pivot(index='user_id', columns='event_name', values='status')
+        latest = self.latest().set_index('user_id')
+        snapshot = statuses.reindex(columns=self.status_events).assign(
+            isSilent=latest['isSilent'], last_change=latest['event_time'],
+        )
+        return snapshot.rename_axis(index='_id', columns=None).reset_index()
+
+
+def status_intervals(events, status_events, end):
+    """
+    On intervals of every astrologer from its events among `status_events`:
+    each event turns it on (status ON and not silent) or off until its next such
+    event, the last one until `end`. Returns user_id, start, end (all from
+    event_time), one row per run of consecutive on events. An astrologer counts
+    as off before its first event in `events`.
+    """
+    rows = events[events['event_name'].isin(status_events) & events['user_id'].notna()]
+    if rows.empty:
+        return pd.DataFrame({'user_id': pd.Series(dtype=object), 'start': rows['event_time'], 'end': rows['event_time']})
+    rows = rows.sort_values(['user_id', 'event_time'], kind='stable')
+    users = rows['user_id'].to_numpy()
+    times = rows['event_time'].to_numpy()
+    on = ((rows['status'] == 'ON') & (rows['isSilent'].fillna(0) == 0)).to_numpy()
+    same_user_next = np.r_[users[1:] == users[:-1], False]
+    stops = np.where(same_user_next, np.r_[times[1:], times[-1:]], np.asarray(end, dtype=times.dtype))
+    # A run of on events starts where the previous row is another user's or off, and ends likewise at the next
+    run_start = on & ~np.r_[False, same_user_next[:-1] & on[:-1]]
+    run_end = on & ~(same_user_next & np.r_[on[1:], False])
+    return pd.DataFrame({'user_id': users[run_start], 'start': times[run_start], 'end': stops[run_end]})
+
+
+def sweep_buckets(starts, ends, weights, lower, upper, step):
+    """
+    Sweep of the intervals [starts, ends) (int64 times, e.g. nanoseconds), each
+    adding its weight to the running level while open, over the `step`-wide
+    buckets of [lower, upper): +weight at every start, -weight at every end,
+    with the bucket boundaries as extra points so no stretch of the level
+    crosses a bucket. Returns (bucket numbers, i.e. time // step, the width of
+    [lower, upper) in each bucket, the area under the level in each); area /
+    width is the bucket's time-weighted mean level.
+    """
+    first, last = lower // step, (upper - 1) // step
+    boundaries = np.arange(first, last + 2) * step
+    starts, ends = np.clip(starts, lower, upper), np.clip(ends, lower, upper)
+    # upper as a point too, so the last stretch inside stops there
+    points = np.concatenate([starts, ends, boundaries, [upper]])
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), starts.shape)
+    deltas = np.concatenate([weights, -weights, np.zeros(len(boundaries) + 1)])
+    order = np.argsort(points, kind='stable')
+    points, levels = points[order], np.cumsum(deltas[order])
+    widths = np.diff(points, append=points[-1])
+    # Only the sweep inside [lower, upper) counts
+    inside = (points >= lower) & (points < upper)
+    buckets = points[inside] // step - first
+    area = np.bincount(buckets, weights=levels[inside] * widths[inside], minlength=last - first + 1)
+    covered = np.minimum(boundaries[1:], upper) - np.maximum(boundaries[:-1], lower)
+    return np.arange(first, last + 1), covered, area
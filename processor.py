@@ -0,0 +1,798 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from event_frame import IdTable, code_column, encode_ids
+from event_query import EventNeed
+from presence import PresenceStore, status_intervals, sweep_buckets
+
+
+ASTRO_APP = 'com.oneastrologer'
+USER_APPS = ('com.oneastro', 'com.oneastrotelugu')
+STATUS_EVENTS = ('change_chat_status', 'change_call_status', 'change_multichat_status')
+
+# What each UniqueUsersProcessor method without a spec in sql_backend.SQL_METRICS reads from the events
+# table; sql_backend.METRIC_EVENTS adds the specs' own, derived from them. The query builder fetches
+# exactly the union of these for the metrics a page computes.
+METHOD_EVENTS = {
+    # Chat funnel, at any grain
+    'chat_funnel': [
+        EventNeed(['chat_intake_submit'], None, ['astrologerId', 'waitingListId']),
+        EventNeed(['accept_chat'], None, ['waitingListId', 'chatSessionId']),
+        EventNeed(['chat_call_accept', 'chat_msg_send'], None, ['chatSessionId']),
+    ],
+
+    # Availability timeline, at any grain
+    'availability': [EventNeed(STATUS_EVENTS, [ASTRO_APP], ['app_id', 'user_id', 'status', 'isSilent'])],
+
+    # Live cards
+    'astros_busy_1': [EventNeed(['chat_msg_send'], None, ['app_id', 'astrologerId', 'user_id'])],
+    'users_busy_1': [EventNeed(['chat_msg_send'], None, ['chatSessionId'])],
+    'users_live_1': [EventNeed(None, USER_APPS, ['app_id', 'user_id'])],
+    'astros_live_1': [EventNeed(STATUS_EVENTS, [ASTRO_APP], ['app_id', 'user_id', 'status', 'isSilent'])],
+    'multichat_enabled': [EventNeed(['change_multichat_status'], [ASTRO_APP], ['app_id', 'user_id', 'status', 'isSilent'])],
+    'chat_call_enabled': [
+        EventNeed(['change_chat_status', 'change_call_status'], [ASTRO_APP], ['app_id', 'user_id', 'status', 'isSilent']),
+    ],
+}
+
+
+def get_15_minute_interval(hour, minute):
+    """
+    Given an hour and minute, return the corresponding 15-minute interval.
+    """
+    if 0 <= minute < 15:
+        return f"{hour}:00-15"
+    elif 15 <= minute < 30:
+        return f"{hour}:15-30"
+    elif 30 <= minute < 45:
+        return f"{hour}:30-45"
+    else:
+        return f"{hour}:45-60"
+
+def get_5_minute_interval(hour, minute):
+    """
+    Given an hour and minute, return the corresponding 5-minute interval.
+    """
+    if 0 <= minute < 5:
+        return f"{hour}:00-05"
+    elif 5 <= minute < 10:
+        return f"{hour}:05-10"
+    elif 10 <= minute < 15:
+        return f"{hour}:10-15"
+    elif 15 <= minute < 20:
+        return f"{hour}:15-20"
+    elif 20 <= minute < 25:
+        return f"{hour}:20-25"
+    elif 25 <= minute < 30:
+        return f"{hour}:25-30"
+    elif 30 <= minute < 35:
+        return f"{hour}:30-35"
+    elif 35 <= minute < 40:
+        return f"{hour}:35-40"
+    elif 40 <= minute < 45:
+        return f"{hour}:40-45"
+    elif 45 <= minute < 50:
+        return f"{hour}:45-50"
+    elif 50 <= minute < 55:
+        return f"{hour}:50-55"
+    else:
+        return f"{hour}:55-60"
+
+
+IST_TIMEZONE = 'Asia/Kolkata'
+NANOS_PER_MINUTE = 60 * 10 ** 9
+NANOS_PER_DAY = 24 * 60 * NANOS_PER_MINUTE
+
+
+def bucket_ids(local_time, minutes):
+    """
+    Integer id of the `minutes`-wide bucket of its day each (naive, local)
+    timestamp falls in, by floor arithmetic on the nanosecond values: with
+    minutes=15, 14:20 is bucket 57. Vectorized replacement for applying
+    get_15_minute_interval / get_5_minute_interval row by row.
+    """
+    nanos = np.asarray(local_time, dtype='datetime64[ns]').view('int64')
+    ids = (nanos % NANOS_PER_DAY) // (minutes * NANOS_PER_MINUTE)
+    return pd.Series(ids.astype('int16'), index=getattr(local_time, 'index', None))
+
+
+def interval_label(bucket, minutes):
+    start = bucket * minutes
+    return f"{start // 60}:{start % 60:02d}-{start % 60 + minutes:02d}"
+
+
+def interval_labels(buckets, minutes=15):
+    """
+    "14:15-30" style labels (as get_15_minute_interval writes them) for bucket ids
+    from bucket_ids, formatting each distinct bucket once. `minutes` should divide
+    an hour.
+    """
+    buckets = pd.Series(buckets)
+    labels = {bucket: interval_label(bucket, minutes) for bucket in buckets.unique()}
+    return buckets.map(labels)
+
+
+def combine_metrics(frames, keys):
+    """
+    One wide frame of metric frames that share the key columns `keys` (e.g. date,
+    hour), with the same rows, order and columns as chaining pd.merge(how='outer')
+    over them: every frame is indexed once and all are aligned in a single concat,
+    so the cost grows linearly with the number of metrics.
+    """
+    combined = pd.concat([frame.set_index(keys) for frame in frames], axis=1, join='outer')
+    return combined.sort_index().reset_index()
+
+
+# The chat lifecycle, linked once per processor (see UniqueUsersProcessor.chat_lifecycle)
+ChatLifecycle = namedtuple('ChatLifecycle', ['accepts', 'entries'])
+# A waiting-list entry's way through a chat, in order: each stage implies the ones before it
+FUNNEL_STAGES = ('intake', 'accepted', 'call_accepted', 'messaged')
+# Availability timeline columns, counted as the live status cards count astrologers:
+# (the status events read, chat slots per astrologer that is on)
+AVAILABILITY = {
+    'astros_online': (STATUS_EVENTS, 1),
+    'multichat_slots': (('change_multichat_status',), 2),
+    'chat_call_slots': (('change_chat_status', 'change_call_status'), 1),
+}
+# Time keys below the day, per grain (the grains of rollups.GRAIN_MINUTES)
+GRAIN_KEYS = {'5': ['hour', 'bucket_5'], '15': ['hour', 'bucket_15'], 'hour': ['hour'], 'day': []}
+
+
+# How far after a start event its end event may come and still be paired with it
+LATENCY_LOOKAHEAD = pd.Timedelta(hours=1)
+
+
+def pair_latencies(starts, ends, on, within=LATENCY_LOOKAHEAD):
+    """
+    Each start event paired with the nearest end event at or after it (at most
+    `within` later) that has the same `on` ids, with the minutes in between in a
+    'latency' column; starts without one are dropped. An as-of join over both
+    sides sorted by time, so a user retrying five times yields five pairs rather
+    than 25 start/end combinations, and rows and memory stay linear in events.
+    """
+    keys = [code_column(column) for column in on]
+    starts = starts[(starts[keys] >= 0).all(axis=1)].sort_values('event_time', kind='stable')
+    ends = ends[(ends[keys] >= 0).all(axis=1)]
+    ends = pd.DataFrame({**{key: ends[key] for key in keys}, 'end_time': ends['event_time']}).sort_values('end_time', kind='stable')
+    pairs = pd.merge_asof(starts, ends, left_on='event_time', right_on='end_time', by=keys, direction='forward', tolerance=within)
+    pairs = pairs[pairs['end_time'].notna()].reset_index(drop=True)
+    pairs['latency'] = (pairs['end_time'] - pairs['event_time']).dt.total_seconds() / 60.0
+    return pairs
+
+
+def _id_codes(events, column):
+    # The distinct id codes of `column` among `events`, none when it wasn't fetched
+    if code_column(column) not in events:
+        return np.empty(0, np.int32)
+    return events[code_column(column)].unique()
+
+
+def enrich_event_times(raw_df):
+    """
+    The events every metric reads, with event_time (naive UTC) converted to IST
+    once and the integer calendar columns they group by: day (days since
+    1970-01-01 in IST), hour, minute and the 5- and 15-minute bucket of the day.
+    """
+    if 'event_time' not in raw_df:
+        return raw_df
+    event_time = pd.to_datetime(raw_df['event_time'], utc=True).dt.tz_convert(IST_TIMEZONE)
+    local_time = event_time.dt.tz_localize(None)
+    minute_of_day = bucket_ids(local_time, 1)
+    return raw_df.assign(
+        event_time=event_time,
+        day=(local_time.to_numpy().astype('datetime64[D]').astype('int64')).astype('int32'),
+        hour=(minute_of_day // 60).astype('int8'),
+        minute=(minute_of_day % 60).astype('int8'),
+        bucket_5=bucket_ids(local_time, 5),
+        bucket_15=bucket_ids(local_time, 15),
+    )
+
+
+    # Step 3: Process Events to Calculate Unique Users
+# The methods with a spec in sql_backend.SQL_METRICS are kept as its reference implementations only: pages compute
+# those metrics with metric_planner.run_planned_metrics, and tests/test_metric_planner.py checks the two agree.
+class UniqueUsersProcessor:
+    def __init__(self, raw_df,astro_df, ids=None, presence=None):
+        self.raw_df = raw_df
+        # Id codes for the rollups (see encode_ids); an EventStore's table has already encoded its frame
+        self.ids = ids if ids is not None else IdTable()
+        self.events = encode_ids(enrich_event_times(raw_df), self.ids)
+        self._chat_lifecycle = None
+        self._latency_pairs = {}
+        # An EventStore's PresenceStore is already up to date with raw_df
+        self._presence = presence
+        self.astro_df = astro_df
+        # Row positions of every (event_name, app_id) pair, from one pass over the events
+        self.partitions = {}
+        if 'event_name' in self.events:
+            # app_id is only fetched when some metric filters on it
+            app_id = self.events['app_id'] if 'app_id' in self.events else pd.Series(None, index=self.events.index, dtype=object)
+            self.partitions = self.events.groupby(
+                [self.events['event_name'], app_id], observed=True, dropna=False, sort=False
+            ).indices
+
+    def _events(self, event_names=None, app_ids=None):
+        """
+        The enriched events named one of `event_names` from one of `app_ids` (None
+        means any), in their original order. Looked up in self.partitions instead
+        of scanning the whole frame.
+        """
+        if isinstance(event_names, str):
+            event_names = [event_names]
+        parts = [
+            positions for (event_name, app_id), positions in self.partitions.items()
+            if (event_names is None or event_name in event_names) and (app_ids is None or app_id in app_ids)
+        ]
+        if not parts:
+            return self.events.iloc[:0]
+        if len(parts) == 1:
+            return self.events.take(parts[0])
+        return self.events.take(np.sort(np.concatenate(parts)))
+
+    @staticmethod
+    def _dated(counts):
+        # IST day numbers back to datetime.date and bucket ids to "14:15-30" labels, which is what the page merges on and shows
+        counts['day'] = pd.to_datetime(counts['day'], unit='D').dt.date
+        if 'bucket_15' in counts:
+            counts['bucket_15'] = interval_labels(counts['bucket_15'], 15)
+        return counts.rename(columns={'day': 'date', 'bucket_15': 'interval'})
+
+    def filter_last_5_minutes(self, df):
+        current_time = pd.Timestamp.now(tz=IST_TIMEZONE)
+        last_5_min_start = current_time - pd.Timedelta(minutes=5)
+        return df[df['event_time'] >= last_5_min_start]
+
+    def process_chat_intake_requests(self):
+        intake_events = self._events('chat_intake_submit')
+        user_counts = intake_events.groupby(['astrologerId', 'day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'chat_intake_requests', 'astrologerId': '_id'}, inplace=True)
+        return self._dated(user_counts)
+
+    def process_chat_cancels(self):
+        cancel_events = self._events('confirm_cancel_waiting_list')
+        user_counts = cancel_events.groupby(['astrologerId', 'day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'cancelled_requests', 'astrologerId': '_id'}, inplace=True)
+        return self._dated(user_counts)
+
+    def latency_pairs(self, start_event, end_event, on):
+        """
+        pair_latencies of the `start_event` and `end_event` events, computed once
+        per processor and shared by every grain of the same latency.
+        """
+        key = (start_event, end_event, tuple(on))
+        if key not in self._latency_pairs:
+            self._latency_pairs[key] = pair_latencies(self._events(start_event), self._events(end_event), on)
+        return self._latency_pairs[key]
+
+    def cancellation_time(self):
+        pairs = self.latency_pairs('chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId'])
+        avg_time_diff = pairs.groupby(['astrologerId', 'day', 'hour'])['latency'].mean().reset_index()
+        avg_time_diff.rename(columns={'astrologerId': '_id', 'latency': 'cancellation_time'}, inplace=True)
+        return self._dated(avg_time_diff)
+
+    def overall_accept_time(self):
+        # Minutes from each intake to the accept of its waiting-list entry, averaged by the intake's hour
+        pairs = self.latency_pairs('chat_intake_submit', 'accept_chat', ['waitingListId'])
+        avg_time_diff = pairs.groupby(['day', 'hour'])['latency'].mean().reset_index()
+        avg_time_diff.rename(columns={'latency': 'accept_time'}, inplace=True)
+        return self._dated(avg_time_diff)
+
+    def chat_lifecycle(self):
+        """
+        chat_intake_submit -> accept_chat -> chat_call_accept -> chat_msg_send,
+        linked once and shared by every chat metric. `accepts` is the accept_chat
+        events with one flag per check the chat metrics filter on: intake_user,
+        call_accept_user (clientId among the users of those events),
+        call_accepted, paid_call_accepted (chatSessionId among the sessions of
+        chat_call_accept events, paid ones for the latter). `entries` has one row
+        per waiting-list entry, its first intake, with that intake's astrologer
+        and time keys and whether it reached each of FUNNEL_STAGES.
+        """
+        if self._chat_lifecycle is None:
+            self._chat_lifecycle = ChatLifecycle(self._flagged_accepts(), self._funnel_entries())
+        return self._chat_lifecycle
+
+    def _flagged_accepts(self):
+        accepts = self._events('accept_chat')
+        intakes = self._events('chat_intake_submit')
+        call_accepts = self._events('chat_call_accept')
+        paid_call_accepts = call_accepts[call_accepts['paid'] == 1] if 'paid' in call_accepts else call_accepts.iloc[:0]
+        flags = {}
+        # Only the checks whose columns were fetched; the metrics that need the others weren't asked for
+        if 'clientId' in accepts:
+            client_ids = accepts[code_column('clientId')]
+            flags['intake_user'] = client_ids.isin(_id_codes(intakes, 'user_id'))
+            flags['call_accept_user'] = client_ids.isin(_id_codes(call_accepts, 'user_id'))
+        if 'chatSessionId' in accepts:
+            sessions = accepts[code_column('chatSessionId')]
+            flags['call_accepted'] = sessions.isin(_id_codes(call_accepts, 'chatSessionId'))
+            flags['paid_call_accepted'] = sessions.isin(_id_codes(paid_call_accepts, 'chatSessionId'))
+        return accepts.assign(**flags)
+
+    def _funnel_entries(self):
+        waiting_list = code_column('waitingListId')
+        session = code_column('chatSessionId')
+        chat_events = self._events(['chat_intake_submit', 'accept_chat'])
+        columns = ['astrologerId', 'day', 'hour', 'bucket_5', 'bucket_15', waiting_list]
+        if waiting_list not in chat_events or not set(columns) <= set(chat_events):
+            return pd.DataFrame(columns=columns + list(FUNNEL_STAGES))
+        # One sort by time, so the first intake and first accept of every entry are its first rows
+        chat_events = chat_events[chat_events[waiting_list] >= 0].sort_values('event_time', kind='stable')
+        is_intake = (chat_events['event_name'] == 'chat_intake_submit').to_numpy()
+        entries = chat_events.loc[is_intake, columns].drop_duplicates(waiting_list, ignore_index=True)
+        accepts = chat_events[~is_intake].drop_duplicates(waiting_list)
+
+        entries['intake'] = True
+        entries['accepted'] = entries[waiting_list].isin(accepts[waiting_list])
+        if session in accepts:
+            sessions = pd.Series(accepts[session].to_numpy(), index=accepts[waiting_list].to_numpy())
+            linked = sessions.reindex(entries[waiting_list].to_numpy()).fillna(-1).to_numpy()
+            entries['call_accepted'] = entries['accepted'] & (linked >= 0) & np.isin(linked, _id_codes(self._events('chat_call_accept'), 'chatSessionId'))
+            entries['messaged'] = entries['call_accepted'] & np.isin(linked, _id_codes(self._events('chat_msg_send'), 'chatSessionId'))
+        else:
+            entries['call_accepted'] = entries['messaged'] = False
+        return entries
+
+    def chat_funnel(self, grain='hour', by=None):
+        """
+        Waiting-list entries reaching each of FUNNEL_STAGES (funnel_intake,
+        funnel_accepted, ...), counted at the time of their intake, at `grain`
+        ('5', '15', 'hour' or 'day'), overall or per astrologer (by='astrologerId').
+        """
+        entries = self.chat_lifecycle().entries
+        keys = ([by] if by is not None else []) + ['day'] + GRAIN_KEYS[grain]
+        counts = entries.groupby(keys)[list(FUNNEL_STAGES)].sum().reset_index()
+        if grain == '5':
+            counts['bucket_5'] = interval_labels(counts['bucket_5'], 5)
+        counts.rename(columns={stage: f"funnel_{stage}" for stage in FUNNEL_STAGES}, inplace=True)
+        counts.rename(columns={'astrologerId': '_id', 'bucket_5': 'interval'}, inplace=True)
+        return self._dated(counts)
+
+    def process_chat_accepted_events(self):
+        accept_events = self.chat_lifecycle().accepts
+        accept_events = accept_events[(accept_events['paid'] == 0) & accept_events['intake_user']]
+        accept_counts = accept_events.groupby(['user_id', 'day', 'hour'])['clientId'].nunique().reset_index()
+        accept_counts.rename(columns={'clientId': 'chat_accepted', 'user_id': '_id'}, inplace=True)
+        return self._dated(accept_counts)
+    
+    def process_chat_completed_events(self):
+        accept_events = self.chat_lifecycle().accepts
+        accept_events = accept_events[(accept_events['paid'] == 0) & accept_events['call_accepted']]
+        accept_counts = accept_events.groupby(['user_id', 'day', 'hour'])['clientId'].nunique().reset_index()
+        accept_counts.rename(columns={'clientId': 'chat_completed', 'user_id': '_id'}, inplace=True)
+        return self._dated(accept_counts)
+    
+    def process_paid_chat_completed_events(self):
+        # A missing paid flag counts as paid (it was NaN != 0 before flags became nullable Int8)
+        accept_events = self.chat_lifecycle().accepts
+        accept_events = accept_events[(accept_events['paid'] != 0).fillna(True) & accept_events['paid_call_accepted']]
+        accept_counts = accept_events.groupby(['user_id', 'day', 'hour'])['clientId'].nunique().reset_index()
+        accept_counts.rename(columns={'clientId': 'paid_chats_completed', 'user_id': '_id'}, inplace=True)
+        return self._dated(accept_counts)
+
+    # def process_chat_completed_events1(self):
+    #     completed_events = self.completed_df[(self.completed_df['status'] == 'COMPLETED') & (self.completed_df['type'].isin(['FREE', 'PAID']))]
+    #     completed_events['createdAt'] = pd.to_datetime(completed_events['createdAt'], utc=True)
+    #     completed_events['date'] = completed_events['createdAt'].dt.date
+    #     completed_events['hour'] = completed_events['createdAt'].dt.hour
+    #     completed_counts = completed_events.groupby(['astrologerId', 'date', 'hour'])['userId'].nunique().reset_index()
+    #     completed_counts.rename(columns={'userId': 'chat_completed', 'astrologerId': '_id'}, inplace=True)
+    #     return completed_counts
+
+    # def process_paid_chat_completed_events1(self):
+    #     paid_events = self.completed_df[(self.completed_df['status'] == 'COMPLETED') & (self.completed_df['type'] == 'PAID')]
+    #     paid_events['createdAt'] = pd.to_datetime(paid_events['createdAt'], utc=True)
+    #     paid_events['date'] = paid_events['createdAt'].dt.date
+    #     paid_events['hour'] = paid_events['createdAt'].dt.hour
+    #     paid_counts = paid_events.groupby(['astrologerId', 'date', 'hour'])['userId'].nunique().reset_index()
+    #     paid_counts.rename(columns={'userId': 'paid_chats_completed', 'astrologerId': '_id'}, inplace=True)
+    #     return paid_counts
+
+    def merge_with_astro_data(self, final_data):
+        merged_data = pd.merge(final_data, self.astro_df, on='_id', how='left')
+        columns = ['_id', 'name', 'type', 'date', 'hour', 'chat_intake_requests', 'chat_accepted', 'chat_completed','cancelled_requests','cancellation_time', 'paid_chats_completed']
+        return merged_data[columns]
+
+    def merge_with_hour_only(self, final_data):
+        columns = ['date', 'hour', 'chat_intake_overall', 'chat_accepted_overall', 'chat_completed_overall','astros_live']
+        return merged_data[columns]
+    
+    # def process_overall_chat_completed_events1(self):
+    #     completed_events = self.completed_df[(self.completed_df['status'] == 'COMPLETED') & (self.completed_df['type'].isin(['FREE', 'PAID']))]
+    #     completed_events['createdAt'] = pd.to_datetime(completed_events['createdAt'], utc=True)
+    #     completed_events['date'] = completed_events['createdAt'].dt.date
+    #     completed_events['hour'] = completed_events['createdAt'].dt.hour
+    #     completed_counts = completed_events.groupby(['date', 'hour'])['userId'].nunique().reset_index()
+    #     completed_counts.rename(columns={'userId': 'chat_completed_overall'}, inplace=True)
+    #     return completed_counts
+    
+    def process_overall_chat_completed_events(self):
+        # intake_events = self.raw_df[self.raw_df['event_name'] == 'chat_msg_send']
+        # valid_user_ids = intake_events['chatSessionId'].unique()
+        # accept_events = self.raw_df[(self.raw_df['event_name'] == 'accept_chat') & (self.raw_df['chatSessionId'].isin(valid_user_ids))]
+        # accept_events['event_time'] = pd.to_datetime(accept_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
+        # accept_events['date'] = accept_events['event_time'].dt.date
+        # accept_events['hour'] = accept_events['event_time'].dt.hour
+        # accept_counts = accept_events.groupby(['date', 'hour'])['clientId'].nunique().reset_index()
+        # accept_counts.rename(columns={'clientId': 'chat_completed_overall'}, inplace=True)
+        # return accept_counts
+        intake_events = self._events('chat_call_accept')
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'chat_completed_overall'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def process_overall_chat_accepted_events(self):
+        accept_events = self.chat_lifecycle().accepts
+        accept_events = accept_events[accept_events['intake_user']]
+        accept_counts = accept_events.groupby(['day', 'hour'])['clientId'].nunique().reset_index()
+        accept_counts.rename(columns={'clientId': 'chat_accepted_overall'}, inplace=True)
+        return self._dated(accept_counts)
+    
+    def process_overall_chat_intake_requests(self):
+        intake_events = self._events('chat_intake_submit')
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'chat_intake_overall'}, inplace=True)
+        return self._dated(user_counts)
+
+    def process_overall_profile_creation(self):
+        intake_events = self._events('profile_creation')
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'profile_creation'}, inplace=True)
+        return self._dated(user_counts)
+
+    def process_overall_app_install(self):
+        intake_events = self._events('app_install')
+        user_counts = intake_events.groupby(['day', 'hour'])['device_id'].nunique().reset_index()
+        user_counts.rename(columns={'device_id': 'app_installs'}, inplace=True)
+        return self._dated(user_counts)
+
+    def process_overall_wallet_recharge_users(self):
+        intake_events = self._events('razorpay_continue_success')
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'wallet_recharge_users'}, inplace=True)
+        return self._dated(user_counts)
+
+    def process_overall_wallet_recharge_count(self):
+        intake_events = self._events('razorpay_continue_success')
+        user_counts = intake_events.groupby(['day', 'hour'])['orderId'].nunique().reset_index()
+        user_counts.rename(columns={'orderId': 'wallet_recharge_count'}, inplace=True)
+        return self._dated(user_counts)
+
+    def process_overall_wallet_recharge_amount(self):
+        # Filter for the relevant events
+        intake_events = self._events('razorpay_continue_success')
+        
+        # Remove duplicate records based on the same orderId
+        intake_events = intake_events.drop_duplicates(subset='orderId')
+        
+        # Ensure the amount column is numeric
+        intake_events['amount'] = pd.to_numeric(intake_events['amount'], errors='coerce')
+        
+        # Convert event_time to datetime and adjust the timezone
+        
+        # Extract date and hour
+        
+        # Group by date and hour and calculate the sum of amount
+        user_counts = intake_events.groupby(['day', 'hour'])['amount'].sum().reset_index()
+        
+        # Rename the column to wallet_recharge_amount
+        user_counts.rename(columns={'amount': 'wallet_recharge_amount'}, inplace=True)
+        
+        return self._dated(user_counts)
+
+
+
+
+
+    
+    def astros_live(self):
+        intake_events = self._events('open_page', ['com.oneastrologer'])
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'astros_live'}, inplace=True)
+        return self._dated(user_counts)
+
+    def astros_busy(self):
+        intake_events = self._events('chat_msg_send', ['com.oneastrologer'])
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'astros_busy'}, inplace=True)
+        return self._dated(user_counts)
+
+    def users_live(self):
+        intake_events = self._events('open_page', ['com.oneastro'])
+        user_counts = intake_events.groupby(['day', 'hour'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
+        return self._dated(user_counts)
+    
+    # Update the methods to group by 15-minute intervals
+    
+    def process_overall_chat_completed_events_15(self):
+        accept_events = self.chat_lifecycle().accepts
+        accept_events = accept_events[accept_events['call_accepted']]
+        
+        accept_counts = accept_events.groupby(['day','hour', 'bucket_15'])['clientId'].nunique().reset_index()
+        accept_counts.rename(columns={'clientId': 'chat_completed_overall'}, inplace=True)
+        return self._dated(accept_counts)
+    
+    def process_overall_chat_accepted_events_15(self):
+        accept_events = self.chat_lifecycle().accepts
+        accept_events = accept_events[accept_events['call_accept_user']]
+        
+        accept_counts = accept_events.groupby(['day','hour', 'bucket_15'])['clientId'].nunique().reset_index()
+        accept_counts.rename(columns={'clientId': 'chat_accepted_overall'}, inplace=True)
+        return self._dated(accept_counts)
+    
+    def process_overall_chat_intake_requests_15(self):
+        intake_events = self._events('chat_intake_submit')
+
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'chat_intake_overall'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def process_overall_profile_creation_15(self):
+        intake_events = self._events('profile_creation')
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'profile_creation'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def process_overall_app_install_15(self):
+        intake_events = self._events('app_install')
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['device_id'].nunique().reset_index()
+        user_counts.rename(columns={'device_id': 'app_installs'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def process_overall_wallet_recharge_users_15(self):
+        intake_events = self._events('razorpay_continue_success')
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'wallet_recharge_users'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def process_overall_wallet_recharge_count_15(self):
+        intake_events = self._events('razorpay_continue_success')
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['orderId'].nunique().reset_index()
+        user_counts.rename(columns={'orderId': 'wallet_recharge_count'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def process_overall_wallet_recharge_amount_15(self):
+        intake_events = self._events('razorpay_continue_success')
+        intake_events = intake_events.drop_duplicates(subset='orderId')
+        intake_events['amount'] = pd.to_numeric(intake_events['amount'], errors='coerce')
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['amount'].sum().reset_index()
+        user_counts.rename(columns={'amount': 'wallet_recharge_amount'}, inplace=True)
+        return self._dated(user_counts)
+    
+    def astros_live_15(self):
+        intake_events = self._events('open_page', ['com.oneastrologer'])
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'astros_live'}, inplace=True)
+        return self._dated(user_counts)
+
+    def astros_busy_15(self):
+        intake_events = self._events('chat_msg_send', ['com.oneastrologer'])
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'astros_busy'}, inplace=True)
+        return self._dated(user_counts)
+
+    def users_live_15(self):
+        intake_events = self._events('open_page', ['com.oneastro'])
+        
+        user_counts = intake_events.groupby(['day','hour', 'bucket_15'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
+        return self._dated(user_counts)
+
+    def overall_accept_time_15(self):
+        pairs = self.latency_pairs('chat_intake_submit', 'accept_chat', ['waitingListId'])
+        avg_time_diff = pairs.groupby(['day', 'hour', 'bucket_15'])['latency'].mean().reset_index()
+        avg_time_diff.rename(columns={'latency': 'accept_time'}, inplace=True)
+        return self._dated(avg_time_diff)
+
+    # def astros_busy_1(self):
+    #     intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') & (self.raw_df['app_id'] == "com.oneastrologer")]
+    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
+    #     intake_events['date'] = intake_events['event_time'].dt.date
+    #     intake_events['hour'] = intake_events['event_time'].dt.hour
+    #     # intake_events['minute'] = intake_events['event_time'].dt.minute
+    #     # Create a new column for 15-minute intervals
+    #     # intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
+    #     intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_5_minute_interval(x.hour, x.minute))
+        
+    #     user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
+    #     user_counts.rename(columns={'user_id': 'astros_busy_live'}, inplace=True)
+    #     return user_counts
+
+    # def users_busy_1(self):
+    #     intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') ]
+    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
+    #     intake_events['date'] = intake_events['event_time'].dt.date
+    #     intake_events['hour'] = intake_events['event_time'].dt.hour
+    #     intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_5_minute_interval(x.hour, x.minute))
+        
+    #     user_counts = intake_events.groupby(['date','hour', 'interval'])['chatSessionId'].nunique().reset_index()
+    #     user_counts.rename(columns={'chatSessionId': 'users_busy_live'}, inplace=True)
+    #     return user_counts
+    
+
+
+    # def users_live_1(self):
+    #     # intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
+    #     intake_events = self.raw_df[(self.raw_df['app_id'] == 'com.oneastro') | (self.raw_df['app_id'] == 'com.oneastrotelugu')]
+    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
+    #     intake_events['date'] = intake_events['event_time'].dt.date
+    #     intake_events['hour'] = intake_events['event_time'].dt.hour
+    #     intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_5_minute_interval(x.hour, x.minute))
+    #     user_counts = intake_events.groupby(['date','hour', 'interval'])['user_id'].nunique().reset_index()
+    #     user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
+    #     return user_counts
+
+    # def astros_busy_1(self):
+    #     intake_events = self.raw_df[(self.raw_df['event_name'] == 'chat_msg_send') & (self.raw_df['app_id'] == "com.oneastrologer")]
+    #     intake_events['event_time'] = pd.to_datetime(intake_events['event_time'], utc=True) + pd.DateOffset(hours=5, minutes=30)
+    #     intake_events = self.filter_last_5_minutes(intake_events)
+    #     astros_busy_count = intake_events['user_id'].nunique()
+    #     return astros_busy_count
+    def astros_busy_1(self):
+        intake_events = self._events('chat_msg_send')
+        
+        # Convert event_time to datetime and adjust to IST
+        
+        # Filter events for the last 5 minutes
+        intake_events = self.filter_last_5_minutes(intake_events)
+        
+        # Separate events based on app_id and count unique ids accordingly
+        astros_busy_count = 0
+        
+        if not intake_events.empty:
+            astro_events = intake_events[intake_events['app_id'].isin(['com.oneastro', 'com.oneastrotelugu'])]
+            astros_busy_count += astro_events['astrologerId'].nunique()
+            
+            user_events = intake_events[intake_events['app_id'] == 'com.oneastrologer']
+            astros_busy_count += user_events['user_id'].nunique()
+        
+        return astros_busy_count
+
+
+    def users_busy_1(self):
+        intake_events = self._events('chat_msg_send')
+        intake_events = self.filter_last_5_minutes(intake_events)
+        users_busy_count = intake_events['chatSessionId'].nunique()
+        return users_busy_count
+
+    def users_live_1(self):
+        intake_events = self._events(app_ids=['com.oneastro', 'com.oneastrotelugu'])
+        intake_events = self.filter_last_5_minutes(intake_events)
+        users_live_count = intake_events['user_id'].nunique()
+        return users_live_count
+
+
+    def free_users_live_1(self):
+        # Filter intake events for the app
+        intake_events = self._events(app_ids=['com.oneastro'])
+        
+        # Get current time and the last minute window
+        current_time = pd.Timestamp.now(tz=IST_TIMEZONE)
+        last_minute_start = current_time - pd.Timedelta(minutes=1)
+        
+        # Filter intake events for those within the last minute
+        recent_events = intake_events[intake_events['event_time'] >= last_minute_start]
+        
+        # Get unique users active in the last minute
+        active_users = recent_events['user_id'].unique()
+        
+        # Assuming you have a dataframe `chats_df` for chat data
+        # Find the last chat for each active user
+        last_chats = self.chats_df[self.chats_df['user_id'].isin(active_users)]
+        
+        # Get the last chat for each user (assuming chat data has a 'timestamp' or 'event_time' field)
+        last_chats = last_chats.sort_values('event_time', ascending=False).drop_duplicates('user_id', keep='first')
+        
+        # Create a new column to categorize users as free, paid, or new
+        last_chats['user_type'] = last_chats['paid'].apply(lambda x: 'paid' if x else 'free')
+        
+        # For users with no chat, mark them as new users
+        active_users_df = pd.DataFrame(active_users, columns=['user_id'])
+        active_users_df = active_users_df.merge(last_chats[['user_id', 'user_type']], on='user_id', how='left')
+        active_users_df['user_type'].fillna('new', inplace=True)
+        
+        # Map the user type to the users in the last minute
+        user_counts = recent_events.groupby(['day', 'hour', 'minute'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
+        
+        # Adding user type information
+        user_counts['user_type'] = user_counts['user_id'].map(active_users_df.set_index('user_id')['user_type'])
+        
+        return self._dated(user_counts)
+
+
+    def paid_users_live_1(self):
+        # intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
+        intake_events = self._events(app_ids=['com.oneastro'])
+        # Create a new column for 15-minute intervals
+        # intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
+        
+        user_counts = intake_events.groupby(['day','hour', 'minute'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
+        return self._dated(user_counts)
+
+    def new_users_live_1(self):
+        # intake_events = self.raw_df[self.raw_df['event_name'] == 'open_page']
+        intake_events = self._events(app_ids=['com.oneastro'])
+        # Create a new column for 15-minute intervals
+        # intake_events['interval'] = intake_events['event_time'].apply(lambda x: get_15_minute_interval(x.hour, x.minute))
+        
+        user_counts = intake_events.groupby(['day','hour', 'minute'])['user_id'].nunique().reset_index()
+        user_counts.rename(columns={'user_id': 'users_live'}, inplace=True)
+        return self._dated(user_counts)
+
+    
+    def presence(self):
+        """
+        The latest status of every astrologer (see PresenceStore), shared by the
+        live status cards: the one given to the processor, or one folded from its
+        status events on first use.
+        """
+        if self._presence is None:
+            self._presence = PresenceStore(STATUS_EVENTS, ASTRO_APP)
+            self._presence.update(self._events(list(STATUS_EVENTS), [ASTRO_APP]))
+        return self._presence
+
+    def astros_live_1(self):
+        # Live: the latest status of any kind is ON and not silent
+        return self.presence().live_count()
+
+    def multichat_enabled(self):
+        return self.presence().live_count(['change_multichat_status'])
+
+    def chat_call_enabled(self):
+        return self.presence().live_count(['change_chat_status', 'change_call_status'])
+
+    def availability(self, grain='5'):
+        """
+        Time-weighted mean of each AVAILABILITY column over every bucket of `grain`
+        ('5', '15', 'hour' or 'day'), plus chat_capacity, the slots of both kinds
+        (the live cards' total slots before busy ones). The on/off intervals of
+        every astrologer (see status_intervals) are swept over the 5-minute buckets
+        from the first to the last event loaded, all astrologers at once. An
+        astrologer whose last status change came before the first event counts as
+        off until its next one.
+        """
+        status_events = self._events(list(STATUS_EVENTS), [ASTRO_APP])
+        keys = ['day'] + GRAIN_KEYS[grain]
+        if status_events.empty or 'status' not in status_events:
+            empty = pd.DataFrame(columns=keys + list(AVAILABILITY) + ['chat_capacity'])
+            return self._dated(empty.rename(columns={'bucket_5': 'interval'}))
+        # Naive IST nanoseconds, so buckets fall on IST days
+        local_time = self.events['event_time'].dt.tz_localize(None)
+        end = local_time.max()
+        lower, upper = np.asarray([local_time.min(), end], dtype='datetime64[ns]').view('int64')
+        status_events = status_events.assign(event_time=status_events['event_time'].dt.tz_localize(None))
+        step = 5 * NANOS_PER_MINUTE
+        buckets = None
+        for column, (events, slots) in AVAILABILITY.items():
+            intervals = status_intervals(status_events, events, end)
+            starts = np.asarray(intervals['start'], dtype='datetime64[ns]').view('int64')
+            ends = np.asarray(intervals['end'], dtype='datetime64[ns]').view('int64')
+            numbers, covered, area = sweep_buckets(starts, ends, slots, lower, upper, step)
+            if buckets is None:
+                bucket_5 = numbers % (NANOS_PER_DAY // step)
+                buckets = pd.DataFrame({
+                    'day': numbers // (NANOS_PER_DAY // step), 'hour': bucket_5 // 12, 'bucket_5': bucket_5,
+                    'bucket_15': bucket_5 // 3, 'covered': covered,
+                })
+            buckets[column] = area
+        buckets = buckets.groupby(keys)[['covered'] + list(AVAILABILITY)].sum().reset_index()
+        for column in AVAILABILITY:
+            buckets[column] = buckets[column] / buckets['covered']
+        buckets['chat_capacity'] = buckets['multichat_slots'] + buckets['chat_call_slots']
+        buckets = buckets.drop(columns='covered')
+        if grain == '5':
+            buckets['bucket_5'] = interval_labels(buckets['bucket_5'], 5)
+        return self._dated(buckets.rename(columns={'bucket_5': 'interval'}))
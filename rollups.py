@@ -0,0 +1,340 @@
+import numpy as np
+import pandas as pd
+
+from bitmaps import Bitmaps
+from processor import UniqueUsersProcessor, combine_metrics, interval_labels
+from sketches import DEFAULT_PRECISION, LATENCY_ACCURACY, hll_estimate, hll_hash, histogram_bins, histogram_quantiles
+
+
+BASE_MINUTES = 5
+GRAIN_MINUTES = {'5': 5, '15': 15, 'hour': 60, 'day': 24 * 60}
+BUCKETS_PER_DAY = GRAIN_MINUTES['day'] // BASE_MINUTES
+
+
+def base_buckets(state):
+    # Absolute 5-minute bucket number of every state row, for cutting a rollup at a point in time
+    return state['day'].to_numpy().astype(np.int64) * BUCKETS_PER_DAY + state['bucket_5'].to_numpy()
+
+
+def check_mergeable(rollup, other):
+    if not (rollup.mergeable and other.mergeable):
+        raise ValueError(
+            "This rollup's state depends on events outside its buckets (a distinct_on dedup, a SemiJoin value set "
+            "or latency pairs), so merging two parts would not give the rollup of all their events"
+        )
+
+
+class Rollup:
+    """
+    One metric's mergeable state at the 5-minute base grain, keyed by `keys`
+    ([by] + day + bucket_5).
+
+    nunique keeps the ids (IdTable codes) seen in each bucket as a compressed
+    bitmap: `state` has one row per bucket and `bitmaps` the matching group of
+    Bitmaps. Merging buckets is a bitmap OR and the count is its cardinality.
+    sum keeps the per-bucket sum and the number of rows that went into it; mean
+    keeps the same and divides at the end (e.g. latencies). Any coarser grain is
+    derived from the state alone, without rescanning events.
+
+    Two rollups of disjoint events merge into the rollup of both, unless
+    `mergeable` is False: then a bucket's state also depends on events outside
+    it (see metric_planner.mergeable) and merge raises ValueError.
+    """
+
+    def __init__(self, agg, by, state, bitmaps=None, mergeable=True):
+        self.agg = agg
+        self.by = by
+        self.state = state
+        self.bitmaps = bitmaps
+        self.mergeable = mergeable
+
+    @property
+    def keys(self):
+        return ([self.by] if self.by is not None else []) + ['day', 'bucket_5']
+
+    @classmethod
+    def from_events(cls, agg, by, events, value, rows=None, mergeable=True):
+        """
+        `value` is the Series aggregated (aligned with `events`): id codes, -1 for
+        none, for nunique. `rows`, for sums, marks the rows that count (see
+        AggMetric.distinct_on); a mean counts the values that aren't missing.
+        """
+        keys = ([by] if by is not None else []) + ['day', 'bucket_5']
+        state = pd.DataFrame({key: events[key] for key in keys})
+        if agg == 'nunique':
+            grouped = state.groupby(keys)
+            groups = grouped.ngroup().to_numpy()
+            # Rows with no _id belong to no bucket; a bucket whose ids are all missing still counts 0
+            counted = (groups >= 0) & (value.to_numpy() >= 0)
+            bitmaps = Bitmaps.from_ids(groups[counted], value.to_numpy()[counted], grouped.ngroups)
+            return cls(agg, by, grouped.size().reset_index()[keys], bitmaps, mergeable)
+        state['value'] = value
+        if agg == 'mean':
+            rows = value.notna()
+        state['rows'] = True if rows is None else rows
+        return cls(agg, by, cls._merge_buckets(state, keys), mergeable=mergeable)
+
+    @staticmethod
+    def _merge_buckets(state, keys):
+        return state.groupby(keys, sort=False)[['value', 'rows']].sum().reset_index()
+
+    def _union(self, coarse, keys):
+        # (one row of `keys` per group of coarse, the union of each group's bitmaps)
+        grouped = coarse.groupby(keys)
+        return grouped.size().reset_index()[keys], self.bitmaps.union(grouped.ngroup().to_numpy(), grouped.ngroups)
+
+    def merge(self, other):
+        """
+        The rollup of both inputs' events, e.g. the buckets before a refreshed
+        tail plus the tail's.
+        """
+        check_mergeable(self, other)
+        state = pd.concat([self.state, other.state], ignore_index=True)
+        if self.agg == 'nunique':
+            both = Rollup(self.agg, self.by, state, Bitmaps.concat([self.bitmaps, other.bitmaps]))
+            return Rollup(self.agg, self.by, *both._union(state, self.keys))
+        return Rollup(self.agg, self.by, self._merge_buckets(state, self.keys))
+
+    def before(self, bucket):
+        """
+        The rollup of the buckets before absolute 5-minute bucket `bucket` (see base_buckets).
+        """
+        keep = base_buckets(self.state) < bucket
+        bitmaps = self.bitmaps.take(np.flatnonzero(keep)) if self.agg == 'nunique' else None
+        return Rollup(self.agg, self.by, self.state[keep].reset_index(drop=True), bitmaps, self.mergeable)
+
+    def at(self, grain):
+        """
+        Frame at `grain` ('5', '15', 'hour' or 'day'), with the UniqueUsersProcessor
+        key columns (_id, date, hour, interval) and the value in a 'value' column.
+        """
+        state = self.state
+        coarse, keys = coarse_keys(state, self.by, grain)
+        if self.agg == 'nunique':
+            frame, bitmaps = self._union(coarse, keys)
+            frame['value'] = bitmaps.cardinality()
+        else:
+            coarse['value'] = state['value']
+            coarse['rows'] = state['rows']
+            frame = coarse.groupby(keys)[['value', 'rows']].sum().reset_index()
+            frame = frame[frame['rows'] > 0].reset_index(drop=True)
+            if self.agg == 'mean':
+                frame['value'] = frame['value'] / frame['rows']
+            frame = frame.drop(columns='rows')
+        return finish_frame(frame, self.by, grain)
+
+    @property
+    def nbytes(self):
+        return self.state.memory_usage(deep=True).sum() + (self.bitmaps.nbytes if self.bitmaps is not None else 0)
+
+
+class SketchRollup:
+    """
+    Approximate counterpart of a distinct-count Rollup: one HyperLogLog sketch
+    per 5-minute bucket instead of its set of values. The state keeps each
+    sketch's non-zero registers, (keys, register, rank) rows, so a bucket holds
+    at most 2 ** precision rows however many ids it sees, and merging buckets
+    is the max rank per register. See sketches.hll_error for the error.
+    """
+
+    agg = 'nunique'
+
+    def __init__(self, by, state, precision=DEFAULT_PRECISION, mergeable=True):
+        self.by = by
+        self.state = state
+        self.precision = precision
+        self.mergeable = mergeable
+
+    @property
+    def keys(self):
+        return ([self.by] if self.by is not None else []) + ['day', 'bucket_5']
+
+    @classmethod
+    def from_events(cls, by, events, value, precision=DEFAULT_PRECISION, mergeable=True):
+        keys = ([by] if by is not None else []) + ['day', 'bucket_5']
+        counted = value >= 0
+        state = pd.DataFrame({key: events.loc[counted, key] for key in keys})
+        state['register'], state['rank'] = hll_hash(value[counted].to_numpy(), precision)
+        return cls(by, cls._merge_buckets(state, keys), precision, mergeable)
+
+    @staticmethod
+    def _merge_buckets(state, keys):
+        return state.groupby(keys + ['register'], sort=False)['rank'].max().reset_index()
+
+    def merge(self, other):
+        check_mergeable(self, other)
+        state = pd.concat([self.state, other.state], ignore_index=True)
+        return SketchRollup(self.by, self._merge_buckets(state, self.keys), self.precision)
+
+    def before(self, bucket):
+        state = self.state[base_buckets(self.state) < bucket].reset_index(drop=True)
+        return SketchRollup(self.by, state, self.precision, self.mergeable)
+
+    def at(self, grain):
+        state = self.state
+        coarse, keys = coarse_keys(state, self.by, grain)
+        coarse['register'] = state['register']
+        coarse['rank'] = state['rank']
+        registers = coarse.groupby(keys + ['register'])['rank'].max().reset_index()
+        registers['inverse'] = np.exp2(-registers['rank'].astype('float64'))
+        frame = registers.groupby(keys).agg(inverse=('inverse', 'sum'), nonzero=('rank', 'size')).reset_index()
+        frame['value'] = np.round(hll_estimate(frame.pop('inverse'), frame.pop('nonzero'), self.precision)).astype('int64')
+        return finish_frame(frame, self.by, grain)
+
+    @property
+    def nbytes(self):
+        return self.state.memory_usage(deep=True).sum()
+
+
+class HistogramRollup:
+    """
+    Percentile counterpart of a mean Rollup: one log-spaced histogram per
+    5-minute bucket (see sketches.histogram_bins) instead of its values. The
+    state keeps each histogram's non-empty bins, (keys, bin, count) rows, and
+    merging buckets adds counts per bin, so a percentile at any grain or for
+    any astrologer is read off the merged histogram, within `accuracy` of the
+    exact value. Percentiles of the same values share one state (with_quantile).
+    """
+
+    agg = 'quantile'
+
+    def __init__(self, by, state, quantile, accuracy=LATENCY_ACCURACY, mergeable=True):
+        self.by = by
+        self.state = state
+        self.quantile = quantile
+        self.accuracy = accuracy
+        self.mergeable = mergeable
+
+    @property
+    def keys(self):
+        return ([self.by] if self.by is not None else []) + ['day', 'bucket_5']
+
+    @classmethod
+    def from_events(cls, by, events, value, quantile, accuracy=LATENCY_ACCURACY, mergeable=True):
+        keys = ([by] if by is not None else []) + ['day', 'bucket_5']
+        counted = value.notna()
+        state = pd.DataFrame({key: events.loc[counted, key] for key in keys})
+        state['bin'] = histogram_bins(value[counted].to_numpy(), accuracy)
+        state['count'] = 1
+        return cls(by, cls._merge_buckets(state, keys), quantile, accuracy, mergeable)
+
+    @staticmethod
+    def _merge_buckets(state, keys):
+        return state.groupby(keys + ['bin'], sort=False)['count'].sum().reset_index()
+
+    def with_quantile(self, quantile):
+        """
+        The same histograms, read at `quantile`.
+        """
+        return HistogramRollup(self.by, self.state, quantile, self.accuracy, self.mergeable)
+
+    def merge(self, other):
+        check_mergeable(self, other)
+        state = pd.concat([self.state, other.state], ignore_index=True)
+        return HistogramRollup(self.by, self._merge_buckets(state, self.keys), self.quantile, self.accuracy)
+
+    def before(self, bucket):
+        state = self.state[base_buckets(self.state) < bucket].reset_index(drop=True)
+        return HistogramRollup(self.by, state, self.quantile, self.accuracy, self.mergeable)
+
+    def at(self, grain):
+        state = self.state
+        coarse, keys = coarse_keys(state, self.by, grain)
+        coarse['bin'] = state['bin']
+        coarse['count'] = state['count']
+        # Sorted by keys, then bin
+        bins = coarse.groupby(keys + ['bin'])['count'].sum().reset_index()
+        grouped = bins.groupby(keys)
+        frame = grouped.size().reset_index()[keys]
+        frame['value'] = histogram_quantiles(grouped.ngroup().to_numpy(), bins['bin'].to_numpy(), bins['count'].to_numpy(),
+                                             self.quantile, self.accuracy)
+        return finish_frame(frame, self.by, grain)
+
+    @property
+    def nbytes(self):
+        return self.state.memory_usage(deep=True).sum()
+
+
+def coarse_keys(state, by, grain):
+    """
+    The key columns of `grain` for base-bucket rows of `state`, as (frame, key names).
+    """
+    minutes = GRAIN_MINUTES[grain]
+    keys = ([by] if by is not None else []) + ['day']
+    coarse = {key: state[key] for key in keys}
+    if grain != 'day':
+        bucket = state['bucket_5'] * BASE_MINUTES // minutes
+        coarse['hour'] = (bucket * minutes // 60).astype('int8')
+        keys.append('hour')
+        if grain != 'hour':
+            coarse['bucket'] = bucket
+            keys.append('bucket')
+    return pd.DataFrame(coarse, index=state.index), keys
+
+
+def finish_frame(frame, by, grain):
+    if 'bucket' in frame:
+        frame['bucket'] = interval_labels(frame['bucket'], GRAIN_MINUTES[grain])
+    frame = frame.rename(columns={by: '_id', 'bucket': 'interval'})
+    return UniqueUsersProcessor._dated(frame)
+
+
+class RollupStore:
+    """
+    Rollups by name. Several metrics may share one Rollup, e.g. the hourly and
+    15-minute versions of the same count.
+    """
+
+    def __init__(self):
+        self.rollups = {}
+        self.columns = {}
+
+    def add(self, name, rollup, column):
+        self.rollups[name] = rollup
+        self.columns[name] = column
+
+    def _map(self, func):
+        # func applied once per distinct rollup, so shared rollups stay shared
+        store = RollupStore()
+        done = {}
+        for name, rollup in self.rollups.items():
+            if id(rollup) not in done:
+                done[id(rollup)] = func(name, rollup)
+            store.add(name, done[id(rollup)], self.columns[name])
+        return store
+
+    def before(self, bucket):
+        """
+        The store of every rollup's buckets before absolute 5-minute bucket `bucket`.
+        """
+        return self._map(lambda name, rollup: rollup.before(bucket))
+
+    def merge(self, other):
+        """
+        The store of both inputs' events, rollup by rollup; `other` must hold the same metrics.
+        """
+        return self._map(lambda name, rollup: rollup.merge(other.rollups[name]))
+
+    @classmethod
+    def combined(cls, stores):
+        """
+        One store of the metrics of every store in `stores`.
+        """
+        store = cls()
+        for part in stores:
+            store.rollups.update(part.rollups)
+            store.columns.update(part.columns)
+        return store
+
+    def frame(self, name, grain):
+        return self.rollups[name].at(grain).rename(columns={'value': self.columns[name]})
+
+    def table(self, names, grain):
+        """
+        One wide frame with a column per metric in `names` (overall metrics, no
+        _id), outer-joined on the time keys of `grain`.
+        """
+        frames = [self.frame(name, grain) for name in names]
+        if not frames:
+            return pd.DataFrame()
+        return combine_metrics(frames, [column for column in ['date', 'hour', 'interval'] if column in frames[0]])
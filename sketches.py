@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+
+# 2 ** 11 registers per sketch: about 2.3% standard error
+DEFAULT_PRECISION = 11
+
+
+def hll_error(precision=DEFAULT_PRECISION):
+    """
+    Relative standard error of a HyperLogLog estimate with 2 ** precision registers.
+    """
+    return 1.04 / np.sqrt(2 ** precision)
+
+
+def _alpha(m):
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+def hll_hash(values, precision=DEFAULT_PRECISION):
+    """
+    The (register, rank) HyperLogLog observation of every value in `values` (e.g.
+    IdTable codes). A sketch is the max rank seen per register; registers never
+    seen are 0, so a sketch can be kept sparse, as its non-zero registers only.
+    """
+    hashes = pd.util.hash_array(np.asarray(values))
+    register = (hashes >> np.uint64(64 - precision)).astype(np.int16)
+    # Rank = position of the first 1 bit after the register bits, from the next 32 bits (exact in float64)
+    rest = ((hashes << np.uint64(precision)) >> np.uint64(32)).astype(np.float64)
+    _, exponent = np.frexp(rest)
+    rank = np.where(rest == 0, 33, 33 - exponent).astype(np.uint8)
+    return register, rank
+
+
+def hll_estimate(inverse_sum, nonzero, precision=DEFAULT_PRECISION):
+    """
+    Estimated distinct counts of sparse sketches, from each sketch's sum of
+    2 ** -rank over its non-zero registers and the number of those registers,
+    with the small-range (linear counting) correction.
+    """
+    m = 2 ** precision
+    zeros = m - np.asarray(nonzero, dtype=np.float64)
+    raw = _alpha(m) * m * m / (zeros + np.asarray(inverse_sum, dtype=np.float64))
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+# Latency histograms: log-spaced bins, every value within 1% of its bin's representative value
+LATENCY_ACCURACY = 0.01
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+# Bin of values <= 0, read back as 0
+ZERO_BIN = np.iinfo(np.int16).min
+
+
+def _gamma(accuracy):
+    return (1 + accuracy) / (1 - accuracy)
+
+
+def histogram_bins(values, accuracy=LATENCY_ACCURACY):
+    """
+    The log-spaced bin of every value in `values`: bin i holds (gamma ** (i - 1),
+    gamma ** i], gamma = (1 + accuracy) / (1 - accuracy). A histogram is the count
+    per bin, so histograms merge by adding counts and hold one row per bin
+    however many values they see (a few hundred bins span a second to an hour).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bins = np.ceil(np.log(values) / np.log(_gamma(accuracy)))
+    return np.where(values > 0, bins, ZERO_BIN).astype(np.int16)
+
+
+def bin_values(bins, accuracy=LATENCY_ACCURACY):
+    """
+    The representative value of each bin, within `accuracy` (relative) of every value in it.
+    """
+    gamma = _gamma(accuracy)
+    bins = np.asarray(bins)
+    return np.where(bins == ZERO_BIN, 0.0, 2 * gamma ** bins.astype(np.float64) / (gamma + 1))
+
+
+def histogram_quantiles(groups, bins, counts, quantile, accuracy=LATENCY_ACCURACY):
+    """
+    The `quantile` of every histogram in (groups, bins, counts) rows, sorted by
+    group (0..n-1, each present) and then bin. Nearest rank, as SQL's discrete
+    percentiles: the smallest value with at least quantile * count values at or
+    below it, read off the bin holding it.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    totals = np.bincount(groups, weights=counts).astype(np.int64)
+    # Count up to and including each row, within its group
+    cumulative = np.cumsum(counts)
+    cumulative -= np.r_[0, np.cumsum(totals)[:-1]][groups]
+    reached = np.flatnonzero(cumulative >= quantile * totals[groups])
+    _, first = np.unique(groups[reached], return_index=True)
+    return bin_values(np.asarray(bins)[reached[first]], accuracy)
@@ -0,0 +1,276 @@
+from collections import namedtuple
+
+import pandas as pd
+
+from event_query import APP_IDS, EVENTS_TABLE, EventNeed, events_conditions, required_needs, select_list
+from processor import ASTRO_APP, LATENCY_LOOKAHEAD, METHOD_EVENTS
+
+
+# A filter + IST shift + GROUP BY metric. agg is 'nunique' or 'sum' over `value`;
+# `by` is the column reported as _id (None for overall metrics); grain is 'hour' or '15';
+# `condition` is a tuple of extra filters (FREE, PAID or SemiJoin), ANDed together;
+# `distinct_on` keeps one row per that column first.
+AggMetric = namedtuple('AggMetric', ['column', 'events', 'app_ids', 'agg', 'value', 'grain', 'by', 'condition', 'distinct_on'])
+AggMetric.__new__.__defaults__ = (None, None, None)
+
+# Mean minutes from each start event to the end events sharing the `on` columns, bucketed on the start event;
+# with a `quantile` (e.g. 0.9), that percentile of the minutes instead.
+LatencyMetric = namedtuple('LatencyMetric', ['column', 'start_event', 'end_event', 'on', 'grain', 'by', 'quantile'])
+LatencyMetric.__new__.__defaults__ = (None, None)
+
+# Keeps rows whose `column` is the `source` of some `event` event (only events with paid = 1 if paid_only)
+SemiJoin = namedtuple('SemiJoin', ['column', 'event', 'source', 'paid_only'])
+SemiJoin.__new__.__defaults__ = (False,)
+
+FREE = 'free'  # paid = 0
+PAID = 'paid'  # paid missing or not 0
+
+INTAKE_USERS = SemiJoin('clientId', 'chat_intake_submit', 'user_id')
+CALL_ACCEPT_USERS = SemiJoin('clientId', 'chat_call_accept', 'user_id')
+CALL_ACCEPT_SESSIONS = SemiJoin('chatSessionId', 'chat_call_accept', 'chatSessionId')
+PAID_CALL_ACCEPT_SESSIONS = SemiJoin('chatSessionId', 'chat_call_accept', 'chatSessionId', paid_only=True)
+
+# Declarative specs of the UniqueUsersProcessor metrics, keyed by method name. BigQuery computes them
+# server-side (compile_metrics_query) and metric_planner computes them in pandas, both from these specs,
+# and the events they read follow from them (METRIC_EVENTS): a new filter + GROUP BY metric is one entry here.
+SQL_METRICS = {
+    'process_chat_intake_requests': AggMetric('chat_intake_requests', ['chat_intake_submit'], None, 'nunique', 'user_id', 'hour', by='astrologerId'),
+    'process_chat_accepted_events': AggMetric(
+        'chat_accepted', ['accept_chat'], None, 'nunique', 'clientId', 'hour', by='user_id',
+        condition=(FREE, INTAKE_USERS),
+    ),
+    'process_chat_completed_events': AggMetric(
+        'chat_completed', ['accept_chat'], None, 'nunique', 'clientId', 'hour', by='user_id',
+        condition=(FREE, CALL_ACCEPT_SESSIONS),
+    ),
+    'process_paid_chat_completed_events': AggMetric(
+        'paid_chats_completed', ['accept_chat'], None, 'nunique', 'clientId', 'hour', by='user_id',
+        condition=(PAID, PAID_CALL_ACCEPT_SESSIONS),
+    ),
+    'process_chat_cancels': AggMetric('cancelled_requests', ['confirm_cancel_waiting_list'], None, 'nunique', 'user_id', 'hour', by='astrologerId'),
+    'cancellation_time': LatencyMetric(
+        'cancellation_time', 'chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId'], 'hour', by='astrologerId',
+    ),
+    'cancellation_time_p50': LatencyMetric(
+        'cancellation_time_p50', 'chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId'], 'hour',
+        by='astrologerId', quantile=0.5,
+    ),
+    'cancellation_time_p90': LatencyMetric(
+        'cancellation_time_p90', 'chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId'], 'hour',
+        by='astrologerId', quantile=0.9,
+    ),
+    'cancellation_time_p99': LatencyMetric(
+        'cancellation_time_p99', 'chat_intake_submit', 'confirm_cancel_waiting_list', ['user_id', 'astrologerId'], 'hour',
+        by='astrologerId', quantile=0.99,
+    ),
+
+    'process_overall_chat_completed_events': AggMetric('chat_completed_overall', ['chat_call_accept'], None, 'nunique', 'user_id', 'hour'),
+    'process_overall_chat_accepted_events': AggMetric(
+        'chat_accepted_overall', ['accept_chat'], None, 'nunique', 'clientId', 'hour', condition=(INTAKE_USERS,),
+    ),
+    'process_overall_chat_intake_requests': AggMetric('chat_intake_overall', ['chat_intake_submit'], None, 'nunique', 'user_id', 'hour'),
+    'process_overall_profile_creation': AggMetric('profile_creation', ['profile_creation'], None, 'nunique', 'user_id', 'hour'),
+    'process_overall_app_install': AggMetric('app_installs', ['app_install'], None, 'nunique', 'device_id', 'hour'),
+    'process_overall_wallet_recharge_users': AggMetric('wallet_recharge_users', ['razorpay_continue_success'], None, 'nunique', 'user_id', 'hour'),
+    'process_overall_wallet_recharge_count': AggMetric('wallet_recharge_count', ['razorpay_continue_success'], None, 'nunique', 'orderId', 'hour'),
+    'process_overall_wallet_recharge_amount': AggMetric(
+        'wallet_recharge_amount', ['razorpay_continue_success'], None, 'sum', 'amount', 'hour', distinct_on='orderId',
+    ),
+    'overall_accept_time': LatencyMetric('accept_time', 'chat_intake_submit', 'accept_chat', ['waitingListId'], 'hour'),
+    'overall_accept_time_p50': LatencyMetric(
+        'accept_time_p50', 'chat_intake_submit', 'accept_chat', ['waitingListId'], 'hour', quantile=0.5,
+    ),
+    'overall_accept_time_p90': LatencyMetric(
+        'accept_time_p90', 'chat_intake_submit', 'accept_chat', ['waitingListId'], 'hour', quantile=0.9,
+    ),
+    'overall_accept_time_p99': LatencyMetric(
+        'accept_time_p99', 'chat_intake_submit', 'accept_chat', ['waitingListId'], 'hour', quantile=0.99,
+    ),
+    'astros_live': AggMetric('astros_live', ['open_page'], [ASTRO_APP], 'nunique', 'user_id', 'hour'),
+    'astros_busy': AggMetric('astros_busy', ['chat_msg_send'], [ASTRO_APP], 'nunique', 'user_id', 'hour'),
+    'users_live': AggMetric('users_live', ['open_page'], ['com.oneastro'], 'nunique', 'user_id', 'hour'),
+
+    'process_overall_chat_completed_events_15': AggMetric(
+        'chat_completed_overall', ['accept_chat'], None, 'nunique', 'clientId', '15', condition=(CALL_ACCEPT_SESSIONS,),
+    ),
+    'process_overall_chat_accepted_events_15': AggMetric(
+        'chat_accepted_overall', ['accept_chat'], None, 'nunique', 'clientId', '15', condition=(CALL_ACCEPT_USERS,),
+    ),
+    'process_overall_chat_intake_requests_15': AggMetric('chat_intake_overall', ['chat_intake_submit'], None, 'nunique', 'user_id', '15'),
+    'process_overall_profile_creation_15': AggMetric('profile_creation', ['profile_creation'], None, 'nunique', 'user_id', '15'),
+    'process_overall_app_install_15': AggMetric('app_installs', ['app_install'], None, 'nunique', 'device_id', '15'),
+    'process_overall_wallet_recharge_users_15': AggMetric('wallet_recharge_users', ['razorpay_continue_success'], None, 'nunique', 'user_id', '15'),
+    'process_overall_wallet_recharge_count_15': AggMetric('wallet_recharge_count', ['razorpay_continue_success'], None, 'nunique', 'orderId', '15'),
+    'process_overall_wallet_recharge_amount_15': AggMetric(
+        'wallet_recharge_amount', ['razorpay_continue_success'], None, 'sum', 'amount', '15', distinct_on='orderId',
+    ),
+    'astros_live_15': AggMetric('astros_live', ['open_page'], [ASTRO_APP], 'nunique', 'user_id', '15'),
+    'astros_busy_15': AggMetric('astros_busy', ['chat_msg_send'], [ASTRO_APP], 'nunique', 'user_id', '15'),
+    'users_live_15': AggMetric('users_live', ['open_page'], ['com.oneastro'], 'nunique', 'user_id', '15'),
+    'overall_accept_time_15': LatencyMetric('accept_time', 'chat_intake_submit', 'accept_chat', ['waitingListId'], '15'),
+}
+
+
+
+def spec_needs(spec):
+    """
+    The EventNeeds of an AggMetric or LatencyMetric: its own events with every
+    column it filters, groups or counts by, plus the events each SemiJoin reads.
+    """
+    if isinstance(spec, LatencyMetric):
+        return [EventNeed([spec.start_event, spec.end_event], None, list(spec.on) + [spec.by] * (spec.by is not None))]
+    fields = [spec.value] + [column for column in (spec.by, spec.distinct_on) if column is not None]
+    if spec.app_ids is not None:
+        fields.append('app_id')
+    needs = []
+    for condition in spec.condition or ():
+        if condition in (FREE, PAID):
+            fields.append('paid')
+        else:
+            fields.append(condition.column)
+            needs.append(EventNeed([condition.event], None, [condition.source] + ['paid'] * condition.paid_only))
+    return [EventNeed(spec.events, spec.app_ids, fields)] + needs
+
+
+# What every metric reads from the events table: derived for the specs, written out for the other methods
+METRIC_EVENTS = {**METHOD_EVENTS, **{name: spec_needs(spec) for name, spec in SQL_METRICS.items()}}
+
+LONG_COLUMNS = ['metric', 'metric_id', 'metric_date', 'metric_hour', 'metric_interval', 'value']
+
+
+def _grain_sql(time_column, grain):
+    date = f"DATE({time_column})"
+    hour = f"EXTRACT(HOUR FROM {time_column})"
+    if grain == '15':
+        # Same labels as get_15_minute_interval, e.g. "14:15-30"
+        interval = (
+            f"CONCAT(CAST({hour} AS STRING), ':', CASE DIV(EXTRACT(MINUTE FROM {time_column}), 15) "
+            f"WHEN 0 THEN '00-15' WHEN 1 THEN '15-30' WHEN 2 THEN '30-45' ELSE '45-60' END)"
+        )
+    else:
+        interval = "CAST(NULL AS STRING)"
+    return [date, hour, interval]
+
+
+def _sql_list(values):
+    return ', '.join(f"'{value}'" for value in values)
+
+
+def _condition_sql(condition):
+    if condition == FREE:
+        return "paid = 0"
+    if condition == PAID:
+        return "(paid IS NULL OR paid != 0)"
+    paid = " AND paid = 1" if condition.paid_only else ""
+    return f"{condition.column} IN (SELECT {condition.source} FROM events WHERE event_name = '{condition.event}'{paid})"
+
+
+def _long_select(name, keys, value):
+    expressions = [f"'{name}'"] + keys + [value]
+    return ', '.join(f"{expression} AS {column}" for expression, column in zip(expressions, LONG_COLUMNS))
+
+
+def _group_by(keys):
+    return ', '.join(str(position) for position in range(2, len(keys) + 2))
+
+
+def _compile_agg(name, spec):
+    conditions = [f"event_name IN ({_sql_list(spec.events)})"]
+    if spec.app_ids is not None:
+        conditions.append(f"app_id IN ({_sql_list(spec.app_ids)})")
+    if spec.condition is not None:
+        conditions.extend(_condition_sql(condition) for condition in spec.condition)
+    if spec.by is not None:
+        conditions.append(f"{spec.by} IS NOT NULL")
+    source = f"SELECT * FROM events WHERE {' AND '.join(conditions)}"
+    if spec.distinct_on is not None:
+        source += f" QUALIFY ROW_NUMBER() OVER (PARTITION BY {spec.distinct_on} ORDER BY event_time) = 1"
+
+    metric_id = spec.by if spec.by is not None else "CAST(NULL AS STRING)"
+    keys = [metric_id] + _grain_sql('ist_time', spec.grain)
+    if spec.agg == 'nunique':
+        value = f"CAST(COUNT(DISTINCT {spec.value}) AS FLOAT64)"
+    else:
+        value = f"CAST(SUM({spec.value}) AS FLOAT64)"
+    return f"SELECT {_long_select(name, keys, value)} FROM ({source}) GROUP BY {_group_by(keys)}"
+
+
+def _compile_latency(name, spec):
+    # Like pair_latencies: each start's nearest end at or after it (within LATENCY_LOOKAHEAD) with the same
+    # `on` ids, found by a window over both sorted by time instead of a join of every start with every end
+    metric_id = spec.by if spec.by is not None else "CAST(NULL AS STRING)"
+    keys = [metric_id] + _grain_sql('ist_time', spec.grain)
+    micros = "DATETIME_DIFF(ist_time, DATETIME '1970-01-01 00:00:00', MICROSECOND)"
+    lookahead = LATENCY_LOOKAHEAD // pd.Timedelta(microseconds=1)
+    end_time = (
+        f"MIN(IF(event_name = '{spec.end_event}', ist_time, NULL)) OVER (PARTITION BY {', '.join(spec.on)} "
+        f"ORDER BY {micros} RANGE BETWEEN CURRENT ROW AND {lookahead} FOLLOWING)"
+    )
+    conditions = [f"event_name IN ('{spec.start_event}', '{spec.end_event}')"] + [f"{column} IS NOT NULL" for column in spec.on]
+    paired = f"SELECT *, {end_time} AS end_time FROM events WHERE {' AND '.join(conditions)}"
+    latencies = (
+        f"SELECT *, DATETIME_DIFF(end_time, ist_time, MICROSECOND) / 60000000.0 AS latency FROM ({paired}) "
+        f"WHERE event_name = '{spec.start_event}' AND end_time IS NOT NULL"
+    )
+    if spec.quantile is None:
+        value = "AVG(latency)"
+    else:
+        value = f"APPROX_QUANTILES(latency, 100)[OFFSET({round(spec.quantile * 100)})]"
+    return f"SELECT {_long_select(name, keys, value)} FROM ({latencies}) GROUP BY {_group_by(keys)}"
+
+
+def _events_cte(names, lower_str, upper_str, app_ids):
+    needs = required_needs(METRIC_EVENTS, names)
+    columns = select_list(needs) + ["DATETIME_ADD(event_time, INTERVAL 330 MINUTE) AS ist_time"]
+    conditions = '\n  AND '.join(events_conditions(needs, lower_str, upper_str, app_ids))
+    return f"SELECT {', '.join(columns)} FROM {EVENTS_TABLE}\n  WHERE {conditions}"
+
+
+def compile_metrics_query(names, lower_str, upper_str, app_ids=APP_IDS):
+    """
+    One query computing every metric in `names` server-side, as a UNION ALL of
+    per-metric GROUP BYs in long format (LONG_COLUMNS).
+    """
+    selects = []
+    for name in names:
+        spec = SQL_METRICS[name]
+        if isinstance(spec, LatencyMetric):
+            selects.append(_compile_latency(name, spec))
+        else:
+            selects.append(_compile_agg(name, spec))
+    body = '\nUNION ALL\n'.join(selects)
+    return f"WITH events AS (\n  {_events_cte(names, lower_str, upper_str, app_ids)}\n)\n{body}\n"
+
+
+def split_metric_frames(long_df, names):
+    """
+    Cut the long-format result back into the frames the pandas methods return.
+    """
+    long_df = long_df.rename(columns={
+        'metric_id': '_id', 'metric_date': 'date', 'metric_hour': 'hour', 'metric_interval': 'interval',
+    })
+    frames = {}
+    for name in names:
+        spec = SQL_METRICS[name]
+        keys = ['date', 'hour'] + (['interval'] if spec.grain == '15' else [])
+        if spec.by is not None:
+            keys = ['_id'] + keys
+        frame = long_df[long_df['metric'] == name][keys + ['value']].rename(columns={'value': spec.column})
+        frame['date'] = pd.to_datetime(frame['date']).dt.date
+        frame['hour'] = frame['hour'].astype('int8')
+        if isinstance(spec, AggMetric) and spec.agg == 'nunique':
+            frame[spec.column] = frame[spec.column].astype('int64')
+        frames[name] = frame.sort_values(keys).reset_index(drop=True)
+    return frames
+
+
+def run_sql_metrics(run, names, lower_str, upper_str):
+    """
+    run(query) -> DataFrame. Returns {metric name: frame} for every name in `names`.
+    """
+    if not names:
+        return {}
+    long_df = run(compile_metrics_query(names, lower_str, upper_str))
+    if long_df.empty:
+        long_df = pd.DataFrame(columns=LONG_COLUMNS)
+    return split_metric_frames(long_df, names)
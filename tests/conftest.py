@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from event_frame import compact_events, parse_other_data  # noqa: E402
+from event_source import LocalEventSource  # noqa: E402
+from generate_events import generate  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def raw_events():
+    """
+    Two IST days of synthetic events, shaped like the events table.
+    """
+    return pd.concat(generate(40_000, '2026-10-10', 2, seed=7, astro_csv=os.path.join(ROOT, 'astro_type.csv')), ignore_index=True)
+
+
+@pytest.fixture(scope='session')
+def events(raw_events):
+    """
+    The raw events, parsed and compacted as the page stores them.
+    """
+    parsed, _ = parse_other_data(raw_events['other_data'])
+    return compact_events(pd.concat([raw_events.drop(columns='other_data'), parsed], axis=1))
+
+
+@pytest.fixture(scope='session')
+def events_table(raw_events, tmp_path_factory):
+    """
+    (frame, LocalEventSource) of the raw events plus a copy of some rows under an
+    app outside APP_IDS, which no query may return.
+    """
+    other_app = raw_events.sample(2000, random_state=0).assign(app_id='com.oneastrotelugu')
+    frame = pd.concat([raw_events, other_app], ignore_index=True)
+    path = str(tmp_path_factory.mktemp('events') / 'events.parquet')
+    frame.to_parquet(path, index=False)
+    return frame, LocalEventSource(path)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bitmaps import ARRAY_MAX, Bitmaps
+from event_frame import IdTable
+
+
+def random_ids(rng, num_groups):
+    # Sparse and dense groups, so both array and bitset containers (and ids past one container) occur
+    groups, ids = [], []
+    for group in range(num_groups):
+        size = rng.choice([0, 3, 200, ARRAY_MAX + 500])
+        high = rng.choice([1000, 1 << 16, 1 << 20])
+        groups.append(np.full(size, group))
+        ids.append(rng.integers(0, high, size))
+    return np.concatenate(groups), np.concatenate(ids)
+
+
+def as_sets(groups, ids, num_groups):
+    sets = [set() for _ in range(num_groups)]
+    for group, value in zip(groups.tolist(), ids.tolist()):
+        sets[group].add(value)
+    return sets
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_cardinality_matches_sets(seed):
+    rng = np.random.default_rng(seed)
+    groups, ids = random_ids(rng, 12)
+    bitmaps = Bitmaps.from_ids(groups, ids, 12)
+    assert bitmaps.cardinality().tolist() == [len(ids_) for ids_ in as_sets(groups, ids, 12)]
+
+
+def test_cardinality_without_bitwise_count(monkeypatch):
+    # numpy before 2.0 counts bits through a byte table
+    rng = np.random.default_rng(0)
+    groups, ids = random_ids(rng, 12)
+    expected = Bitmaps.from_ids(groups, ids, 12).cardinality()
+    if hasattr(np, 'bitwise_count'):
+        monkeypatch.delattr(np, 'bitwise_count')
+    assert Bitmaps.from_ids(groups, ids, 12).cardinality().tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_union_matches_sets(seed):
+    rng = np.random.default_rng(seed)
+    groups, ids = random_ids(rng, 12)
+    sets = as_sets(groups, ids, 12)
+    target = rng.integers(0, 4, 12)
+    union = Bitmaps.from_ids(groups, ids, 12).union(target, 4)
+    expected = [set().union(*(sets[i] for i in range(12) if target[i] == group)) for group in range(4)]
+    assert union.cardinality().tolist() == [len(ids_) for ids_ in expected]
+    # Folding the union again changes nothing
+    assert union.union(np.arange(4), 4).cardinality().tolist() == union.cardinality().tolist()
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_take_and_concat_keep_groups(seed):
+    rng = np.random.default_rng(seed)
+    first = Bitmaps.from_ids(*random_ids(rng, 6), 6)
+    second = Bitmaps.from_ids(*random_ids(rng, 5), 5)
+    both = Bitmaps.concat([first, second])
+    assert both.cardinality().tolist() == first.cardinality().tolist() + second.cardinality().tolist()
+    positions = [0, 2, 5, 7, 10]
+    assert both.take(positions).cardinality().tolist() == both.cardinality()[positions].tolist()
+
+
+def test_id_table_codes_are_stable_and_shared():
+    ids = IdTable()
+    first = ids.encode(pd.Series(['a', 'b', None, 'a']))
+    second = ids.encode(pd.Series(['c', 'a']))
+    assert first.tolist() == [0, 1, -1, 0]
+    assert second.tolist() == [2, 0]
+    assert ids.encode(pd.Series([None, None], dtype=object)).tolist() == [-1, -1]
@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import event_frame
+from event_frame import parse_other_data
+
+
+@pytest.fixture(params=['installed', 'stdlib'])
+def loads(request, monkeypatch):
+    # The same rows must come out whichever decoder is installed
+    if request.param == 'stdlib':
+        monkeypatch.setattr(event_frame, '_loads', json.loads)
+
+
+def test_failed_rows_keep_later_rows_aligned(loads):
+    other_data = pd.Series([
+        '{"astrologerId": "a1", "paid": true, "amount": "12.5"}',
+        '{"astrologerId": "a2", ',  # malformed
+        '["a3"]',  # not an object
+        None,
+        np.nan,
+        '{"clientId": "c6", "paid": 0, "isSilent": "1"}',
+        '42',  # not an object
+        '{"astrologerId": 7, "paid": false, "amount": 3, "other": {"nested": 1}}',
+    ], index=[105, 7, 300, 2, 11, 40, 41, 9])
+    parsed, failures = parse_other_data(other_data)
+
+    # Missing rows are not failures, only undecodable or non-object ones
+    assert failures == 3
+    assert list(parsed.index) == list(other_data.index)
+    assert parsed.loc[105, 'astrologerId'] == 'a1' and parsed.loc[105, 'paid'] == 1 and parsed.loc[105, 'amount'] == 12.5
+    assert parsed.loc[[7, 300, 2, 11, 41]].isna().all().all()
+    assert parsed.loc[40, 'clientId'] == 'c6' and parsed.loc[40, 'paid'] == 0 and parsed.loc[40, 'isSilent'] == 1
+    assert pd.isna(parsed.loc[40, 'astrologerId'])
+    assert parsed.loc[9, 'astrologerId'] == '7' and parsed.loc[9, 'paid'] == 0 and parsed.loc[9, 'amount'] == 3
+
+
+def test_random_failures_do_not_shift_rows(loads):
+    rng = np.random.default_rng(0)
+    size = 2000
+    values = [f'w{number}' for number in range(size)]
+    broken = rng.random(size) < 0.2
+    other_data = pd.Series(
+        ['{"waitingListId": "' if bad else json.dumps({'waitingListId': value}) for value, bad in zip(values, broken)],
+        index=rng.permutation(size) * 3,
+    )
+    parsed, failures = parse_other_data(other_data)
+    assert failures == broken.sum()
+    expected = pd.Series([None if bad else value for value, bad in zip(values, broken)], index=other_data.index, dtype=object)
+    pd.testing.assert_series_equal(parsed['waitingListId'], expected, check_names=False)
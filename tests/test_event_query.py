@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_query import APP_IDS, EVENT_COLUMNS, build_events_query, required_fields, required_needs
+from sql_backend import METRIC_EVENTS
+
+LOWER, UPPER = '2026-10-10 00:00:00', '2026-10-11 12:00:00'
+
+
+def metric_sets():
+    rng = np.random.default_rng(0)
+    names = sorted(METRIC_EVENTS)
+    return [[name] for name in names] + [list(rng.choice(names, 5, replace=False)) for _ in range(10)] + [names]
+
+
+def needed_rows(frame, needs):
+    # Every row inside the range and APP_IDS that some EventNeed reads
+    times = frame['event_time']
+    rows = frame['app_id'].isin(APP_IDS) & (times >= pd.Timestamp(LOWER)) & (times < pd.Timestamp(UPPER))
+    needed = pd.Series(False, index=frame.index)
+    for need in needs:
+        matches = pd.Series(True, index=frame.index)
+        if need.events is not None:
+            matches &= frame['event_name'].isin(need.events)
+        if need.app_ids is not None:
+            matches &= frame['app_id'].isin(need.app_ids)
+        needed |= matches
+    return frame[rows & needed]
+
+
+def key_rows(frame):
+    return sorted(zip(pd.to_datetime(frame['event_time']).tolist(), frame['event_name'].tolist()))
+
+
+@pytest.mark.parametrize('metrics', metric_sets(), ids=lambda metrics: metrics[0] if len(metrics) == 1 else f'{len(metrics)} metrics')
+@pytest.mark.parametrize('extract_json', [True, False])
+def test_query_reads_exactly_the_needs(events_table, metrics, extract_json):
+    frame, source = events_table
+    needs = required_needs(METRIC_EVENTS, metrics)
+    result = source.query_frame(build_events_query(METRIC_EVENTS, metrics, LOWER, UPPER, extract_json=extract_json))
+
+    fields = required_fields(needs)
+    json_keys = sorted(fields - set(EVENT_COLUMNS))
+    if extract_json:
+        expected_columns = [column for column in EVENT_COLUMNS if column in fields] + json_keys
+    else:
+        expected_columns = [column for column in EVENT_COLUMNS if column in fields or (json_keys and column == 'other_data')]
+    assert list(result.columns) == expected_columns
+    assert key_rows(result) == key_rows(needed_rows(frame, needs))
+
+
+def test_unknown_metric_raises():
+    with pytest.raises(KeyError):
+        build_events_query(METRIC_EVENTS, ['no_such_metric'], LOWER, UPPER)
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from event_source import bigquery_to_duckdb
+
+
+@pytest.mark.parametrize('bigquery, duckdb', [
+    ("SELECT * FROM `project.dataset.events`", "SELECT * FROM bq_events"),
+    (
+        "DATETIME_ADD(DATETIME(DATE(event_time)), INTERVAL 330 MINUTE)",
+        "(CAST(CAST(event_time AS DATE) AS TIMESTAMP) + INTERVAL 330 MINUTE)",
+    ),
+    (
+        "DATETIME_DIFF(end_time, DATETIME_ADD(ist_time, INTERVAL 1 HOUR), MICROSECOND)",
+        "date_diff('microsecond', (ist_time + INTERVAL 1 HOUR), end_time)",
+    ),
+    ("DIV(EXTRACT(MINUTE FROM ist_time), 15)", "(EXTRACT(MINUTE FROM ist_time) // 15)"),
+    ("JSON_VALUE(other_data, '$.paid')", "json_extract_string(TRY_CAST(other_data AS JSON), '$.paid')"),
+    (
+        "SAFE_CAST(SAFE_CAST(JSON_VALUE(other_data, '$.paid') AS FLOAT64) AS INT64)",
+        "TRY_CAST(TRY_CAST(json_extract_string(TRY_CAST(other_data AS JSON), '$.paid') AS DOUBLE) AS BIGINT)",
+    ),
+    ("APPROX_QUANTILES(latency, 100)[OFFSET(90)]", "quantile_disc(latency, 0.9)"),
+    # TIMESTAMP literals mean the same in both dialects
+    ("event_time >= TIMESTAMP '2026-10-10 00:00:00'", "event_time >= TIMESTAMP '2026-10-10 00:00:00'"),
+    # Literals holding parentheses, commas, function names, types or backticks are left alone
+    (
+        "DATE(event_time) = '2026-10-10' AND event_name = 'DATE(x), (y'",
+        "CAST(event_time AS DATE) = '2026-10-10' AND event_name = 'DATE(x), (y'",
+    ),
+    (
+        "JSON_VALUE(other_data, '$.a(b)') = 'SAFE_CAST(x AS STRING) `t`'",
+        "json_extract_string(TRY_CAST(other_data AS JSON), '$.a(b)') = 'SAFE_CAST(x AS STRING) `t`'",
+    ),
+    ("DATETIME('it\\'s DATE(')", "CAST('it\\'s DATE(' AS TIMESTAMP)"),
+])
+def test_rewrites(bigquery, duckdb):
+    assert bigquery_to_duckdb(bigquery) == duckdb
+
+
+def test_rewritten_sql_runs_with_bigquery_semantics(events_table):
+    _, source = events_table
+    result = source.query_frame("""
+SELECT
+  DATETIME_DIFF(DATETIME('2026-10-10 01:30:00'), DATETIME('2026-10-10 00:00:00'), MINUTE) AS minutes,
+  DATETIME_ADD(DATETIME('2026-10-10 23:00:00'), INTERVAL 330 MINUTE) AS ist,
+  DATE(DATETIME_ADD(DATETIME('2026-10-10 23:00:00'), INTERVAL 330 MINUTE)) AS ist_date,
+  DIV(47, 15) AS quarter,
+  SAFE_CAST(SAFE_CAST(JSON_VALUE('{"paid": "1.0", "f": "x"}', '$.paid') AS FLOAT64) AS INT64) AS paid,
+  SAFE_CAST(JSON_VALUE('{"paid": "1.0", "f": "x"}', '$.f') AS FLOAT64) AS bad,
+  'DATE(x), SAFE_CAST(' AS text
+""")
+    row = result.iloc[0]
+    assert row['minutes'] == 90
+    assert row['ist'] == pd.Timestamp('2026-10-11 04:30:00')
+    assert str(row['ist_date']) == '2026-10-11'
+    assert row['quarter'] == 3
+    assert row['paid'] == 1
+    assert pd.isna(row['bad'])
+    assert row['text'] == 'DATE(x), SAFE_CAST('
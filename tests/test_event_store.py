@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_store import DayPartitionCache, EventStore
+
+START, END = pd.Timestamp('2026-10-09 18:30'), pd.Timestamp('2026-10-11 19:00')
+
+
+class LateSource:
+    """
+    The fixture's events as a table they land in up to `max_delay` after their
+    event_time: fetch only returns the rows that have landed by `now`.
+    """
+
+    def __init__(self, events, seed, max_delay=timedelta(seconds=100)):
+        rng = np.random.default_rng(seed)
+        self.events = events.assign(row=np.arange(len(events)))
+        self.landed = self.events['event_time'] + pd.to_timedelta(rng.uniform(0, max_delay.total_seconds(), len(events)), unit='s')
+        self.now = START
+        self.calls = []
+
+    def fetch(self, lower_str, upper_str):
+        self.calls.append((lower_str, upper_str))
+        times = self.events['event_time']
+        rows = (times >= pd.Timestamp(lower_str)) & (times < pd.Timestamp(upper_str)) & (self.landed <= self.now)
+        return self.events[rows].reset_index(drop=True)
+
+
+def by_row(frame):
+    return frame.sort_values('row').reset_index(drop=True)
+
+
+def assert_same_events(actual, expected):
+    assert not actual['row'].duplicated().any()
+    pd.testing.assert_frame_equal(by_row(actual), by_row(expected), check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_overlapping_refreshes_equal_one_full_fetch(events, seed):
+    source = LateSource(events, seed)
+    store = EventStore(START, END)
+    # Refreshes at uneven times while the events are landing, every one refetching the overlap
+    for minutes in np.cumsum(np.random.default_rng(seed).integers(1, 90, 60)):
+        source.now = START + timedelta(minutes=int(minutes))
+        store.refresh(source.fetch)
+        assert not store.df['row'].duplicated().any()
+    source.now = END + timedelta(hours=1)
+    store.refresh(source.fetch)
+    assert len(source.calls) > 1
+    assert_same_events(store.df, source.fetch(START.strftime('%Y-%m-%d %H:%M:%S'), END.strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def test_pending_ranges_start_at_watermark_minus_overlap(events):
+    source = LateSource(events, 0)
+    source.now = START + timedelta(hours=6)
+    store = EventStore(START, END, overlap=timedelta(minutes=2))
+    assert store.pending_ranges() == [(START, END)]
+    store.refresh(source.fetch)
+    assert store.pending_ranges() == [((store.watermark - timedelta(minutes=2)).floor('s'), END)]
+
+
+def test_closed_days_come_from_the_day_cache(events, tmp_path):
+    source = LateSource(events, 0)
+    source.now = END + timedelta(hours=1)
+    first = EventStore(START, END, day_cache=DayPartitionCache(str(tmp_path), 'key'))
+    first.refresh(source.fetch)
+    # The two closed IST days in the range were written to disk: a new store only queries the rest
+    source.calls.clear()
+    second = EventStore(START, END, day_cache=DayPartitionCache(str(tmp_path), 'key'))
+    assert second.pending_ranges() == [(pd.Timestamp('2026-10-11 18:30'), END)]
+    second.refresh(source.fetch)
+    assert source.calls == [('2026-10-11 18:30:00', '2026-10-11 19:00:00')]
+    assert_same_events(second.df, first.df)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from metric_planner import plan_metrics, run_planned_metrics
+from processor import UniqueUsersProcessor
+from sketches import LATENCY_ACCURACY
+from sql_backend import SQL_METRICS, LatencyMetric
+
+PERCENTILES = [name for name, spec in SQL_METRICS.items() if isinstance(spec, LatencyMetric) and spec.quantile is not None]
+
+
+@pytest.fixture(scope='module')
+def processor(events):
+    return UniqueUsersProcessor(events, pd.DataFrame())
+
+
+@pytest.fixture(scope='module')
+def planned(processor):
+    return run_planned_metrics(processor, list(SQL_METRICS))
+
+
+def exact_percentile(processor, spec):
+    # The nearest-rank percentile of the paired latencies, grouped as the mean's method groups them
+    pairs = processor.latency_pairs(spec.start_event, spec.end_event, spec.on)
+    keys = ([spec.by] if spec.by is not None else []) + ['day', 'hour']
+    frame = pairs.groupby(keys)['latency'].agg(lambda latencies: np.quantile(latencies, spec.quantile, method='inverted_cdf'))
+    frame = frame.reset_index().rename(columns={'latency': spec.column, spec.by: '_id'})
+    return UniqueUsersProcessor._dated(frame)
+
+
+def test_every_spec_is_planned():
+    _, fallback = plan_metrics(list(SQL_METRICS))
+    assert fallback == []
+
+
+@pytest.mark.parametrize('name', [name for name in SQL_METRICS if name not in PERCENTILES])
+def test_planned_frame_matches_the_method(processor, planned, name):
+    expected = getattr(processor, name)()
+    assert len(expected)
+    pd.testing.assert_frame_equal(planned[name].reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('name', PERCENTILES)
+def test_planned_percentile_is_within_accuracy(processor, planned, name):
+    expected = exact_percentile(processor, SQL_METRICS[name])
+    assert len(expected)
+    pd.testing.assert_frame_equal(
+        planned[name].reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False, rtol=LATENCY_ACCURACY,
+    )
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from presence import PresenceStore, status_intervals, sweep_buckets
+from processor import ASTRO_APP, STATUS_EVENTS
+
+
+def random_status_events(rng, size):
+    # Distinct times, so the latest event of every key is unambiguous whatever order they arrive in
+    times = pd.Timestamp('2026-10-10') + pd.to_timedelta(rng.permutation(size * 10)[:size], unit='s')
+    return pd.DataFrame({
+        'event_name': rng.choice(list(STATUS_EVENTS) + ['open_page'], size),
+        'app_id': rng.choice([ASTRO_APP, 'com.oneastro'], size, p=[0.9, 0.1]),
+        'user_id': rng.choice([f'astro{index}' for index in range(20)] + [None], size),
+        'status': rng.choice(['ON', 'OFF'], size),
+        'isSilent': rng.choice([0, 1, np.nan], size, p=[0.7, 0.2, 0.1]),
+        'event_time': times,
+    })
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_sweep_buckets_matches_overlaps(seed):
+    rng = np.random.default_rng(seed)
+    step = 300
+    # Bounds off the bucket boundaries, and intervals that start before or end after them
+    lower = int(rng.integers(0, 10_000))
+    upper = lower + int(rng.integers(1, 5_000))
+    starts = rng.integers(lower - 1_000, upper + 1_000, 50)
+    ends = starts + rng.integers(0, 2_000, 50)
+    weights = rng.integers(1, 5, 50).astype(np.float64)
+    numbers, covered, area = sweep_buckets(starts, ends, weights, lower, upper, step)
+
+    np.testing.assert_array_equal(numbers, np.arange(lower // step, (upper - 1) // step + 1))
+    expected_covered, expected_area = [], []
+    for number in numbers:
+        first, last = max(number * step, lower), min((number + 1) * step, upper)
+        expected_covered.append(last - first)
+        overlaps = np.clip(np.minimum(ends, last) - np.maximum(starts, first), 0, None)
+        expected_area.append((weights * overlaps).sum())
+    np.testing.assert_array_equal(covered, expected_covered)
+    np.testing.assert_allclose(area, expected_area)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_status_intervals_match_runs(seed):
+    rng = np.random.default_rng(seed)
+    events = random_status_events(rng, 300)
+    end = events['event_time'].max() + pd.Timedelta(minutes=1)
+    kinds = ['change_chat_status', 'change_multichat_status']
+    intervals = status_intervals(events, kinds, end)
+
+    expected = []
+    rows = events[events['event_name'].isin(kinds) & events['user_id'].notna()].sort_values('event_time')
+    for user, user_rows in rows.groupby('user_id'):
+        times = list(user_rows['event_time']) + [end]
+        on = ((user_rows['status'] == 'ON') & (user_rows['isSilent'].fillna(0) == 0)).tolist()
+        for index, is_on in enumerate(on):
+            if not is_on:
+                continue
+            # Consecutive on events extend the same interval
+            if expected and index and on[index - 1]:
+                expected[-1] = (user, expected[-1][1], times[index + 1])
+            else:
+                expected.append((user, times[index], times[index + 1]))
+    assert list(intervals.itertuples(index=False, name=None)) == expected
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_presence_store_is_order_independent_and_idempotent(seed):
+    rng = np.random.default_rng(seed)
+    events = random_status_events(rng, 400)
+    whole = PresenceStore(STATUS_EVENTS, ASTRO_APP)
+    whole.update(events)
+
+    # Shuffled, overlapping tails, as an EventStore's refreshes hand them over
+    shuffled = events.sample(frac=1, random_state=seed).reset_index(drop=True)
+    pieces = PresenceStore(STATUS_EVENTS, ASTRO_APP)
+    for start in range(0, len(shuffled), 50):
+        pieces.update(shuffled.iloc[max(start - 20, 0):start + 50])
+    pieces.update(events)
+
+    sort = ['user_id', 'event_name']
+    pd.testing.assert_frame_equal(
+        pieces.state.sort_values(sort).reset_index(drop=True), whole.state.sort_values(sort).reset_index(drop=True),
+    )
+    assert pieces.live_count() == whole.live_count()
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor import (
+    LATENCY_LOOKAHEAD, bucket_ids, enrich_event_times, get_5_minute_interval, get_15_minute_interval, interval_labels,
+    pair_latencies,
+)
+
+
+@pytest.mark.parametrize('minutes, label', [(5, get_5_minute_interval), (15, get_15_minute_interval)])
+def test_bucket_labels_match_the_per_row_intervals(minutes, label):
+    rng = np.random.default_rng(minutes)
+    day = pd.Timestamp('2026-10-10')
+    # Every bucket's first and last microsecond, plus random times
+    starts = day + pd.to_timedelta(np.arange(0, 24 * 60, minutes), unit='min')
+    times = pd.Series(np.concatenate([
+        starts.to_numpy(),
+        (starts + pd.Timedelta(minutes=minutes) - pd.Timedelta(microseconds=1)).to_numpy(),
+        (day + pd.to_timedelta(rng.integers(0, 10 ** 6 * 86400 * 3, 1000), unit='us')).to_numpy(),
+    ]))
+    ids = bucket_ids(times, minutes)
+    assert ids.dtype == np.int16
+    expected = [label(time.hour, time.minute) for time in times]
+    assert interval_labels(ids, minutes).tolist() == expected
+    assert (ids == (times.dt.hour * 60 + times.dt.minute) // minutes).all()
+
+
+def test_calendar_columns_roll_over_at_ist_midnight():
+    # 18:30 UTC is midnight IST
+    frame = enrich_event_times(pd.DataFrame({'event_time': pd.to_datetime([
+        '2026-10-10 18:29:59.999999', '2026-10-10 18:30:00', '2026-10-10 18:44:59', '2026-10-10 18:45:00',
+        '2026-10-11 03:59:00',
+    ], format='ISO8601')}))
+    days = pd.to_datetime(['2026-10-10', '2026-10-11']).to_numpy().astype('datetime64[D]').astype('int64')
+    assert frame['day'].tolist() == [days[0], days[1], days[1], days[1], days[1]]
+    assert frame['hour'].tolist() == [23, 0, 0, 0, 9]
+    assert frame['minute'].tolist() == [59, 0, 14, 15, 29]
+    assert frame['bucket_15'].tolist() == [95, 0, 0, 1, 37]
+    assert frame['bucket_5'].tolist() == [287, 0, 2, 3, 113]
+    assert str(frame['event_time'].dt.tz) == 'Asia/Kolkata'
+
+
+def latency_events(times, users, waits=None):
+    # Minutes past 2026-10-10 00:00 (IST) and id codes, -1 for a missing id
+    frame = pd.DataFrame({
+        'event_time': pd.Timestamp('2026-10-10', tz='Asia/Kolkata') + pd.to_timedelta(times, unit='min'),
+        'user_id_code': np.asarray(users, dtype=np.int32),
+    })
+    if waits is not None:
+        frame['waitingListId_code'] = np.asarray(waits, dtype=np.int32)
+    return frame
+
+
+def pairs_of(starts, ends, on=('user_id',)):
+    pairs = pair_latencies(starts, ends, list(on))
+    return sorted(zip(pairs['user_id_code'].tolist(), pairs['latency'].round(6).tolist()))
+
+
+def test_starts_without_an_end_in_time_are_dropped():
+    starts = latency_events([0, 0, 10, 200], [1, 2, 3, 4])
+    # User 1's end comes after the lookahead, user 2 has none, user 4's is before its start
+    ends = latency_events([61, 70, 199], [1, 3, 4])
+    assert pairs_of(starts, ends) == [(3, 60.0)]
+
+
+def test_end_exactly_at_the_lookahead_is_paired():
+    minutes = LATENCY_LOOKAHEAD / pd.Timedelta(minutes=1)
+    assert pairs_of(latency_events([0], [1]), latency_events([minutes], [1])) == [(1, minutes)]
+
+
+def test_repeated_starts_each_pair_with_the_nearest_end():
+    # Retries before one accept: every start pairs with it, not with the later accept
+    starts = latency_events([0, 1, 2, 30], [1, 1, 1, 1])
+    ends = latency_events([5, 40], [1, 1])
+    assert pairs_of(starts, ends) == [(1, 3.0), (1, 4.0), (1, 5.0), (1, 10.0)]
+
+
+def test_ties_pair_at_zero_minutes_once():
+    # An end at the start's own time counts; duplicate ends never duplicate a start
+    starts = latency_events([5, 5], [1, 2])
+    ends = latency_events([5, 5, 5], [1, 1, 2])
+    assert pairs_of(starts, ends) == [(1, 0.0), (2, 0.0)]
+
+
+def test_pairs_need_every_on_id():
+    starts = latency_events([0, 0, 0], [1, 1, -1], waits=[7, 8, 7])
+    ends = latency_events([3, 4], [1, -1], waits=[7, 7])
+    assert pairs_of(starts, ends, on=('user_id', 'waitingListId')) == [(1, 3.0)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_pairs_match_a_nearest_end_scan(seed):
+    rng = np.random.default_rng(seed)
+    starts = latency_events(rng.integers(0, 600, 300), rng.integers(-1, 20, 300))
+    ends = latency_events(rng.integers(0, 600, 200), rng.integers(-1, 20, 200))
+    expected = []
+    for time, user in zip(starts['event_time'], starts['user_id_code']):
+        if user < 0:
+            continue
+        later = ends['event_time'][(ends['user_id_code'] == user) & (ends['event_time'] >= time)]
+        if len(later) and later.min() - time <= LATENCY_LOOKAHEAD:
+            expected.append((user, round((later.min() - time) / pd.Timedelta(minutes=1), 6)))
+    assert pairs_of(starts, ends) == sorted(expected)
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from event_frame import IdTable
+from event_store import EventStore
+from metric_planner import IncrementalRollups, build_rollups, mergeable
+from processor import UniqueUsersProcessor
+from rollups import GRAIN_MINUTES
+from sql_backend import SQL_METRICS
+
+MERGEABLE = [name for name, spec in SQL_METRICS.items() if mergeable(spec)]
+NOT_MERGEABLE = [name for name in SQL_METRICS if name not in MERGEABLE]
+
+
+def rollups_of(events, names, ids):
+    return build_rollups(UniqueUsersProcessor(events, pd.DataFrame(), ids=ids), names)
+
+
+def assert_same_frames(actual, expected, names):
+    for name in names:
+        for grain in GRAIN_MINUTES:
+            pd.testing.assert_frame_equal(actual.frame(name, grain), expected.frame(name, grain), obj=f"{name} at {grain}")
+
+
+def split_at_ist_midnight(events):
+    # 2026-10-11 00:00 IST
+    cut = pd.Timestamp('2026-10-10 18:30:00')
+    return events[events['event_time'] < cut], events[events['event_time'] >= cut]
+
+
+def test_mergeable_specs():
+    assert 'process_overall_chat_intake_requests' in MERGEABLE
+    assert 'process_overall_wallet_recharge_amount' in NOT_MERGEABLE
+    assert 'process_overall_chat_accepted_events' in NOT_MERGEABLE
+    assert 'cancellation_time' in NOT_MERGEABLE
+
+
+def test_merged_parts_match_the_whole(events):
+    ids = IdTable()
+    first, second = split_at_ist_midnight(events)
+    merged = rollups_of(first, MERGEABLE, ids).merge(rollups_of(second, MERGEABLE, ids))
+    assert_same_frames(merged, rollups_of(events, MERGEABLE, ids), MERGEABLE)
+
+
+@pytest.mark.parametrize('name', NOT_MERGEABLE)
+def test_merging_a_non_mergeable_rollup_raises(events, name):
+    ids = IdTable()
+    first, second = split_at_ist_midnight(events)
+    with pytest.raises(ValueError):
+        rollups_of(first, [name], ids).rollups[name].merge(rollups_of(second, [name], ids).rollups[name])
+
+
+def test_incremental_rollups_follow_event_store_refreshes(events):
+    start, end = events['event_time'].min().floor('h'), events['event_time'].max().ceil('h')
+
+    def fetch(lower_str, upper_str):
+        return events[(events['event_time'] >= lower_str) & (events['event_time'] < upper_str)].reset_index(drop=True)
+
+    store = EventStore(start, end, ids=IdTable())
+    incremental = IncrementalRollups(list(SQL_METRICS))
+    assert incremental.names == MERGEABLE
+    # Refreshes a few minutes apart, each refetching the overlap, then a long jump
+    for minutes in [600, 603, 610, 611, 2000, 2880]:
+        store.end = min(end, start + pd.Timedelta(minutes=minutes))
+        frame = store.refresh(fetch)
+        assert_same_frames(incremental.update(frame, store.ids, store.overlap), rollups_of(frame, MERGEABLE, store.ids), MERGEABLE)
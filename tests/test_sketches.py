@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from sketches import LATENCY_ACCURACY, LATENCY_QUANTILES, histogram_bins, histogram_quantiles
+
+
+def random_latencies(rng, num_groups):
+    # Groups of one value up to thousands, spanning seconds to hours, with some zero latencies
+    groups, values = [], []
+    for group in range(num_groups):
+        size = rng.choice([1, 2, 17, 3000])
+        groups.append(np.full(size, group))
+        values.append(np.where(rng.random(size) < 0.05, 0.0, rng.lognormal(0, 2, size)))
+    return np.concatenate(groups), np.concatenate(values)
+
+
+def histograms(groups, values):
+    # (group, bin, count) rows sorted by group and then bin, as HistogramRollup keeps them
+    rows, counts = np.unique(np.stack([groups, histogram_bins(values)]), axis=1, return_counts=True)
+    return rows[0], rows[1], counts
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_quantiles_within_accuracy(seed):
+    rng = np.random.default_rng(seed)
+    groups, values = random_latencies(rng, 10)
+    hist_groups, bins, counts = histograms(groups, values)
+    for quantile in LATENCY_QUANTILES + (0.0, 1.0):
+        estimates = histogram_quantiles(hist_groups, bins, counts, quantile)
+        exact = np.array([np.quantile(values[groups == group], quantile, method='inverted_cdf') for group in range(10)])
+        np.testing.assert_allclose(estimates, exact, rtol=LATENCY_ACCURACY, atol=0)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merged_histograms_match_whole(seed):
+    rng = np.random.default_rng(seed)
+    groups, values = random_latencies(rng, 8)
+    half = rng.random(len(values)) < 0.5
+    parts = [histograms(groups[mask], values[mask]) for mask in (half, ~half)]
+    # Merging adds the counts of equal (group, bin) rows
+    merged_groups = np.concatenate([part[0] for part in parts])
+    merged_bins = np.concatenate([part[1] for part in parts])
+    merged_counts = np.concatenate([part[2] for part in parts])
+    rows, inverse = np.unique(np.stack([merged_groups, merged_bins]), axis=1, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=merged_counts).astype(np.int64)
+    whole = histograms(groups, values)
+    np.testing.assert_array_equal(rows[0], whole[0])
+    np.testing.assert_array_equal(rows[1], whole[1])
+    np.testing.assert_array_equal(counts, whole[2])
+    for quantile in LATENCY_QUANTILES:
+        np.testing.assert_array_equal(
+            histogram_quantiles(rows[0], rows[1], counts, quantile),
+            histogram_quantiles(*whole, quantile),
+        )
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from event_frame import IdTable, encode_ids
+from metric_planner import run_planned_metrics
+from processor import UniqueUsersProcessor
+from sketches import LATENCY_ACCURACY
+from sql_backend import SQL_METRICS, LatencyMetric, compile_metrics_query, run_sql_metrics
+
+# The whole fixture, in UTC: its last events spill a little past the second IST day
+LOWER, UPPER = '2026-10-09 18:30:00', '2026-10-12 00:00:00'
+
+
+@pytest.fixture(scope='module')
+def pandas_frames(events):
+    ids = IdTable()
+    return run_planned_metrics(UniqueUsersProcessor(encode_ids(events, ids), pd.DataFrame(), ids), list(SQL_METRICS))
+
+
+@pytest.fixture(scope='module')
+def sql_frames(events_table):
+    _, source = events_table
+    return run_sql_metrics(source.query_frame, list(SQL_METRICS), LOWER, UPPER)
+
+
+@pytest.mark.parametrize('name', list(SQL_METRICS))
+def test_sql_backend_matches_pandas(pandas_frames, sql_frames, name):
+    spec = SQL_METRICS[name]
+    expected = pandas_frames[name].reset_index(drop=True)
+    assert len(expected)
+    if isinstance(spec, LatencyMetric) and spec.quantile is not None:
+        # DuckDB's quantile_disc is exact; the pandas percentiles come from log histograms
+        pd.testing.assert_frame_equal(sql_frames[name], expected, check_dtype=False, rtol=LATENCY_ACCURACY)
+    else:
+        pd.testing.assert_frame_equal(sql_frames[name], expected, check_dtype=False)
+
+
+def test_one_query_for_every_metric(events_table):
+    _, source = events_table
+    query = compile_metrics_query(list(SQL_METRICS), LOWER, UPPER)
+    assert query.count('UNION ALL') == len(SQL_METRICS) - 1
+    long_df = source.query_frame(query)
+    assert set(long_df['metric']) == set(SQL_METRICS)